@@ -1,11 +1,39 @@
 """
 Configuration — environment variables and lightweight Supabase client via httpx.
 No heavy SDK dependencies — just REST API calls.
+
+The client keeps one pooled keep-alive httpx.Client (optionally HTTP/2) for
+all REST and Storage traffic, so a gallery run reuses a handful of
+connections instead of paying a TCP+TLS handshake per call.
+AsyncSupabaseClient mirrors the same API for code running on an event loop.
+
+Large originals can be streamed straight to a local file
+(`storage_download_to_file`) instead of being buffered in memory; objects
+over STORAGE_RANGE_THRESHOLD_BYTES are fetched as parallel range requests.
+
+All requests go through a shared AIMD AdaptiveLimiter (app.storage.limiter)
+that finds the sustainable concurrency and retries idempotent failures.
+
+Downloads read through a content-addressed local disk cache
+(app.storage.object_cache), revalidated by ETag on every hit. Signed URLs are issued in
+batches and reused until shortly before they expire (app.storage.signed_urls).
+
+TABLE_BACKEND / OBJECT_BACKEND swap either half for a local implementation
+(app.storage.backends) — get_supabase() then returns a drop-in BackendClient.
 """
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
 import httpx
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from app.storage.limiter import AdaptiveLimiter
 
 
 class Settings(BaseSettings):
@@ -13,11 +41,56 @@ class Settings(BaseSettings):
     supabase_service_role_key: str = ""
     storage_bucket: str = "photos"
     max_concurrent_images: int = 4
+    pipeline_window_size: int = 8
+    image_cache_max_bytes: int = 128 * 1024 * 1024
+    image_cache_dir: str = ""
+    progress_flush_interval_ms: int = 1000
+    progress_flush_every: int = 25
+    db_write_batch_size: int = 200
+    db_write_concurrency: int = 8
+    job_queue_path: str = "data/job_queue.db"
+    job_workers: int = 4
+    job_max_attempts: int = 3
+    job_retry_backoff_s: float = 30.0
+    scheduler_slots: int = 2
+    scheduler_max_per_photographer: int = 1
+    interactive_slots: int = 2
+    interactive_yield_max_ms: int = 5000
     web_res_max_px: int = 2048
     thumb_max_px: int = 400
     jpeg_quality: int = 95
     web_quality: int = 92
     thumb_quality: int = 80
+    supabase_http2: bool = False
+    supabase_max_connections: int = 32
+    supabase_max_keepalive: int = 16
+    supabase_keepalive_expiry_s: float = 30.0
+    supabase_connect_timeout_s: float = 10.0
+    supabase_rest_timeout_s: float = 30.0
+    supabase_bulk_timeout_s: float = 60.0
+    supabase_download_timeout_s: float = 60.0
+    supabase_upload_timeout_s: float = 120.0
+    storage_stream_chunk_bytes: int = 1024 * 1024
+    storage_range_threshold_bytes: int = 32 * 1024 * 1024
+    storage_range_parts: int = 4
+    storage_upload_concurrency: int = 6
+    select_page_size: int = 500
+    storage_cache_dir: str = "data/object_cache"
+    storage_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    signed_url_margin_s: float = 300.0
+    signed_url_cache_size: int = 10000
+    preflight_head_bytes: int = 256 * 1024
+    preflight_concurrency: int = 16
+    supabase_concurrency_initial: int = 8
+    supabase_concurrency_min: int = 2
+    supabase_concurrency_max: int = 32
+    supabase_latency_tolerance: float = 2.0
+    supabase_retry_attempts: int = 4
+    supabase_retry_base_s: float = 0.25
+    table_backend: str = "supabase"
+    object_backend: str = "supabase"
+    local_object_dir: str = "data/objects"
+    memory_tables_seed: str = ""
 
     class Config:
         env_file = ".env"
@@ -28,8 +101,160 @@ def get_settings() -> Settings:
     return Settings()
 
 
-class SupabaseClient:
-    """Lightweight Supabase client using httpx — no SDK needed."""
+logger = logging.getLogger("apelier.config")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401 — installed via `httpx[http2]`
+        return True
+    except ImportError:
+        return False
+
+
+_FILTER_OPS = ("eq.", "neq.", "gt.", "gte.", "lt.", "lte.", "like.", "ilike.", "is.", "in.", "not.")
+
+
+def _filter_params(filters: dict | None) -> dict:
+    """PostgREST query params for `filters` — bare values become `eq.` filters."""
+    params = {}
+    for k, v in (filters or {}).items():
+        val = str(v).lower() if isinstance(v, bool) else str(v)
+        if not val.startswith(_FILTER_OPS):
+            val = f"eq.{val}"
+        params[k] = val
+    return params
+
+
+def _page_params(columns: str, filters: dict | None, key: str, after, page_size: int) -> dict:
+    """Params for one keyset page: rows with `key` > `after`, in `key` order."""
+    if columns.strip() != "*" and key not in (c.strip() for c in columns.split(",")):
+        columns = f"{columns},{key}"
+    params = {"select": columns, **_filter_params(filters), "order": f"{key}.asc", "limit": str(page_size)}
+    if after is not None:
+        params[key] = f"gt.{after}"
+    return params
+
+
+def _parse_count(r: httpx.Response) -> int:
+    """Total from a `Prefer: count=exact` response's Content-Range ("0-0/123" or "*/0")."""
+    total = r.headers.get("content-range", "").rpartition("/")[2]
+    if not total.isdigit():
+        raise ValueError(f"No exact count in response (Content-Range: {r.headers.get('content-range')!r})")
+    return int(total)
+
+
+def _pool_options() -> dict:
+    """Connection pool settings shared by the sync and async clients."""
+    s = get_settings()
+    http2 = s.supabase_http2
+    if http2 and not _http2_available():
+        logger.warning("SUPABASE_HTTP2 is set but the h2 package is missing — using HTTP/1.1")
+        http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=s.supabase_max_connections,
+            max_keepalive_connections=s.supabase_max_keepalive,
+            keepalive_expiry=s.supabase_keepalive_expiry_s,
+        ),
+        "timeout": httpx.Timeout(s.supabase_rest_timeout_s, connect=s.supabase_connect_timeout_s),
+    }
+
+
+def _size_kind(kind: str, size: int) -> str:
+    """Request kind bucketed by payload size, so latency baselines compare like with like."""
+    bucket = 64 * 1024
+    while bucket < size and bucket < 256 * 1024 * 1024:
+        bucket *= 4
+    return f"{kind}<={bucket // 1024}KB"
+
+
+def _response_size_kind(kind: str) -> Callable[[httpx.Response], str]:
+    """`_size_kind` by the response body's size, for downloads whose size isn't known up front."""
+    def kind_of(r: httpx.Response) -> str:
+        size = _total_size(r)
+        if size is None:
+            try:
+                size = len(r.content)
+            except httpx.ResponseNotRead:
+                size = 0
+        return _size_kind(kind, size)
+    return kind_of
+
+
+_limiter: Optional[AdaptiveLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AdaptiveLimiter:
+    """Process-wide adaptive limiter shared by every Supabase client."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            s = get_settings()
+            _limiter = AdaptiveLimiter(
+                initial=s.supabase_concurrency_initial,
+                min_limit=s.supabase_concurrency_min,
+                max_limit=s.supabase_concurrency_max,
+                latency_tolerance=s.supabase_latency_tolerance,
+                max_attempts=s.supabase_retry_attempts,
+                retry_base_s=s.supabase_retry_base_s,
+            )
+        return _limiter
+
+
+def _total_size(r: httpx.Response) -> Optional[int]:
+    """Full object size from a 206's Content-Range ("bytes 0-99/1234") or a 200's Content-Length."""
+    value = r.headers.get("content-range", "").rpartition("/")[2] if r.status_code == 206 else r.headers.get("content-length", "")
+    return int(value) if value.isdigit() else None
+
+
+def _object_cache():
+    """The shared disk cache for downloads (None when disabled)."""
+    from app.storage.object_cache import get_object_cache
+    return get_object_cache()
+
+
+def _signed_url_cache():
+    from app.storage.signed_urls import get_signed_url_cache
+    return get_signed_url_cache()
+
+
+# Paths per request to the multi-path sign endpoint
+_SIGN_BATCH_SIZE = 1000
+
+
+def _byte_ranges(size: int, parts: int) -> list[tuple[int, int]]:
+    """Split [0, size) into `parts` inclusive (start, end) byte ranges."""
+    step = -(-size // parts)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _range_plan(size: Optional[int]) -> Optional[list[tuple[int, int]]]:
+    """Byte ranges to fetch in parallel, or None to stream in one request."""
+    s = get_settings()
+    if not size or s.storage_range_parts < 2 or size < s.storage_range_threshold_bytes:
+        return None
+    return _byte_ranges(size, s.storage_range_parts)
+
+
+def _preallocate(dest: str, size: int):
+    with open(dest, "wb") as f:
+        f.truncate(size)
+
+
+def _content_length(r: Optional[httpx.Response]) -> Optional[int]:
+    if r is None or r.status_code != 200 or r.headers.get("accept-ranges", "").lower() != "bytes":
+        return None
+    try:
+        return int(r.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+class _SupabaseBase:
+    """Credentials, URLs and timeouts shared by the sync and async clients."""
 
     def __init__(self):
         s = get_settings()
@@ -41,6 +266,14 @@ class SupabaseClient:
             "Content-Type": "application/json",
             "Prefer": "return=representation",
         }
+        connect = s.supabase_connect_timeout_s
+        self._timeouts = {
+            "rest": httpx.Timeout(s.supabase_rest_timeout_s, connect=connect),
+            "bulk": httpx.Timeout(s.supabase_bulk_timeout_s, connect=connect),
+            "download": httpx.Timeout(s.supabase_download_timeout_s, connect=connect),
+            "upload": httpx.Timeout(s.supabase_upload_timeout_s, connect=connect),
+        }
+        self._limiter = get_limiter()
 
     def _rest_url(self, table: str) -> str:
         return f"{self.base_url}/rest/v1/{table}"
@@ -48,14 +281,38 @@ class SupabaseClient:
     def _storage_url(self, path: str = "") -> str:
         return f"{self.base_url}/storage/v1{path}"
 
+    def _storage_headers(self, **extra) -> dict:
+        return {"apikey": self.api_key, "Authorization": f"Bearer {self.api_key}", **extra}
+
+    def _sign_request(self, bucket: str, paths: list[str], expires_in: int) -> dict:
+        """Arguments for one POST to the multi-path sign endpoint."""
+        return {
+            "headers": self._storage_headers(**{"Content-Type": "application/json"}),
+            "json": {"expiresIn": expires_in, "paths": paths},
+            "timeout": self._timeouts["rest"],
+        }
+
+    def _signed_urls(self, r: httpx.Response, paths: list[str]) -> dict[str, Optional[str]]:
+        """{path: absolute signed URL or None} from a multi-path sign response."""
+        urls: dict[str, Optional[str]] = dict.fromkeys(paths)
+        if r.status_code != 200:
+            logger.warning(f"Signing {len(paths)} URL(s) failed: {r.status_code}")
+            return urls
+        for item in r.json():
+            signed = item.get("signedURL") or ""
+            if item.get("error") or not signed or item.get("path") not in urls:
+                continue
+            urls[item["path"]] = signed if signed.startswith("http") else self._storage_url("") + signed
+        return urls
+
     @staticmethod
     def _sanitize(obj):
         """Convert numpy types and other non-JSON-serializable values to native Python."""
         import numpy as np
         if isinstance(obj, dict):
-            return {k: SupabaseClient._sanitize(v) for k, v in obj.items()}
+            return {k: _SupabaseBase._sanitize(v) for k, v in obj.items()}
         if isinstance(obj, (list, tuple)):
-            return [SupabaseClient._sanitize(v) for v in obj]
+            return [_SupabaseBase._sanitize(v) for v in obj]
         if isinstance(obj, (np.integer,)):
             return int(obj)
         if isinstance(obj, (np.floating,)):
@@ -66,39 +323,105 @@ class SupabaseClient:
             return bool(obj)
         return obj
 
+    @staticmethod
+    def _update_args(data_or_id, data_or_filters: dict = None) -> tuple[dict, dict]:
+        """Normalise both `update()` calling conventions to (data, filters)."""
+        if isinstance(data_or_id, str):
+            # Convention 2: update(table, row_id, data)
+            return data_or_filters or {}, {"id": f"eq.{data_or_id}"}
+        # Convention 1: update(table, data, filters)
+        return data_or_id, data_or_filters or {}
+
+
+class SupabaseClient(_SupabaseBase):
+    """Lightweight Supabase client using httpx — no SDK needed."""
+
+    def __init__(self):
+        super().__init__()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
+
+    # ── Connection pool ──
+
+    @property
+    def _http(self) -> httpx.Client:
+        """Shared keep-alive client — created on first use, again after close()."""
+        client = self._http_client
+        if client is None:
+            with self._http_lock:
+                if self._http_client is None:
+                    self._http_client = self._new_http_client()
+                client = self._http_client
+        return client
+
+    @staticmethod
+    def _new_http_client() -> httpx.Client:
+        return httpx.Client(**_pool_options())
+
+    def _send(self, kind: str, method: Callable[..., httpx.Response], *args,
+              idempotent: bool = True, kind_of: Optional[Callable[[httpx.Response], str]] = None,
+              **kwargs) -> httpx.Response:
+        """Send through the adaptive limiter (retries idempotent failures)."""
+        return self._limiter.request(kind, lambda: method(*args, **kwargs), idempotent, kind_of)
+
+    def close(self):
+        """Close pooled connections. The client reconnects if used again."""
+        with self._http_lock:
+            client, self._http_client = self._http_client, None
+        if client is not None:
+            client.close()
+
     # ── Table Operations ──
 
     def select(self, table: str, columns: str = "*", filters: dict | None = None, order: str | None = None) -> list[dict]:
-        params = {"select": columns}
-        if filters:
-            for k, v in filters.items():
-                val = str(v).lower() if isinstance(v, bool) else str(v)
-                if not any(val.startswith(op) for op in ("eq.", "neq.", "gt.", "gte.", "lt.", "lte.", "like.", "ilike.", "is.", "in.", "not.")):
-                    val = f"eq.{val}"
-                params[k] = val
+        params = {"select": columns, **_filter_params(filters)}
         if order:
             params["order"] = order
-        r = httpx.get(self._rest_url(table), headers=self.headers, params=params, timeout=30)
+        r = self._send("rest", self._http.get, self._rest_url(table), headers=self.headers, params=params, timeout=self._timeouts["rest"])
         r.raise_for_status()
         return r.json()
 
     def select_single(self, table: str, columns: str = "*", filters: dict | None = None) -> Optional[dict]:
         headers = {**self.headers, "Accept": "application/vnd.pgrst.object+json"}
-        params = {"select": columns}
-        if filters:
-            for k, v in filters.items():
-                val = str(v).lower() if isinstance(v, bool) else str(v)
-                if not any(val.startswith(op) for op in ("eq.", "neq.", "gt.", "gte.", "lt.", "lte.", "like.", "ilike.", "is.", "in.", "not.")):
-                    val = f"eq.{val}"
-                params[k] = val
-        r = httpx.get(self._rest_url(table), headers=headers, params=params, timeout=30)
+        params = {"select": columns, **_filter_params(filters)}
+        r = self._send("rest", self._http.get, self._rest_url(table), headers=headers, params=params, timeout=self._timeouts["rest"])
         if r.status_code == 406:
             return None
         r.raise_for_status()
         return r.json()
 
+    def select_pages(self, table: str, columns: str = "*", filters: dict | None = None,
+                     page_size: Optional[int] = None, key: str = "id") -> Iterator[list[dict]]:
+        """Yield rows page by page in `key` order (keyset pagination — `key` must be unique).
+
+        The next page is fetched in the background while the caller works on
+        the current one. Memory stays at about two pages however big the table.
+        """
+        size = max(1, page_size or get_settings().select_page_size)
+
+        def fetch(after) -> list[dict]:
+            params = _page_params(columns, filters, key, after, size)
+            r = self._send("rest", self._http.get, self._rest_url(table), headers=self.headers, params=params, timeout=self._timeouts["rest"])
+            r.raise_for_status()
+            return r.json()
+
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            page = fetch(None)
+            while page:
+                following = ex.submit(fetch, page[-1][key]) if len(page) == size else None
+                yield page
+                page = following.result() if following else []
+
+    def count(self, table: str, filters: dict | None = None) -> int:
+        """Number of rows matching `filters`, without fetching them."""
+        headers = {**self.headers, "Prefer": "count=exact"}
+        params = {"select": "id", **_filter_params(filters), "limit": "0"}
+        r = self._send("rest", self._http.head, self._rest_url(table), headers=headers, params=params, timeout=self._timeouts["rest"])
+        r.raise_for_status()
+        return _parse_count(r)
+
     def insert(self, table: str, data: dict) -> Optional[dict]:
-        r = httpx.post(self._rest_url(table), headers=self.headers, json=data, timeout=30)
+        r = self._send("rest", self._http.post, self._rest_url(table), headers=self.headers, json=data, timeout=self._timeouts["rest"], idempotent=False)
         r.raise_for_status()
         rows = r.json()
         return rows[0] if rows else None
@@ -109,80 +432,518 @@ class SupabaseClient:
           1. update(table, data_dict, filters_dict)  — original style
           2. update(table, row_id_string, data_dict)  — convenience style (auto-creates id filter)
         """
-        if isinstance(data_or_id, str):
-            # Convention 2: update(table, row_id, data)
-            row_id = data_or_id
-            data = data_or_filters or {}
-            filters = {"id": f"eq.{row_id}"}
-        else:
-            # Convention 1: update(table, data, filters)
-            data = data_or_id
-            filters = data_or_filters or {}
-
-        params = {}
-        if filters:
-            params.update(filters)
+        data, params = self._update_args(data_or_id, data_or_filters)
         clean = self._sanitize(data)
-        r = httpx.patch(self._rest_url(table), headers=self.headers, json=clean, params=params, timeout=30)
+        r = self._send("rest", self._http.patch, self._rest_url(table), headers=self.headers, json=clean, params=params, timeout=self._timeouts["rest"])
         r.raise_for_status()
         rows = r.json()
         return rows[0] if rows else None
 
     def update_many(self, table: str, data: dict, in_filter: tuple[str, list[str]]) -> bool:
+        """Set the same fields on every row whose `col` is in `ids` — one PATCH."""
         col, ids = in_filter
+        headers = {**self.headers, "Prefer": "return=minimal"}
         params = {col: f"in.({','.join(ids)})"}
-        r = httpx.patch(self._rest_url(table), headers=self.headers, json=data, params=params, timeout=30)
+        clean = self._sanitize(data)
+        r = self._send("bulk", self._http.patch, self._rest_url(table), headers=headers, json=clean, params=params, timeout=self._timeouts["bulk"])
         r.raise_for_status()
         return True
 
+    def update_rows(self, table: str, rows: list[dict]) -> int:
+        """Give each row its own fields — one request via the `update_rows` function.
+
+        `rows` is `[{"id": ..., "fields": {...}}, ...]`. Columns missing from a
+        row's fields are left alone. Returns the number of rows updated.
+        """
+        r = self._send(
+            "bulk", self._http.post, f"{self.base_url}/rest/v1/rpc/update_rows",
+            headers=self.headers, json={"target_table": table, "rows": self._sanitize(rows)}, timeout=self._timeouts["bulk"],
+        )
+        r.raise_for_status()
+        return r.json() or 0
+
+    def rpc(self, function: str, params: dict | None = None) -> httpx.Response:
+        """Call a Postgres function via PostgREST. Returns the raw response."""
+        return self._send(
+            "rest", self._http.post, f"{self.base_url}/rest/v1/rpc/{function}",
+            headers=self.headers, json=self._sanitize(params or {}), timeout=self._timeouts["rest"], idempotent=False,
+        )
+
     # ── Storage Operations ──
 
     def storage_download(self, bucket: str, path: str) -> Optional[bytes]:
+        """Download an object, read through the local object cache."""
         url = self._storage_url(f"/object/{bucket}/{path}")
-        headers = {"apikey": self.api_key, "Authorization": f"Bearer {self.api_key}"}
-        r = httpx.get(url, headers=headers, timeout=60, follow_redirects=True)
+        cache = _object_cache()
+        entry = cache.lookup(bucket, path) if cache else None
+        validators = entry.validators() if entry is not None else {}
+        r = self._send("download", self._http.get, url, kind_of=_response_size_kind("download"), headers=self._storage_headers(**validators), timeout=self._timeouts["download"], follow_redirects=True)
+        if r.status_code == 304:
+            data = cache.read(entry)
+            if data is not None:
+                cache.revalidated(entry)
+                return data
+            r = self._send("download", self._http.get, url, kind_of=_response_size_kind("download"), headers=self._storage_headers(), timeout=self._timeouts["download"], follow_redirects=True)
         if r.status_code != 200:
             return None
+        if cache is not None:
+            cache.store(bucket, path, r.content, r.headers)
         return r.content
 
+    def storage_download_to_file(self, bucket: str, path: str, dest: str) -> bool:
+        """Stream an object to the local file `dest` without holding it in memory.
+
+        Large objects are fetched as parallel range requests, falling back to
+        a single stream if the server doesn't honour ranges. Served from the
+        local object cache when the cached copy's ETag still matches.
+        """
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        cache = _object_cache()
+        entry = cache.lookup(bucket, path) if cache else None
+        head = self._head(url)
+        if entry is not None and head is not None and entry.matches(head.headers) and cache.copy_to(entry, dest):
+            cache.revalidated(entry)
+            return True
+        if not self._download_object(url, dest, _range_plan(_content_length(head)), path):
+            return False
+        if cache is not None and head is not None:
+            cache.store_file(bucket, path, dest, head.headers)
+        return True
+
+    def _download_object(self, url: str, dest: str, ranges: Optional[list[tuple[int, int]]], path: str) -> bool:
+        if ranges:
+            _preallocate(dest, ranges[-1][1] + 1)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as ex:
+                if all(ex.map(lambda rng: self._try_range(url, dest, *rng), ranges)):
+                    return True
+            logger.warning(f"Range download failed for {path} — retrying as a single stream")
+        return self._download_range(url, dest)
+
+    def _try_range(self, url: str, dest: str, start: int, end: int) -> bool:
+        """One range of a parallel download — a failure (even after retries) just means fall back."""
+        try:
+            return self._download_range(url, dest, start, end)
+        except httpx.HTTPError as e:
+            logger.warning(f"Range {start}-{end} failed: {e}")
+            return False
+
+    def _head(self, url: str) -> Optional[httpx.Response]:
+        """HEAD an object (size, range support, ETag) — None if the request fails."""
+        try:
+            return self._send("rest", self._http.head, url, headers=self._storage_headers(), timeout=self._timeouts["rest"], follow_redirects=True)
+        except httpx.HTTPError:
+            return None
+
+    def storage_read_head(self, bucket: str, path: str, length: int) -> Optional[tuple[bytes, Optional[int]]]:
+        """The first `length` bytes of an object and its total size, from one range request.
+
+        If the server ignores the range, the body is cut off after `length` bytes.
+        """
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        headers = self._storage_headers(Range=f"bytes=0-{length - 1}")
+        head = bytearray()
+
+        def read() -> httpx.Response:
+            head.clear()
+            with self._http.stream("GET", url, headers=headers, timeout=self._timeouts["download"], follow_redirects=True) as r:
+                if r.status_code in (200, 206):
+                    for data in r.iter_bytes():
+                        head.extend(data)
+                        if len(head) >= length:
+                            break
+            return r
+
+        r = self._limiter.request(_size_kind("download", length), read)
+        if r.status_code not in (200, 206):
+            return None
+        return bytes(head[:length]), _total_size(r)
+
+    def _download_range(self, url: str, dest: str, start: Optional[int] = None, end: Optional[int] = None) -> bool:
+        """Stream bytes [start, end] (or the whole object) into `dest` at offset `start`."""
+        headers = self._storage_headers()
+        ranged = start is not None
+        if ranged:
+            headers["Range"] = f"bytes={start}-{end}"
+        expected = 206 if ranged else 200
+        chunk = get_settings().storage_stream_chunk_bytes
+
+        def stream() -> httpx.Response:
+            with self._http.stream("GET", url, headers=headers, timeout=self._timeouts["download"], follow_redirects=True) as r:
+                if r.status_code == expected:
+                    with open(dest, "r+b" if ranged else "wb") as f:
+                        f.seek(start or 0)
+                        written = 0
+                        for data in r.iter_bytes(chunk):
+                            f.write(data)
+                            written += len(data)
+                    if ranged and written != end - start + 1:
+                        raise httpx.ReadError(f"Short range read: {written} of {end - start + 1} bytes")
+            return r
+
+        if ranged:
+            return self._limiter.request(_size_kind("download", end - start + 1), stream).status_code == expected
+        return self._limiter.request("download", stream, kind_of=_response_size_kind("download")).status_code == expected
+
     def storage_upload(self, bucket: str, path: str, data: bytes, content_type: str = "image/jpeg") -> bool:
         url = self._storage_url(f"/object/{bucket}/{path}")
-        headers = {
-            "apikey": self.api_key,
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": content_type,
-            "x-upsert": "true",
-        }
-        r = httpx.put(url, headers=headers, content=data, timeout=120)
+        cache = _object_cache()
+        if cache is not None:
+            cache.invalidate(bucket, path)
+        _signed_url_cache().invalidate(bucket, path)
+        headers = self._storage_headers(**{"Content-Type": content_type, "x-upsert": "true"})
+        r = self._send(_size_kind("upload", len(data)), self._http.put, url, headers=headers, content=data, timeout=self._timeouts["upload"])
         return r.status_code in (200, 201)
 
+    def storage_upload_many(self, bucket: str, items: list[tuple[str, bytes, str]],
+                            concurrency: Optional[int] = None) -> dict[str, bool]:
+        """Upload (key, data, content_type) items concurrently. Returns {key: ok}."""
+        if not items:
+            return {}
+        workers = min(len(items), max(1, concurrency or get_settings().storage_upload_concurrency))
+
+        def upload(item: tuple[str, bytes, str]) -> bool:
+            key, data, content_type = item
+            try:
+                return self.storage_upload(bucket, key, data, content_type)
+            except httpx.HTTPError as e:
+                logger.warning(f"Upload failed for {key}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return dict(zip((key for key, _, _ in items), ex.map(upload, items)))
+
     def storage_signed_url(self, bucket: str, path: str, expires_in: int = 3600) -> Optional[str]:
-        url = self._storage_url(f"/object/sign/{bucket}/{path}")
-        headers = {
-            "apikey": self.api_key,
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        r = httpx.post(url, headers=headers, json={"expiresIn": expires_in}, timeout=30)
-        if r.status_code == 200:
-            data = r.json()
-            signed = data.get("signedURL", "")
-            if signed and not signed.startswith("http"):
-                signed = self._storage_url("") + signed
-            return signed
-        return None
+        return self.storage_signed_urls(bucket, [path], expires_in)[path]
+
+    def storage_signed_urls(self, bucket: str, paths: list[str], expires_in: int = 3600) -> dict[str, Optional[str]]:
+        """Signed URLs for many objects: {path: url or None}.
+
+        Still-valid URLs come from the in-process cache; the rest are signed
+        in one request per _SIGN_BATCH_SIZE paths.
+        """
+        cache = _signed_url_cache()
+        urls = cache.get_many(bucket, paths, expires_in)
+        missing = [p for p in dict.fromkeys(paths) if p not in urls]
+        url = self._storage_url(f"/object/sign/{bucket}")
+        for start in range(0, len(missing), _SIGN_BATCH_SIZE):
+            batch = missing[start:start + _SIGN_BATCH_SIZE]
+            signed_at = time.time()
+            r = self._send("rest", self._http.post, url, **self._sign_request(bucket, batch, expires_in))
+            signed = self._signed_urls(r, batch)
+            cache.put_many(bucket, signed, expires_in, signed_at)
+            urls.update(signed)
+        return {p: urls.get(p) for p in paths}
+
+
+class AsyncSupabaseClient(_SupabaseBase):
+    """asyncio mirror of SupabaseClient on httpx.AsyncClient.
+
+    An AsyncClient is bound to the event loop it was first used on, so use
+    get_async_supabase() — it hands out one instance per running loop (the
+    API server's loop, and each pipeline worker's own loop).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._http = httpx.AsyncClient(**_pool_options())
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _send(self, kind: str, method: Callable[..., Awaitable[httpx.Response]], *args,
+                    idempotent: bool = True, kind_of: Optional[Callable[[httpx.Response], str]] = None,
+                    **kwargs) -> httpx.Response:
+        return await self._limiter.request_async(kind, lambda: method(*args, **kwargs), idempotent, kind_of)
+
+    # ── Table Operations ──
+
+    async def select(self, table: str, columns: str = "*", filters: dict | None = None, order: str | None = None) -> list[dict]:
+        params = {"select": columns, **_filter_params(filters)}
+        if order:
+            params["order"] = order
+        r = await self._send("rest", self._http.get, self._rest_url(table), headers=self.headers, params=params, timeout=self._timeouts["rest"])
+        r.raise_for_status()
+        return r.json()
+
+    async def select_single(self, table: str, columns: str = "*", filters: dict | None = None) -> Optional[dict]:
+        headers = {**self.headers, "Accept": "application/vnd.pgrst.object+json"}
+        params = {"select": columns, **_filter_params(filters)}
+        r = await self._send("rest", self._http.get, self._rest_url(table), headers=headers, params=params, timeout=self._timeouts["rest"])
+        if r.status_code == 406:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    async def select_pages(self, table: str, columns: str = "*", filters: dict | None = None,
+                           page_size: Optional[int] = None, key: str = "id") -> AsyncIterator[list[dict]]:
+        """Async twin of SupabaseClient.select_pages — prefetches the next page as a task."""
+        size = max(1, page_size or get_settings().select_page_size)
+
+        async def fetch(after) -> list[dict]:
+            params = _page_params(columns, filters, key, after, size)
+            r = await self._send("rest", self._http.get, self._rest_url(table), headers=self.headers, params=params, timeout=self._timeouts["rest"])
+            r.raise_for_status()
+            return r.json()
+
+        page = await fetch(None)
+        while page:
+            following = asyncio.ensure_future(fetch(page[-1][key])) if len(page) == size else None
+            try:
+                yield page
+            except BaseException:
+                if following:
+                    following.cancel()
+                raise
+            page = await following if following else []
+
+    async def count(self, table: str, filters: dict | None = None) -> int:
+        headers = {**self.headers, "Prefer": "count=exact"}
+        params = {"select": "id", **_filter_params(filters), "limit": "0"}
+        r = await self._send("rest", self._http.head, self._rest_url(table), headers=headers, params=params, timeout=self._timeouts["rest"])
+        r.raise_for_status()
+        return _parse_count(r)
+
+    async def insert(self, table: str, data: dict) -> Optional[dict]:
+        r = await self._send("rest", self._http.post, self._rest_url(table), headers=self.headers, json=data, timeout=self._timeouts["rest"], idempotent=False)
+        r.raise_for_status()
+        rows = r.json()
+        return rows[0] if rows else None
+
+    async def update(self, table: str, data_or_id, data_or_filters: dict = None) -> Optional[dict]:
+        """Update rows — same two calling conventions as SupabaseClient.update."""
+        data, params = self._update_args(data_or_id, data_or_filters)
+        clean = self._sanitize(data)
+        r = await self._send("rest", self._http.patch, self._rest_url(table), headers=self.headers, json=clean, params=params, timeout=self._timeouts["rest"])
+        r.raise_for_status()
+        rows = r.json()
+        return rows[0] if rows else None
+
+    async def update_many(self, table: str, data: dict, in_filter: tuple[str, list[str]]) -> bool:
+        col, ids = in_filter
+        headers = {**self.headers, "Prefer": "return=minimal"}
+        params = {col: f"in.({','.join(ids)})"}
+        clean = self._sanitize(data)
+        r = await self._send("bulk", self._http.patch, self._rest_url(table), headers=headers, json=clean, params=params, timeout=self._timeouts["bulk"])
+        r.raise_for_status()
+        return True
+
+    async def update_rows(self, table: str, rows: list[dict]) -> int:
+        r = await self._send(
+            "bulk", self._http.post, f"{self.base_url}/rest/v1/rpc/update_rows",
+            headers=self.headers, json={"target_table": table, "rows": self._sanitize(rows)}, timeout=self._timeouts["bulk"],
+        )
+        r.raise_for_status()
+        return r.json() or 0
+
+    async def rpc(self, function: str, params: dict | None = None) -> httpx.Response:
+        return await self._send(
+            "rest", self._http.post, f"{self.base_url}/rest/v1/rpc/{function}",
+            headers=self.headers, json=self._sanitize(params or {}), timeout=self._timeouts["rest"], idempotent=False,
+        )
+
+    # ── Storage Operations ──
+
+    async def storage_download(self, bucket: str, path: str) -> Optional[bytes]:
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        cache = _object_cache()
+        entry = await asyncio.to_thread(cache.lookup, bucket, path) if cache else None
+        validators = entry.validators() if entry is not None else {}
+        r = await self._send("download", self._http.get, url, kind_of=_response_size_kind("download"), headers=self._storage_headers(**validators), timeout=self._timeouts["download"], follow_redirects=True)
+        if r.status_code == 304:
+            data = await asyncio.to_thread(cache.read, entry)
+            if data is not None:
+                await asyncio.to_thread(cache.revalidated, entry)
+                return data
+            r = await self._send("download", self._http.get, url, kind_of=_response_size_kind("download"), headers=self._storage_headers(), timeout=self._timeouts["download"], follow_redirects=True)
+        if r.status_code != 200:
+            return None
+        if cache is not None:
+            await asyncio.to_thread(cache.store, bucket, path, r.content, r.headers)
+        return r.content
+
+    async def storage_download_to_file(self, bucket: str, path: str, dest: str) -> bool:
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        cache = _object_cache()
+        entry = await asyncio.to_thread(cache.lookup, bucket, path) if cache else None
+        head = await self._head(url)
+        if (entry is not None and head is not None and entry.matches(head.headers)
+                and await asyncio.to_thread(cache.copy_to, entry, dest)):
+            await asyncio.to_thread(cache.revalidated, entry)
+            return True
+        if not await self._download_object(url, dest, _range_plan(_content_length(head)), path):
+            return False
+        if cache is not None and head is not None:
+            await asyncio.to_thread(cache.store_file, bucket, path, dest, head.headers)
+        return True
+
+    async def _download_object(self, url: str, dest: str, ranges: Optional[list[tuple[int, int]]], path: str) -> bool:
+        if ranges:
+            _preallocate(dest, ranges[-1][1] + 1)
+            results = await asyncio.gather(*(self._try_range(url, dest, *rng) for rng in ranges))
+            if all(results):
+                return True
+            logger.warning(f"Range download failed for {path} — retrying as a single stream")
+        return await self._download_range(url, dest)
+
+    async def _try_range(self, url: str, dest: str, start: int, end: int) -> bool:
+        try:
+            return await self._download_range(url, dest, start, end)
+        except httpx.HTTPError as e:
+            logger.warning(f"Range {start}-{end} failed: {e}")
+            return False
+
+    async def _head(self, url: str) -> Optional[httpx.Response]:
+        try:
+            return await self._send("rest", self._http.head, url, headers=self._storage_headers(), timeout=self._timeouts["rest"], follow_redirects=True)
+        except httpx.HTTPError:
+            return None
+
+    async def storage_read_head(self, bucket: str, path: str, length: int) -> Optional[tuple[bytes, Optional[int]]]:
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        headers = self._storage_headers(Range=f"bytes=0-{length - 1}")
+        head = bytearray()
+
+        async def read() -> httpx.Response:
+            head.clear()
+            async with self._http.stream("GET", url, headers=headers, timeout=self._timeouts["download"], follow_redirects=True) as r:
+                if r.status_code in (200, 206):
+                    async for data in r.aiter_bytes():
+                        head.extend(data)
+                        if len(head) >= length:
+                            break
+            return r
+
+        r = await self._limiter.request_async(_size_kind("download", length), read)
+        if r.status_code not in (200, 206):
+            return None
+        return bytes(head[:length]), _total_size(r)
+
+    async def _download_range(self, url: str, dest: str, start: Optional[int] = None, end: Optional[int] = None) -> bool:
+        headers = self._storage_headers()
+        ranged = start is not None
+        if ranged:
+            headers["Range"] = f"bytes={start}-{end}"
+        expected = 206 if ranged else 200
+        chunk = get_settings().storage_stream_chunk_bytes
+
+        async def stream() -> httpx.Response:
+            async with self._http.stream("GET", url, headers=headers, timeout=self._timeouts["download"], follow_redirects=True) as r:
+                if r.status_code == expected:
+                    with open(dest, "r+b" if ranged else "wb") as f:
+                        f.seek(start or 0)
+                        written = 0
+                        async for data in r.aiter_bytes(chunk):
+                            f.write(data)
+                            written += len(data)
+                    if ranged and written != end - start + 1:
+                        raise httpx.ReadError(f"Short range read: {written} of {end - start + 1} bytes")
+            return r
+
+        if ranged:
+            return (await self._limiter.request_async(_size_kind("download", end - start + 1), stream)).status_code == expected
+        r = await self._limiter.request_async("download", stream, kind_of=_response_size_kind("download"))
+        return r.status_code == expected
+
+    async def storage_upload(self, bucket: str, path: str, data: bytes, content_type: str = "image/jpeg") -> bool:
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        cache = _object_cache()
+        if cache is not None:
+            await asyncio.to_thread(cache.invalidate, bucket, path)
+        _signed_url_cache().invalidate(bucket, path)
+        headers = self._storage_headers(**{"Content-Type": content_type, "x-upsert": "true"})
+        r = await self._send(_size_kind("upload", len(data)), self._http.put, url, headers=headers, content=data, timeout=self._timeouts["upload"])
+        return r.status_code in (200, 201)
+
+    async def storage_upload_many(self, bucket: str, items: list[tuple[str, bytes, str]],
+                                  concurrency: Optional[int] = None,
+                                  semaphore: Optional[asyncio.Semaphore] = None) -> dict[str, bool]:
+        """Upload (key, data, content_type) items concurrently. Returns {key: ok}.
+
+        Pass a shared `semaphore` to bound uploads across several calls.
+        """
+        if not items:
+            return {}
+        slots = semaphore or asyncio.Semaphore(max(1, concurrency or get_settings().storage_upload_concurrency))
+
+        async def upload(key: str, data: bytes, content_type: str) -> bool:
+            async with slots:
+                try:
+                    return await self.storage_upload(bucket, key, data, content_type)
+                except httpx.HTTPError as e:
+                    logger.warning(f"Upload failed for {key}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(upload(*item) for item in items))
+        return dict(zip((key for key, _, _ in items), results))
+
+    async def storage_signed_url(self, bucket: str, path: str, expires_in: int = 3600) -> Optional[str]:
+        return (await self.storage_signed_urls(bucket, [path], expires_in))[path]
+
+    async def storage_signed_urls(self, bucket: str, paths: list[str], expires_in: int = 3600) -> dict[str, Optional[str]]:
+        cache = _signed_url_cache()
+        urls = cache.get_many(bucket, paths, expires_in)
+        missing = [p for p in dict.fromkeys(paths) if p not in urls]
+        url = self._storage_url(f"/object/sign/{bucket}")
+        for start in range(0, len(missing), _SIGN_BATCH_SIZE):
+            batch = missing[start:start + _SIGN_BATCH_SIZE]
+            signed_at = time.time()
+            r = await self._send("rest", self._http.post, url, **self._sign_request(bucket, batch, expires_in))
+            signed = self._signed_urls(r, batch)
+            cache.put_many(bucket, signed, expires_in, signed_at)
+            urls.update(signed)
+        return {p: urls.get(p) for p in paths}
+
+
+def _local_backends() -> bool:
+    s = get_settings()
+    return s.table_backend != "supabase" or s.object_backend != "supabase"
 
 
 _client: Optional[SupabaseClient] = None
 
 
 def get_supabase() -> SupabaseClient:
+    """The shared client — a BackendClient with the same API if TABLE_BACKEND/OBJECT_BACKEND are local."""
     global _client
     if _client is None:
-        _client = SupabaseClient()
+        if _local_backends():
+            from app.storage.backends import create_client
+            _client = create_client()
+        else:
+            _client = SupabaseClient()
     return _client
 
 
+def close_supabase():
+    """Release the shared client's pooled connections (called on app shutdown)."""
+    if _client is not None:
+        _client.close()
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSupabaseClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_supabase() -> AsyncSupabaseClient:
+    """The AsyncSupabaseClient for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        if _local_backends():
+            from app.storage.backends import AsyncBackendClient
+            client = AsyncBackendClient()
+        else:
+            client = AsyncSupabaseClient()
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_supabase():
+    """Close the running loop's async client — call before the loop ends."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
 # ── Lazy module-level aliases ──
 # Allow `from app.config import settings, supabase` to work everywhere.
 # These are lazy so the module can be imported without env vars being set yet.
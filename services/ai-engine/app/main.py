@@ -88,8 +88,17 @@ async def restyle_photo(body: dict):
 @app.on_event("startup")
 async def startup():
     print("Apelier AI Engine starting...")
+    from app.workers.job_queue import get_job_queue
+    get_job_queue().start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     print("Apelier AI Engine shutting down...")
+    from app.workers.job_queue import get_job_queue
+    get_job_queue().stop()
+    from app.pipeline.orchestrator import shutdown_analysis_pool
+    shutdown_analysis_pool()
+    from app.config import close_async_supabase, close_supabase
+    close_supabase()
+    await close_async_supabase()
@@ -88,24 +88,43 @@ def download_from_supabase(url: str, service_key: str, bucket: str, path: str) -
     return resp.content
 
 
-def open_image_bytes(img_bytes: bytes) -> "Image.Image":
-    """Open image bytes as PIL RGB Image, with rawpy fallback for DNG/RAW files."""
+# Same detection rules as app/pipeline/decoder.py — this file is deployed
+# on its own, so it can't import the engine package
+RAW_EXTENSIONS = {
+    '.dng', '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2',
+    '.orf', '.rw2', '.pef', '.raf', '.raw', '.3fr', '.mef', '.mrw',
+    '.x3f', '.srw', '.erf', '.kdc', '.dcr', '.rwl', '.iiq',
+}
+
+
+def is_raw_image(img_bytes: bytes, filename: str = "") -> bool:
+    """Camera RAW by magic bytes; TIFF-based RAWs (DNG, NEF, ARW...) by extension."""
+    import os
+    head = img_bytes[:16]
+    if (head.startswith(b"FUJIFILMCCD-RAW") or head[:4] in (b"IIRO", b"IIRS", b"MMOR", b"IIU\x00", b"FOVb")
+            or (head[4:8] == b"ftyp" and head[8:12] == b"crx ")):
+        return True
+    if head[:4] in (b"II*\x00", b"MM\x00*") and head[8:10] == b"CR":
+        return True
+    return os.path.splitext(filename.lower())[1] in RAW_EXTENSIONS
+
+
+def open_image_bytes(img_bytes: bytes, filename: str = "") -> "Image.Image":
+    """Open image bytes as PIL RGB Image — camera RAWs are developed with rawpy, in memory.
+
+    RAWs are detected up front: PIL would otherwise open a TIFF-based RAW as
+    its small IFD0 thumbnail. Anything PIL can't read also goes to rawpy.
+    """
     from PIL import Image
-    try:
-        return Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    except Exception:
-        pass
-    # Fallback: rawpy for camera RAW formats
-    import rawpy, tempfile, os
-    with tempfile.NamedTemporaryFile(suffix='.dng', delete=False) as f:
-        f.write(img_bytes)
-        tmp_path = f.name
-    try:
-        with rawpy.imread(tmp_path) as raw:
-            rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8)
-            return Image.fromarray(rgb)
-    finally:
-        os.unlink(tmp_path)
+    if not is_raw_image(img_bytes, filename):
+        try:
+            return Image.open(io.BytesIO(img_bytes)).convert("RGB")
+        except Exception:
+            pass
+    import rawpy
+    with rawpy.imread(io.BytesIO(img_bytes)) as raw:
+        rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8)
+        return Image.fromarray(rgb)
 
 
 def upload_to_supabase(url: str, service_key: str, bucket: str, path: str, data: bytes, content_type: str = "image/jpeg"):
@@ -475,7 +494,7 @@ def apply_style(body: dict):
 
     # Download image
     img_bytes = download_from_supabase(supabase_url, supabase_key, bucket, image_key)
-    img = open_image_bytes(img_bytes)
+    img = open_image_bytes(img_bytes, image_key)
     orig_size = img.size  # (W, H)
 
     # Generate LUT from downsampled input
@@ -574,7 +593,7 @@ def apply_style_batch(body: dict):
     for i, item in enumerate(images_list):
         try:
             img_bytes = download_from_supabase(supabase_url, supabase_key, bucket, item["image_key"])
-            img = open_image_bytes(img_bytes)
+            img = open_image_bytes(img_bytes, item["image_key"])
             orig_size = img.size
 
             # Generate LUT
@@ -656,7 +675,7 @@ def face_retouch(body: dict):
 
     # Download image
     img_bytes = download_from_supabase(supabase_url, supabase_key, bucket, image_key)
-    img = np.array(open_image_bytes(img_bytes))
+    img = np.array(open_image_bytes(img_bytes, image_key))
     img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
 
     # Download CodeFormer weights if not cached
@@ -795,7 +814,7 @@ def scene_cleanup(body: dict):
 
     # Download image
     img_bytes = download_from_supabase(supabase_url, supabase_key, bucket, image_key)
-    img = np.array(open_image_bytes(img_bytes))
+    img = np.array(open_image_bytes(img_bytes, image_key))
 
     # Generate inpainting mask using detection heuristics
     mask = np.zeros(img.shape[:2], dtype=np.uint8)
@@ -0,0 +1,82 @@
+"""
+Cooperative cancellation for running pipelines.
+
+Each queued job that starts running gets a CancelToken, keyed by its job
+queue id. `cancel()` sets the token; the pipeline checks it between photos
+and between Modal batches and stops by raising PipelineCancelled.
+
+Only registered tokens can be cancelled. A job cancelled between being
+claimed and registering its token is recorded by the job queue instead
+(status 'canceling'); the handler checks for that right after registering,
+so the pipeline still stops at its first checkpoint.
+"""
+import threading
+from typing import Optional
+
+CANCELED = "canceled"
+PREEMPTED = "preempted"
+
+
+class PipelineCancelled(Exception):
+    """Raised at a cancellation checkpoint once the job's token is set."""
+
+    def __init__(self, reason: str = CANCELED):
+        super().__init__(f"Pipeline {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """Thread-safe cancellation flag for one job."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def event(self) -> threading.Event:
+        return self._event
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def preempted(self) -> bool:
+        return self.reason == PREEMPTED
+
+    def cancel(self, reason: str = CANCELED):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise PipelineCancelled(self.reason or CANCELED)
+
+
+_tokens: dict[str, CancelToken] = {}
+_lock = threading.Lock()
+
+
+def register(key: str) -> CancelToken:
+    """Create the token for a job that is starting."""
+    with _lock:
+        return _tokens.setdefault(key, CancelToken())
+
+
+def unregister(key: str):
+    with _lock:
+        _tokens.pop(key, None)
+
+
+def cancel(key: str, reason: str = CANCELED) -> bool:
+    """Signal the job with this key to stop at its next checkpoint.
+
+    Returns False if no running job has registered the key.
+    """
+    with _lock:
+        token = _tokens.get(key)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
@@ -0,0 +1,77 @@
+"""
+Pipeline checkpoints — per-photo phase completion, stored in photos.ai_edits.
+
+Each photo carries `ai_edits.checkpoint`:
+    {
+        "phases": int,              # bitmap — bit i set when PHASES[i] is done
+        "fingerprint": str,         # hash of the photo's declared input (key + size)
+        "style_profile_id": str,    # style the style/later phases were run with
+    }
+
+A restarted or re-queued run loads the checkpoint and resumes each photo
+from its first incomplete phase, redoing every phase after it. A photo is
+finished only when all phases are done — one whose analysis failed is
+picked up again even if it went on to get outputs. If the input changed,
+everything is invalidated; if only the style profile changed, analysis is
+kept and the style phase onwards is redone.
+"""
+import hashlib
+from typing import Optional
+
+PHASES = ["analysis", "style", "retouch", "cleanup", "composition", "output"]
+
+_BITS = {phase: 1 << i for i, phase in enumerate(PHASES)}
+# Phases whose results depend on the style profile
+_STYLE_DEPENDENT = sum(_BITS[p] for p in PHASES[PHASES.index("style"):])
+
+
+def input_fingerprint(photo: dict) -> str:
+    """Hash of the photo's declared input — changes if the original is replaced."""
+    raw = f"{photo.get('original_key', '')}|{photo.get('file_size') or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class Checkpoint:
+    """Phase completion bitmap for one photo."""
+
+    def __init__(self, fingerprint: str, style_profile_id: Optional[str] = None, phases: int = 0):
+        self.fingerprint = fingerprint
+        self.style_profile_id = style_profile_id
+        self.phases = phases
+
+    @classmethod
+    def from_photo(cls, photo: dict, style_profile_id: Optional[str] = None) -> "Checkpoint":
+        """Load the stored checkpoint, dropping whatever no longer matches this run."""
+        fingerprint = input_fingerprint(photo)
+        stored = (photo.get("ai_edits") or {}).get("checkpoint") or {}
+        if stored.get("fingerprint") != fingerprint:
+            return cls(fingerprint, style_profile_id)
+
+        phases = int(stored.get("phases") or 0)
+        if stored.get("style_profile_id") != style_profile_id:
+            phases &= ~_STYLE_DEPENDENT
+        return cls(fingerprint, style_profile_id, phases)
+
+    def is_done(self, phase: str) -> bool:
+        return bool(self.phases & _BITS[phase])
+
+    def mark(self, phase: str):
+        self.phases |= _BITS[phase]
+
+    @property
+    def first_incomplete(self) -> Optional[str]:
+        for phase in PHASES:
+            if not self.is_done(phase):
+                return phase
+        return None
+
+    def resume_from(self, phase: str):
+        """Clear `phase` and every later phase so they all run again."""
+        self.phases &= _BITS[phase] - 1
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": self.phases,
+            "fingerprint": self.fingerprint,
+            "style_profile_id": self.style_profile_id,
+        }
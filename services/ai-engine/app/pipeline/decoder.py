@@ -0,0 +1,401 @@
+"""
+Image decoder — the one place original files (bytes or a local path) become pixels.
+
+  - the format is detected from magic bytes; the filename only settles
+    TIFF-based RAWs (DNG, NEF, ARW...), whose header is plain TIFF
+  - everything decodes in memory — RAW bytes go to rawpy as a BytesIO,
+    streamed RAWs are read from their local path
+  - an ImageHandle decodes lazily and caches what it produced — the full
+    resolution array and every downscale — so a photo is decoded once no
+    matter how many sizes its consumers ask for
+  - when nothing large enough is cached, smaller sizes are decoded directly:
+    JPEGs at a reduced DCT scale, RAWs from their embedded preview or a
+    half-size demosaic; the full AHD demosaic only runs for full resolution
+"""
+import io
+import logging
+import os
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+# RAW file extensions supported by rawpy/libraw
+RAW_EXTENSIONS = {
+    '.dng', '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2',
+    '.orf', '.rw2', '.pef', '.raf', '.raw', '.3fr', '.mef', '.mrw',
+    '.x3f', '.srw', '.erf', '.kdc', '.dcr', '.rwl', '.iiq',
+}
+
+
+def is_raw_file(filename: str) -> bool:
+    """Check if a filename has a RAW extension."""
+    ext = os.path.splitext(filename.lower())[1]
+    return ext in RAW_EXTENSIONS
+
+
+def _open_raw(image: Union[bytes, str]):
+    """rawpy handle for RAW bytes (read from memory) or a local path."""
+    import rawpy
+    return rawpy.imread(image if isinstance(image, str) else io.BytesIO(image))
+
+
+def decode_raw(image: Union[bytes, str]) -> Optional[np.ndarray]:
+    """
+    Decode a RAW image file to full-resolution BGR numpy array using rawpy.
+
+    Full AHD demosaicing takes seconds — only use this where full
+    resolution is rendered; `decode_raw_preview` covers everything else.
+    `image` is either the file bytes or a local path. Returns None if
+    decoding fails.
+    """
+    try:
+        import rawpy
+
+        with _open_raw(image) as raw:
+            # Process with reasonable defaults for photography
+            rgb = raw.postprocess(
+                use_camera_wb=True,       # Use camera white balance
+                half_size=False,           # Full resolution
+                no_auto_bright=False,      # Auto brightness
+                output_bps=8,              # 8-bit output
+                bright=1.0,                # Normal brightness
+                demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD,
+            )
+            # Convert RGB to BGR for OpenCV
+            bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+            log.info(f"RAW decoded: {bgr.shape[1]}x{bgr.shape[0]}")
+            return bgr
+
+    except ImportError:
+        log.error("rawpy not installed — cannot decode RAW files")
+        return None
+    except Exception as e:
+        log.error(f"RAW decode failed: {e}")
+        return None
+
+
+# LibRaw `sizes.flip` → the rotation postprocess() applies
+_RAW_FLIP_ROTATIONS = {
+    3: cv2.ROTATE_180,
+    5: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    6: cv2.ROTATE_90_CLOCKWISE,
+}
+# An embedded preview whose aspect ratio is further off than this from the
+# sensor's is a crop (e.g. 16:9) or letterboxed, not the whole frame
+_PREVIEW_ASPECT_TOLERANCE = 0.03
+
+
+def decode_raw_preview(image: Union[bytes, str], min_dimension: int) -> Optional[tuple[np.ndarray, int, int]]:
+    """
+    Fast RAW decode for work that doesn't need full resolution (analysis,
+    web previews), trying in order:
+      1. the embedded JPEG preview, if its long side covers `min_dimension`
+         — most cameras store a full-size one, decoded in milliseconds
+      2. a half-size demosaic (each 2x2 Bayer block becomes one pixel)
+
+    Returns (BGR image, full width, full height) with the camera orientation
+    applied, or None if the file can't be read as a RAW.
+    """
+    try:
+        import rawpy
+
+        with _open_raw(image) as raw:
+            sizes = raw.sizes
+            full_w, full_h = sizes.width, sizes.height
+            img = _embedded_preview(raw, full_w / full_h, min_dimension)
+            if img is None:
+                rgb = raw.postprocess(
+                    use_camera_wb=True,
+                    half_size=True,
+                    no_auto_bright=False,
+                    output_bps=8,
+                    demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR,
+                )
+                img = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+                log.info(f"RAW half-size decode: {img.shape[1]}x{img.shape[0]}")
+            elif sizes.flip in _RAW_FLIP_ROTATIONS:
+                img = cv2.rotate(img, _RAW_FLIP_ROTATIONS[sizes.flip])
+            if sizes.flip in (5, 6):
+                full_w, full_h = full_h, full_w
+            return img, full_w, full_h
+
+    except ImportError:
+        log.error("rawpy not installed — cannot decode RAW files")
+        return None
+    except Exception as e:
+        log.error(f"RAW preview decode failed: {e}")
+        return None
+
+
+def _embedded_preview(raw, aspect: float, min_dimension: int) -> Optional[np.ndarray]:
+    """The RAW's embedded preview as BGR in sensor orientation, if it's usable at `min_dimension`."""
+    import rawpy
+
+    try:
+        thumb = raw.extract_thumb()
+    except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+        return None
+
+    if thumb.format == rawpy.ThumbFormat.JPEG:
+        try:
+            with Image.open(io.BytesIO(thumb.data)) as preview:
+                pw, ph = preview.size
+        except Exception:
+            return None
+        if max(pw, ph) < min_dimension:
+            return None
+        # LibRaw's flip describes the sensor data — ignore any EXIF orientation in the preview
+        flag = _reduced_decode_flag(max(pw, ph), min_dimension) | cv2.IMREAD_IGNORE_ORIENTATION
+        img = cv2.imdecode(np.frombuffer(thumb.data, np.uint8), flag)
+    else:
+        img = cv2.cvtColor(thumb.data, cv2.COLOR_RGB2BGR)
+
+    if img is None or max(img.shape[:2]) < min_dimension:
+        return None
+    ph, pw = img.shape[:2]
+    if abs(pw / ph - aspect) > aspect * _PREVIEW_ASPECT_TOLERANCE:
+        return None
+    return img
+
+
+# DCT-domain downscales libjpeg can decode directly, largest reduction first
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+_ORIENTATION_TAG = 0x0112
+
+
+def jpeg_dimensions(image: Union[bytes, str]) -> Optional[tuple[int, int]]:
+    """
+    (width, height) of a JPEG as displayed (EXIF orientation applied), read
+    from its header alone. Returns None for anything that isn't a JPEG.
+    """
+    try:
+        with Image.open(image if isinstance(image, str) else io.BytesIO(image)) as img:
+            if img.format != "JPEG":
+                return None
+            w, h = img.size
+            if img.getexif().get(_ORIENTATION_TAG) in (5, 6, 7, 8):
+                w, h = h, w
+            return w, h
+    except Exception:
+        return None
+
+
+def decode_reduced(image: Union[bytes, str], min_dimension: int) -> Optional[tuple[np.ndarray, int, int]]:
+    """
+    Decode a JPEG at the smallest DCT scale (1/2, 1/4 or 1/8) whose longest
+    side is still at least `min_dimension`, skipping most of the IDCT work
+    and the full-resolution buffer.
+
+    Returns (BGR image, full width, full height), or None if `image` isn't
+    a JPEG or fails to decode — callers then fall back to a full decode.
+    """
+    dims = jpeg_dimensions(image)
+    if dims is None:
+        return None
+    img = _decode_cv2(image, _reduced_decode_flag(max(dims), min_dimension))
+    if img is None:
+        return None
+    return img, dims[0], dims[1]
+
+
+def _reduced_decode_flag(long_side: int, min_dimension: int) -> int:
+    """The imread flag for the largest DCT reduction that keeps `long_side` ≥ `min_dimension`."""
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if long_side // factor >= min_dimension:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+# ── Format detection ─────────────────────────────────────────
+
+# Bytes needed by detect_format
+MAGIC_BYTES = 16
+
+
+def detect_format(head: bytes, filename: str = "") -> str:
+    """
+    Image format from a file's first MAGIC_BYTES bytes: "jpeg", "png",
+    "webp", "gif", "bmp", "heif", "tiff", "raw" or "unknown".
+    """
+    if head[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[4:8] == b"ftyp":
+        if head[8:12] == b"crx ":  # Canon CR3
+            return "raw"
+        if head[8:12] in (b"heic", b"heix", b"mif1"):
+            return "heif"
+    if (head.startswith(b"FUJIFILMCCD-RAW")       # RAF
+            or head[:4] in (b"IIRO", b"IIRS", b"MMOR")  # ORF
+            or head[:4] == b"IIU\x00"                 # RW2
+            or head[:4] == b"FOVb"):                  # X3F
+        return "raw"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        if head[8:10] == b"CR":  # CR2
+            return "raw"
+        return "raw" if is_raw_file(filename) else "tiff"
+    return "raw" if is_raw_file(filename) else "unknown"
+
+
+# ── Decode-once handle ───────────────────────────────────────
+
+class ImageHandle:
+    """
+    Lazily decoded image with a cache of everything decoded or downscaled.
+
+    `full()` is the full-resolution BGR array; `at_least(n)` is the smallest
+    available image whose long side is at least n (decoded at a reduced
+    scale if nothing cached covers it); `fit(n)` is the image downscaled to
+    at most n. Arrays are shared — callers must copy before modifying.
+    """
+
+    def __init__(self, source: Union[bytes, str], filename: str = ""):
+        self.source = source
+        self.filename = filename or (source if isinstance(source, str) else "")
+        self.format = detect_format(self._head(), self.filename)
+        if self.format in ("tiff", "unknown") and isinstance(source, str) and is_raw_file(source):
+            self.format = "raw"
+        self._size: Optional[tuple[int, int]] = None
+        self._full: Optional[np.ndarray] = None
+        self._full_failed = False
+        # (image, largest target it serves) — reduced decodes and downscales
+        self._scaled: list[tuple[np.ndarray, int]] = []
+
+    @property
+    def is_raw(self) -> bool:
+        return self.format == "raw"
+
+    @property
+    def size(self) -> Optional[tuple[int, int]]:
+        """Full-resolution (width, height) as displayed — from the header when possible."""
+        if self._size is None:
+            if self.format == "jpeg" and self._full is None:
+                self._size = jpeg_dimensions(self.source)
+            if self._size is None and self.full() is not None:
+                h, w = self._full.shape[:2]
+                self._size = (w, h)
+        return self._size
+
+    def full(self) -> Optional[np.ndarray]:
+        """Full-resolution BGR array (a full AHD demosaic for RAWs), decoded once."""
+        if self._full is None and not self._full_failed:
+            self._full = self._decode_full()
+            self._full_failed = self._full is None
+            if self._full is not None:
+                h, w = self._full.shape[:2]
+                self._size = (w, h)
+        return self._full
+
+    def at_least(self, min_dimension: int) -> Optional[np.ndarray]:
+        """The smallest image whose long side covers `min_dimension` (or the full image, if smaller)."""
+        cached = self._cached(min_dimension)
+        if cached is not None:
+            return cached
+        if self._full is None:
+            reduced = self._decode_reduced(min_dimension)
+            if reduced is not None:
+                img, w, h = reduced
+                self._size = self._size or (w, h)
+                # A RAW without a big enough preview comes back half-size,
+                # which may fall short — it still serves this target
+                self._scaled.append((img, max(min_dimension, max(img.shape[:2]))))
+                return img
+        return self.full()
+
+    def fit(self, max_dimension: int) -> Optional[np.ndarray]:
+        """The image downscaled (INTER_AREA) so its long side is at most `max_dimension`."""
+        src = self.at_least(max_dimension)
+        if src is None:
+            return None
+        h, w = src.shape[:2]
+        if max(h, w) <= max_dimension:
+            return src
+        # Scale from the full dimensions, so the result doesn't depend on
+        # which cached image it was made from
+        fw, fh = self.size or (w, h)
+        scale = max_dimension / max(fw, fh)
+        img = cv2.resize(src, (int(fw * scale), int(fh * scale)), interpolation=cv2.INTER_AREA)
+        self._scaled.append((img, max(img.shape[:2])))
+        return img
+
+    def release(self):
+        """Drop every cached array."""
+        self._full = None
+        self._scaled = []
+
+    def _cached(self, min_dimension: int) -> Optional[np.ndarray]:
+        candidates = [(max(img.shape[:2]), img) for img, serves in self._scaled if serves >= min_dimension]
+        if self._full is not None:
+            candidates.append((max(self._full.shape[:2]), self._full))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: c[0])[1]
+
+    def _head(self) -> bytes:
+        if not isinstance(self.source, str):
+            return self.source[:MAGIC_BYTES]
+        try:
+            with open(self.source, "rb") as f:
+                return f.read(MAGIC_BYTES)
+        except OSError:
+            return b""
+
+    def _decode_reduced(self, min_dimension: int) -> Optional[tuple[np.ndarray, int, int]]:
+        if self.format == "jpeg":
+            return decode_reduced(self.source, min_dimension)
+        if self.is_raw:
+            return decode_raw_preview(self.source, min_dimension)
+        return None
+
+    def _decode_full(self) -> Optional[np.ndarray]:
+        """Decoder for the detected format first, then OpenCV → rawpy → PIL for anything left."""
+        if self.is_raw:
+            img = decode_raw(self.source)
+            if img is not None:
+                return img
+        else:
+            img = _decode_cv2(self.source)
+            if img is not None:
+                return img
+            if self.format in ("tiff", "unknown"):
+                # RAW without a RAW extension
+                img = decode_raw(self.source)
+                if img is not None:
+                    self.format = "raw"
+                    return img
+
+        # Last resort: PIL (may only get the embedded thumbnail of a RAW)
+        try:
+            with Image.open(self.source if isinstance(self.source, str) else io.BytesIO(self.source)) as pil_img:
+                img = np.array(pil_img.convert("RGB"))[:, :, ::-1]  # RGB → BGR for OpenCV
+            log.warning(f"Fell back to PIL for {self.filename} — image may be low resolution ({img.shape[1]}x{img.shape[0]})")
+            return img
+        except Exception:
+            log.error(f"Failed to decode image: {self.filename}")
+            return None
+
+
+def _decode_cv2(source: Union[bytes, str], flag: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    if isinstance(source, str):
+        return cv2.imread(source, flag)
+    return cv2.imdecode(np.frombuffer(source, np.uint8), flag)
+
+
+def decode_image(source: Union[bytes, str], filename: str = "") -> Optional[np.ndarray]:
+    """Full-resolution BGR array for image bytes or a local path, whatever the format."""
+    return ImageHandle(source, filename).full()
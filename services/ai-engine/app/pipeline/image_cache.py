@@ -0,0 +1,187 @@
+"""
+Image cache — byte-budgeted LRU for pipeline intermediates.
+
+Holds two kinds of entry per photo:
+  - encoded bytes   (the original as downloaded from storage)
+  - decoded arrays  (BGR numpy arrays, e.g. a demosaiced RAW)
+
+When the in-memory total exceeds the budget, the least recently used
+entries are evicted. Evicted arrays are spilled to `.npy` files on local
+disk and come back as read-only memory maps; evicted bytes are dropped
+(they can always be re-downloaded). Spilled arrays do not count against
+the budget — the OS page cache manages them.
+
+One cache is created per pipeline run and closed when the run ends. The
+budget is process-wide: every open cache gets an equal share of it, so
+concurrent runs together never hold more than IMAGE_CACHE_MAX_BYTES, and
+opening or closing a run rebalances the others.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_BYTES = "bytes"
+_ARRAY = "array"
+
+# Caches currently open in this process — they split the budget evenly
+_open_caches: "set[ImageCache]" = set()
+_open_lock = threading.Lock()
+
+
+class ImageCache:
+    """Thread-safe LRU cache of encoded bytes and decoded arrays with disk spill.
+
+    `budget_bytes` is the process-wide budget, shared with every other open cache.
+    """
+
+    def __init__(self, budget_bytes: int, spill_dir: Optional[str] = None):
+        self.budget_bytes = max(0, int(budget_bytes))
+        self._entries: "OrderedDict[tuple[str, str], bytes | np.ndarray]" = OrderedDict()
+        self._spilled: dict[str, str] = {}  # key -> .npy path
+        self._size = 0
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._spill_dir = tempfile.mkdtemp(prefix="apelier-cache-", dir=spill_dir or None)
+        _register(self)
+
+    @property
+    def max_bytes(self) -> int:
+        """This cache's share of the process-wide budget."""
+        return self.budget_bytes // max(1, len(_open_caches))
+
+    @property
+    def current_bytes(self) -> int:
+        """Bytes currently held in memory (spilled arrays excluded)."""
+        return self._size
+
+    # ── Encoded bytes ──
+
+    def put_bytes(self, key: str, data: bytes):
+        self._put((_BYTES, key), data)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._touch((_BYTES, key))
+
+    # ── Decoded arrays ──
+
+    def put_array(self, key: str, img: np.ndarray):
+        with self._lock:
+            self._drop_spill(key)
+        self._put((_ARRAY, key), img)
+
+    def get_array(self, key: str) -> Optional[np.ndarray]:
+        """Return the decoded array — from memory, or memory-mapped from disk if spilled.
+
+        Spilled arrays are read-only memmaps; copy before modifying in place.
+        """
+        with self._lock:
+            img = self._touch((_ARRAY, key))
+            if img is not None:
+                return img
+            path = self._spilled.get(key)
+        if path is None:
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except Exception as e:
+            log.warning(f"Failed to load spilled array for {key}: {e}")
+            return None
+
+    # ── Lifecycle ──
+
+    def discard(self, key: str):
+        """Drop everything cached for a key, including any spill file."""
+        with self._lock:
+            for kind in (_BYTES, _ARRAY):
+                value = self._entries.pop((kind, key), None)
+                if value is not None:
+                    self._size -= _nbytes(value)
+            self._drop_spill(key)
+
+    def close(self):
+        """Drop all entries and remove the spill directory."""
+        with self._lock:
+            self._entries.clear()
+            self._spilled.clear()
+            self._size = 0
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+        _unregister(self)
+
+    def shrink(self):
+        """Evict down to this cache's current share (after another cache opened)."""
+        with self._lock:
+            self._evict()
+
+    # ── Internals ──
+
+    def _put(self, entry_key: tuple[str, str], value):
+        size = _nbytes(value)
+        with self._lock:
+            old = self._entries.pop(entry_key, None)
+            if old is not None:
+                self._size -= _nbytes(old)
+            self._entries[entry_key] = value
+            self._size += size
+            self._evict()
+
+    def _touch(self, entry_key: tuple[str, str]):
+        value = self._entries.get(entry_key)
+        if value is not None:
+            self._entries.move_to_end(entry_key)
+        return value
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            (kind, key), value = self._entries.popitem(last=False)
+            self._size -= _nbytes(value)
+            if kind == _ARRAY:
+                self._spill(key, value)
+
+    def _spill(self, key: str, img: np.ndarray):
+        name = hashlib.sha1(key.encode()).hexdigest() + ".npy"
+        path = os.path.join(self._spill_dir, name)
+        try:
+            np.save(path, img, allow_pickle=False)
+            self._spilled[key] = path
+        except Exception as e:
+            log.warning(f"Failed to spill array for {key} — dropping: {e}")
+
+    def _drop_spill(self, key: str):
+        path = self._spilled.pop(key, None)
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def _register(cache: ImageCache):
+    with _open_lock:
+        _open_caches.add(cache)
+        others = [c for c in _open_caches if c is not cache]
+    # Every share just got smaller
+    for other in others:
+        other.shrink()
+
+
+def _unregister(cache: ImageCache):
+    with _open_lock:
+        _open_caches.discard(cache)
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return len(value)
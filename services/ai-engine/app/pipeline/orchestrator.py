@@ -9,47 +9,195 @@ Runs all 6 phases for a gallery:
   Phase 4: Composition     (CPU — Railway)
   Phase 5: QA & Output     (CPU — Railway)
 
-Updates processing_jobs in real-time so the frontend can show progress.
+Before any pixels are fetched, a pre-flight scan range-reads the header of
+every original (see preflight.py): EXIF lands in photos.exif_data within
+seconds, and each photo gets a cost estimate from its type and size.
+Pending photos are processed largest first with bursts kept together, and
+each window asks the scheduler for a slot weighted by its estimated cost.
+
+Photo rows are read as keyset-paginated pages of only the columns the
+pipeline needs (the next page is fetched while the current one is
+processed), so neither the rows nor per-photo state grow with the gallery.
+Photos stream through the phases in windows of PIPELINE_WINDOW_SIZE; each
+window waits for a fair-share slot from the FairScheduler, so concurrent
+galleries interleave window by window across photographers, and steps
+aside at photo boundaries while interactive requests run. Output variants
+upload in the background (bounded by STORAGE_UPLOAD_CONCURRENCY) while the
+next photo renders. Each photo's
+buffers are released as soon as its outputs are uploaded. Downloaded bytes
+and decoded arrays live in a byte-budgeted ImageCache (spills to disk).
+
+Photo row updates are merged in a write-behind buffer and flushed as batched
+UPDATEs at every phase boundary. Per-photo phase completion is checkpointed
+in photos.ai_edits, so a restarted or re-queued job resumes each photo from
+its first incomplete phase.
+
+Progress goes to processing_jobs through a throttled ProgressReporter so the
+frontend can show it without DB round trips on the processing hot path.
+
+A run can be cancelled (or preempted by a newer submission for the same
+gallery) through its CancelToken; the pipeline stops at the next photo or
+Modal batch boundary, keeping the checkpoints of finished work.
 """
 
 import asyncio
+import multiprocessing
+import os
 import time
 import logging
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import cv2
-from typing import Optional
-
-from app.config import settings, supabase
-from app.pipeline.phase0_analysis import analyse_image, decode_raw, is_raw_file
+from typing import AsyncIterator, Callable, Optional, Union
+
+from app.config import get_async_supabase, settings
+from app.storage.supabase_storage import download_photo_to_file_async
+from app.pipeline.decoder import ImageHandle, decode_image, is_raw_file
+from app.pipeline.phase0_analysis import analyse_image
+from app.pipeline.image_cache import ImageCache
+from app.pipeline.checkpoints import Checkpoint
+from app.pipeline.progress import ProgressReporter
+from app.pipeline.preflight import PhotoMeta, order_for_processing, photo_cost, run_preflight
+from app.pipeline.scheduler import get_scheduler, tier_weight
+from app.pipeline.cancellation import PREEMPTED, CancelToken, PipelineCancelled
+from app.storage.limiter import is_transient
+from app.storage.write_buffer import WriteBehindBuffer
 from app.pipeline.phase4_composition import fix_composition
 from app.pipeline.phase5_output import generate_outputs, get_output_keys
 from app.modal.client import ModalClient
 
 logger = logging.getLogger("apelier.orchestrator")
 
-PHASES = ["analysis", "style", "retouch", "cleanup", "composition", "output"]
-
 PIPELINE_VERSION = "2.0"
 
+# Photo columns the pipeline reads — skips the exif_data / face_data JSON
+PIPELINE_PHOTO_COLUMNS = (
+    "id,gallery_id,photographer_id,original_key,filename,file_size,"
+    "ai_edits,quality_score,edited_key,scene_type"
+)
+
+# Process pool for CPU-bound Phase 0 analysis — created lazily, sized from
+# settings.max_concurrent_images. Uses spawn (not fork) because the pipeline
+# runs inside a threaded uvicorn process.
+_analysis_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_analysis_pool() -> ProcessPoolExecutor:
+    global _analysis_pool
+    if _analysis_pool is None:
+        _analysis_pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.max_concurrent_images),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _analysis_pool
+
+
+def _reset_analysis_pool(broken: ProcessPoolExecutor):
+    """Drop a broken pool so the next caller gets a fresh one.
 
-def _decode_image_bytes(img_bytes: bytes, filename: str = "") -> Optional[np.ndarray]:
-    """Decode image bytes to BGR numpy array, handling both standard and RAW formats."""
-    import cv2
-    import numpy as np
+    Several tasks see the same BrokenProcessPool; only the first resets it,
+    so a pool another task has already recreated is never shut down.
+    """
+    global _analysis_pool
+    if _analysis_pool is not broken:
+        return
+    _analysis_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
 
-    # Try standard decode first (JPEG, PNG, TIFF)
-    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-    if img is not None:
-        return img
 
-    # If standard decode fails, try RAW decode
-    img = decode_raw(img_bytes)
-    if img is not None:
-        return img
+async def _analyse_in_pool(photo_id: str, source: Union[bytes, str], filename: str,
+                           retry_slots: asyncio.Semaphore) -> dict:
+    """Run `analyse_image` in the process pool, retrying once on a fresh pool.
+
+    A worker dying (usually OOM on a huge RAW) breaks the whole pool and
+    fails every photo in flight. Each of them is retried once in a
+    single-worker pool of its own (at most `retry_slots` at a time), so the
+    photo that caused it can only break its own retry. It is never analysed
+    in-process — a second OOM would take the API server down with it — so
+    if the retry breaks too, BrokenProcessPool propagates and the photo
+    fails Phase 0.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_analysis_pool()
+    try:
+        return await loop.run_in_executor(pool, analyse_image, source, filename)
+    except BrokenProcessPool:
+        _reset_analysis_pool(pool)
+        logger.warning(f"Analysis pool broke on {photo_id} — retrying on a fresh pool")
 
-    logger.warning(f"Could not decode image: {filename}")
-    return None
+    async with retry_slots:
+        retry_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return await loop.run_in_executor(retry_pool, analyse_image, source, filename)
+        finally:
+            retry_pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _RunContext:
+    """Per-run state shared by the phase steps."""
+
+    def __init__(self, gallery_id: str, photographer_id: str, bucket: str,
+                 cache: ImageCache, writes: WriteBehindBuffer,
+                 cancel_token: Optional[CancelToken] = None):
+        self.gallery_id = gallery_id
+        self.photographer_id = photographer_id
+        self.bucket = bucket
+        self.cache = cache
+        self.writes = writes
+        self.cancel_token = cancel_token
+        # Pre-flight metadata of photos not yet finished, by id
+        self.preflight: dict[str, PhotoMeta] = {}
+        self._uploads: list[asyncio.Task] = []
+        self._upload_slots = asyncio.Semaphore(max(1, settings.storage_upload_concurrency))
+
+    async def yield_to_interactive(self):
+        """Photo boundary — let interactive requests (restyles) run first."""
+        await get_scheduler().yield_to_interactive(self.cancel_token)
+
+    def check_cancelled(self):
+        """Cancellation checkpoint — raises PipelineCancelled if the run was cancelled."""
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+
+    async def flush_writes(self):
+        """Phase boundary — push buffered photo updates before moving on."""
+        await asyncio.to_thread(self.writes.flush)
+
+    def upload_in_background(self, photo_id: str, items: list[tuple[str, bytes, str]],
+                             on_uploaded: Callable[[], None]):
+        """Upload a photo's output variants while the pipeline moves on.
+
+        `on_uploaded` runs only if every item succeeded; otherwise the photo
+        isn't checkpointed as output-done and the next run redoes it.
+        """
+        async def upload():
+            results = await get_async_supabase().storage_upload_many(
+                self.bucket, items, semaphore=self._upload_slots,
+            )
+            failed = [key for key, ok in results.items() if not ok]
+            if failed:
+                logger.error(f"Phase 5 upload failed for {photo_id}: {failed}")
+                return
+            on_uploaded()
+
+        self._uploads.append(asyncio.create_task(upload()))
+
+    async def drain_uploads(self):
+        """Wait for queued uploads (their row updates land in the write buffer)."""
+        tasks, self._uploads = self._uploads, []
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, BaseException):
+                logger.error(f"Phase 5 upload failed: {result}")
+
+
+def shutdown_analysis_pool():
+    """Stop the analysis worker processes (called on app shutdown)."""
+    global _analysis_pool
+    pool, _analysis_pool = _analysis_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
 async def run_pipeline(
@@ -60,18 +208,27 @@ async def run_pipeline(
     style_profile_id: Optional[str] = None,
     settings_override: Optional[dict] = None,
     included_images: Optional[list[str]] = None,
-):
+    cancel_token: Optional[CancelToken] = None,
+    retryable: bool = False,
+) -> str:
     """
     Run the full 6-phase AI pipeline for a gallery.
+
+    Returns the terminal job status ("completed", "failed" or "canceled"),
+    or "retry" when the run hit a transient error and `retryable` says the
+    caller will run it again — the job row is then left 'queued' rather
+    than flipped to 'failed' in between attempts.
     """
     t_start = time.time()
+    progress = ProgressReporter(processing_job_id)
+    asb = get_async_supabase()
     modal_client = ModalClient()
     use_gpu = modal_client.is_configured
 
     # Look up gallery if we need photographer_id / job_id
     if not photographer_id or not job_id:
         try:
-            gallery = supabase.select_single("galleries", columns="photographer_id, job_id", filters={"id": gallery_id})
+            gallery = await asb.select_single("galleries", columns="photographer_id, job_id", filters={"id": gallery_id})
             if gallery:
                 photographer_id = photographer_id or gallery.get("photographer_id")
                 job_id = job_id or gallery.get("job_id")
@@ -80,8 +237,8 @@ async def run_pipeline(
 
     if not photographer_id:
         logger.error("No photographer_id — cannot process")
-        await _update_job_status(processing_job_id, "failed", error="Missing photographer_id")
-        return
+        await progress.finish("failed", error="Missing photographer_id")
+        return "failed"
 
     # Check Modal health
     if use_gpu:
@@ -97,7 +254,7 @@ async def run_pipeline(
     has_style = False
     if style_profile_id:
         try:
-            profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
+            profile = await asb.select_single("style_profiles", filters={"id": style_profile_id})
             if profile:
                 mk = profile.get("model_key") or profile.get("model_weights_key")
                 if mk:
@@ -109,311 +266,169 @@ async def run_pipeline(
         except Exception as e:
             logger.warning(f"Could not load style profile: {e}")
 
-    # Load photos for this gallery
-    photos = supabase.select("photos", filters={"gallery_id": gallery_id, "is_culled": False})
-    if not photos:
+    # Fair-share weight from the photographer's subscription tier
+    weight = 1.0
+    try:
+        photographer = await asb.select_single("photographers", columns="subscription_tier", filters={"id": photographer_id})
+        weight = tier_weight((photographer or {}).get("subscription_tier"))
+    except Exception as e:
+        logger.warning(f"Could not look up photographer tier: {e}")
+
+    # Count this gallery's photos — the rows themselves are streamed in
+    # pages below, so a 10k-photo gallery is never held in memory at once
+    photo_filters = {"gallery_id": gallery_id, "is_culled": False}
+    total_photos = await asb.count("photos", filters=photo_filters)
+    if not total_photos:
         logger.error(f"No photos found for gallery {gallery_id}")
-        await _update_job_status(processing_job_id, "failed", error="No photos found")
-        return
+        await progress.finish("failed", error="No photos found")
+        return "failed"
 
-    total_photos = len(photos)
     logger.info(f"Starting pipeline: {total_photos} photos, GPU={'enabled' if use_gpu else 'disabled'}")
 
     # ── In-memory accumulator per photo ──
     # Tracks ai_edits, quality_score, etc. across phases so we don't
     # lose data when merging dicts (the DB is also updated per-phase
     # but the local photo dict from the initial select would be stale).
+    # Entries live only while their window is in flight.
     photo_state = {}
-    for photo in photos:
-        photo_state[photo["id"]] = {
-            "ai_edits": dict(photo.get("ai_edits") or {}),
-            "quality_score": photo.get("quality_score"),
-            "face_data": photo.get("face_data") or [],
-            "edited_key": photo.get("edited_key"),
-            "scene_type": photo.get("scene_type"),
-        }
 
     bucket = settings.storage_bucket
 
+    # ── Streaming window ──
+    # Photos move through every phase in windows of `window_size` so only
+    # that many originals / decoded RAWs are held in memory at once. Peak
+    # memory depends on the window, not the gallery size.
+    window_size = max(1, settings.pipeline_window_size)
+    cache = ImageCache(settings.image_cache_max_bytes, settings.image_cache_dir or None)
+    writes = WriteBehindBuffer("photos")
+    run = _RunContext(gallery_id, photographer_id, bucket, cache, writes, cancel_token)
+    scheduler = get_scheduler()
+    style_enabled = use_gpu and bool(model_filename)
+
+    # ── Resume ──
+    # Photos with every phase checkpointed are finished and skipped as their
+    # pages arrive; the rest pick up from their first incomplete phase.
+    pages = asb.select_pages("photos", columns=PIPELINE_PHOTO_COLUMNS, filters=photo_filters)
+    windows = _pending_windows(pages, photo_state, style_profile_id, window_size, run.preflight)
+    completed = 0
+    processed_this_run = 0
+
+    if style_enabled:
+        logger.info("Phase 1 (GPU): Applying neural style")
+    else:
+        reason = "no GPU" if not use_gpu else "no trained model"
+        logger.info(f"Phase 1: Skipped ({reason})")
+    logger.info("Phase 2: Face retouching skipped (endpoint not ready)")
+    logger.info("Phase 3: Scene cleanup skipped (endpoint not ready)")
+    logger.info("Phase 4: Composition corrections disabled (pending improved detection)")
+
     try:
         # ═══════════════════════════════════════════════════════
-        # PHASE 0 — ANALYSIS (CPU)
+        # PRE-FLIGHT — header metadata for the whole gallery
         # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "analysis", 0)
-
-        for i, photo in enumerate(photos):
-            try:
-                ps = photo_state[photo["id"]]
-                img_bytes = supabase.storage_download(bucket, photo["original_key"])
-                if not img_bytes:
-                    logger.warning(f"Could not download {photo['original_key']}, skipping")
-                    continue
-
-                filename = photo.get("filename", "")
-                analysis = analyse_image(img_bytes, filename=filename)
-
-                if analysis.get("error"):
-                    logger.warning(f"Phase 0 analysis error for {photo['id']}: {analysis['error']}")
-                    await _update_phase(processing_job_id, "analysis", i + 1)
-                    continue
-
-                # Cast quality_score to int (DB column is INTEGER CHECK 0-100)
-                raw_quality = analysis.get("quality_score", 50)
-                quality_int = max(0, min(100, int(round(raw_quality))))
-
-                # Sanitise face_data
-                face_data = []
-                for face in (analysis.get("face_data") or []):
-                    face_data.append({
-                        "bbox": [int(v) for v in face.get("bbox", [0, 0, 0, 0])],
-                        "eyes_open": bool(face.get("eyes_open", True)),
-                    })
-
-                # Sanitise exif_data
-                import json as _json
-                exif_raw = analysis.get("exif_data") or {}
-                exif_clean = {}
-                for k, v in exif_raw.items():
-                    if isinstance(v, (str, int, float, bool, type(None))):
-                        exif_clean[k] = v
+        progress.phase("analysis", 0)
+        try:
+            run.preflight.update(await run_preflight(gallery_id, {"is_culled": False}, bucket, cancel_token))
+        except PipelineCancelled:
+            raise
+        except Exception as e:
+            # Only ordering and cost estimates depend on it — carry on without
+            logger.warning(f"Pre-flight scan failed: {e}")
+
+        async for already_done, window in windows:
+            completed += already_done
+            if not window:
+                progress.advance(completed)
+                continue
+            run.check_cancelled()
+
+            # Wait for a fair-share slot before pulling this window's pixels
+            window_cost = sum(photo_cost(run.preflight, photo) for photo in window)
+            async with scheduler.slot(photographer_id, cost=window_cost, weight=weight, cancel=cancel_token):
+                try:
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 0 — ANALYSIS (CPU)
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("analysis", completed)
+                    await _analyse_window(run, window, photo_state)
+                    await run.flush_writes()
+
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 1 — STYLE APPLICATION (GPU — skip if unavailable)
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("style", completed)
+                    if style_enabled:
+                        style_enabled = await _apply_style_window(run, window, photo_state, modal_client, model_filename)
+                        await run.flush_writes()
                     else:
+                        # Mark style as not applied
+                        for photo in window:
+                            ps = photo_state[photo["id"]]
+                            if ps["checkpoint"].is_done("style"):
+                                continue
+                            ps["ai_edits"]["style_applied"] = False
+                            ps["ai_edits"]["has_preset"] = has_style
+                            ps["checkpoint"].mark("style")
+
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 2 — FACE RETOUCHING (GPU)
+                    # Currently disabled: Modal face_retouch endpoint returns 500.
+                    # Will re-enable once the endpoint is deployed and tested.
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("retouch", completed)
+                    for photo in window:
+                        photo_state[photo["id"]]["checkpoint"].mark("retouch")
+
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 3 — SCENE CLEANUP (GPU)
+                    # Currently disabled: Modal scene_cleanup endpoint unreliable.
+                    # Will re-enable once the endpoint is deployed and tested.
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("cleanup", completed)
+                    for photo in window:
+                        photo_state[photo["id"]]["checkpoint"].mark("cleanup")
+
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 4 — COMPOSITION (CPU) — DISABLED
+                    # Horizon detection produces too many false positives.
+                    # Skip entirely until we have a more reliable detection method.
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("composition", completed)
+                    for photo in window:
+                        ps = photo_state[photo["id"]]
+                        ps["ai_edits"]["composition"] = {"evaluated": True, "changes": False, "skipped": True}
+                        ps["checkpoint"].mark("composition")
+
+                    # ═══════════════════════════════════════════════════
+                    # PHASE 5 — QA & OUTPUT (CPU)
+                    # ═══════════════════════════════════════════════════
+                    progress.phase("output", completed)
+                    for photo in window:
+                        await run.yield_to_interactive()
+                        run.check_cancelled()
                         try:
-                            _json.dumps(v)
-                            exif_clean[k] = v
-                        except (TypeError, ValueError):
-                            exif_clean[k] = str(v)
-
-                photo_update = {
-                    "scene_type": analysis.get("scene_type"),
-                    "quality_score": quality_int,
-                    "face_data": face_data,
-                    "exif_data": exif_clean,
-                    "width": int(analysis.get("width", 0)) or None,
-                    "height": int(analysis.get("height", 0)) or None,
-                }
-
-                # ── RAW file handling: convert to JPEG once, use everywhere ──
-                if analysis.get("is_raw"):
-                    logger.info(f"RAW file detected: {filename} — converting to JPEG")
-                    # Decode full resolution (this is already done inside analyse_image
-                    # but we need the full BGR array for JPEG conversion)
-                    full_bgr = _decode_image_bytes(img_bytes, filename)
-                    if full_bgr is not None:
-                        keys = get_output_keys(photographer_id, gallery_id, filename)
-
-                        # Full-res JPEG (working copy for all subsequent phases)
-                        _, full_buf = cv2.imencode(".jpg", full_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                        full_jpeg = full_buf.tobytes()
-                        supabase.storage_upload(bucket, keys["edited_key"], full_jpeg)
-                        photo_update["edited_key"] = keys["edited_key"]
-                        ps["edited_key"] = keys["edited_key"]
-                        logger.info(f"RAW→JPEG full-res: {keys['edited_key']} ({len(full_jpeg)/1024/1024:.1f}MB)")
-
-                        # Web preview (2048px max)
-                        h, w = full_bgr.shape[:2]
-                        if max(h, w) > 2048:
-                            scale = 2048 / max(h, w)
-                            web_img = cv2.resize(full_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-                        else:
-                            web_img = full_bgr
-                        _, web_buf = cv2.imencode(".jpg", web_img, [cv2.IMWRITE_JPEG_QUALITY, 92])
-                        web_jpeg = web_buf.tobytes()
-                        supabase.storage_upload(bucket, keys["web_key"], web_jpeg)
-                        photo_update["web_key"] = keys["web_key"]
-
-                        # Thumbnail (400px max)
-                        if max(h, w) > 400:
-                            scale_t = 400 / max(h, w)
-                            thumb_img = cv2.resize(full_bgr, (int(w * scale_t), int(h * scale_t)), interpolation=cv2.INTER_AREA)
-                        else:
-                            thumb_img = full_bgr
-                        _, thumb_buf = cv2.imencode(".jpg", thumb_img, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        supabase.storage_upload(bucket, keys["thumb_key"], thumb_buf.tobytes())
-                        photo_update["thumb_key"] = keys["thumb_key"]
-
-                        logger.info(f"RAW previews uploaded: web={keys['web_key']}, thumb={keys['thumb_key']}")
-
-                        # Cache the full BGR for later phases (avoid re-download + re-decode)
-                        photo["_processed_img"] = full_bgr
-                    else:
-                        logger.error(f"Failed to decode RAW for JPEG conversion: {filename}")
-
-                # Update DB
-                # Update DB
-                supabase.update("photos", photo["id"], photo_update)
-
-                # Update local state
-                ps["quality_score"] = quality_int
-                ps["face_data"] = face_data
-                ps["scene_type"] = analysis.get("scene_type")
-                if photo_update.get("edited_key"):
-                    ps["edited_key"] = photo_update["edited_key"]
-
-                # Cache image bytes for later phases (avoids re-downloading)
-                photo["_img_bytes"] = img_bytes
-
-            except Exception as e:
-                logger.error(f"Phase 0 failed for photo {photo['id']}: {e}")
-            await _update_phase(processing_job_id, "analysis", i + 1)
-
-        # ═══════════════════════════════════════════════════════
-        # PHASE 1 — STYLE APPLICATION (GPU — skip if unavailable)
-        # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "style", 0)
-
-        if use_gpu and model_filename:
-            logger.info(f"Phase 1 (GPU): Applying neural style to {total_photos} images")
-            batch_items = []
-            for photo in photos:
-                if photo.get("original_key"):
-                    edited_key = photo["original_key"].replace("/originals/", "/edited/")
-                    if not edited_key.lower().endswith((".jpg", ".jpeg")):
-                        edited_key = edited_key.rsplit(".", 1)[0] + ".jpg"
-                    batch_items.append({
-                        "image_key": photo["original_key"],
-                        "output_key": edited_key,
-                    })
-
-            BATCH_SIZE = 20
-            processed = 0
-            for batch_start in range(0, len(batch_items), BATCH_SIZE):
-                batch = batch_items[batch_start:batch_start + BATCH_SIZE]
-                result = await modal_client.apply_style_batch(
-                    images=batch,
-                    model_filename=model_filename,
-                    jpeg_quality=95,
-                )
-                if result.get("status") == "error":
-                    logger.error(f"GPU style batch failed: {result.get('message')}")
-                    break
-
-                processed += len(batch)
-                await _update_phase(processing_job_id, "style", processed)
-
-                for item, photo in zip(batch, photos[batch_start:batch_start + BATCH_SIZE]):
-                    ps = photo_state[photo["id"]]
-                    ps["edited_key"] = item["output_key"]
-                    ps["ai_edits"]["style_applied"] = "neural_lut"
-                    ps["ai_edits"]["has_preset"] = True
-
-                    supabase.update("photos", photo["id"], {
-                        "edited_key": item["output_key"],
-                        "ai_edits": ps["ai_edits"],
-                    })
-        else:
-            reason = "no GPU" if not use_gpu else "no trained model"
-            logger.info(f"Phase 1: Skipped ({reason})")
-            # Mark style as not applied
-            for photo in photos:
-                ps = photo_state[photo["id"]]
-                ps["ai_edits"]["style_applied"] = False
-                ps["ai_edits"]["has_preset"] = has_style
-            await _update_phase(processing_job_id, "style", total_photos)
-
-        # ═══════════════════════════════════════════════════════
-        # PHASE 2 — FACE RETOUCHING (GPU)
-        # Currently disabled: Modal face_retouch endpoint returns 500.
-        # Will re-enable once the endpoint is deployed and tested.
-        # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "retouch", 0)
-        logger.info("Phase 2: Face retouching skipped (endpoint not ready)")
-        await _update_phase(processing_job_id, "retouch", total_photos)
-
-        # ═══════════════════════════════════════════════════════
-        # PHASE 3 — SCENE CLEANUP (GPU)
-        # Currently disabled: Modal scene_cleanup endpoint unreliable.
-        # Will re-enable once the endpoint is deployed and tested.
-        # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "cleanup", 0)
-        logger.info("Phase 3: Scene cleanup skipped (endpoint not ready)")
-        await _update_phase(processing_job_id, "cleanup", total_photos)
-
-        # ═══════════════════════════════════════════════════════
-        # PHASE 4 — COMPOSITION (CPU) — DISABLED
-        # Horizon detection produces too many false positives.
-        # Skip entirely until we have a more reliable detection method.
-        # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "composition", 0)
-        logger.info("Phase 4: Composition corrections disabled (pending improved detection)")
-        for i, photo in enumerate(photos):
-            ps = photo_state[photo["id"]]
-            ps["ai_edits"]["composition"] = {"evaluated": True, "changes": False, "skipped": True}
-            await _update_phase(processing_job_id, "composition", i + 1)
-
-        # ═══════════════════════════════════════════════════════
-        # PHASE 5 — QA & OUTPUT (CPU)
-        # ═══════════════════════════════════════════════════════
-        await _update_phase(processing_job_id, "output", 0)
-
-        for i, photo in enumerate(photos):
-            try:
-                ps = photo_state[photo["id"]]
-
-                # Get the processed image — prefer cache, avoid re-download
-                img_array = photo.get("_processed_img")
-                if img_array is None:
-                    # Try cached bytes from Phase 0
-                    cached_bytes = photo.get("_img_bytes")
-                    if cached_bytes:
-                        img_array = _decode_image_bytes(cached_bytes, photo.get("filename", ""))
-                    else:
-                        # Last resort: download
-                        source_key = ps["edited_key"] or photo["original_key"]
-                        img_bytes = supabase.storage_download(bucket, source_key)
-                        if img_bytes:
-                            img_array = _decode_image_bytes(img_bytes, photo.get("filename", ""))
-
-                if img_array is None:
-                    logger.warning(f"No image data for {photo['id']}, skipping output generation")
-                    await _update_phase(processing_job_id, "output", i + 1)
-                    continue
-
-                # Generate web + thumb outputs
-                outputs = generate_outputs(img_array)
-                keys = get_output_keys(photographer_id, gallery_id, photo["filename"])
-
-                # Upload web resolution
-                supabase.storage_upload(bucket, keys["web_key"], outputs["web_res"])
-                # Upload thumbnail
-                supabase.storage_upload(bucket, keys["thumb_key"], outputs["thumbnail"])
-
-                # If no edited_key yet (no GPU style applied), upload full-res as edited
-                edited_key = ps["edited_key"]
-                if not edited_key:
-                    edited_key = keys["edited_key"]
-                    supabase.storage_upload(bucket, edited_key, outputs["full_res"])
-
-                # Calculate edit confidence from accumulated state
-                quality = ps["quality_score"] or 50
-                ai_edits = ps["ai_edits"]
-
-                confidence = min(100, int(quality))
-                if ai_edits.get("style_applied") and ai_edits["style_applied"] != False:
-                    confidence = min(100, confidence + 5)
-                if ai_edits.get("face_retouch"):
-                    confidence = min(100, confidence + 3)
-                if ai_edits.get("composition", {}).get("horizon_corrected"):
-                    confidence = min(100, confidence + 2)
-
-                # Final ai_edits with pipeline metadata
-                ai_edits["pipeline_version"] = PIPELINE_VERSION
-                ai_edits["has_preset"] = has_style
-
-                # Final photo update — all accumulated data
-                supabase.update("photos", photo["id"], {
-                    "edited_key": edited_key,
-                    "web_key": keys["web_key"],
-                    "thumb_key": keys["thumb_key"],
-                    "width": outputs.get("full_width"),
-                    "height": outputs.get("full_height"),
-                    "status": "edited",
-                    "edit_confidence": confidence,
-                    "ai_edits": ai_edits,
-                })
-
-            except Exception as e:
-                logger.error(f"Phase 5 failed for {photo['id']}: {e}")
-            await _update_phase(processing_job_id, "output", i + 1)
+                            await _output_photo(run, photo, photo_state[photo["id"]], has_style)
+                        except Exception as e:
+                            logger.error(f"Phase 5 failed for {photo['id']}: {e}")
+                        # Outputs are rendered and queued — free this photo's buffers now
+                        cache.discard(photo["id"])
+                    await run.drain_uploads()
+                    await run.flush_writes()
+                    completed += len(window)
+                    processed_this_run += len(window)
+                    progress.advance(completed)
+                except PipelineCancelled:
+                    # Land what this window already rendered before giving up
+                    # the slot — queued uploads and their row updates
+                    await run.drain_uploads()
+                    await run.flush_writes()
+                    raise
+                finally:
+                    for photo in window:
+                        photo_state.pop(photo["id"], None)
+                        run.preflight.pop(photo["id"], None)
+                    for photo in window:
+                        cache.discard(photo["id"])
 
         # ═══════════════════════════════════════════════════════
         # DONE — update statuses
@@ -423,68 +438,438 @@ async def run_pipeline(
         # Gallery stays in 'processing' until photographer delivers — DON'T set to 'ready'
         # The 'processing' status keeps it hidden from the Galleries page
         # It becomes 'ready' only when photographer clicks Send to Gallery / Deliver
-        supabase.update("galleries", gallery_id, {"status": "processing"})
+        await asb.update("galleries", gallery_id, {"status": "processing"})
         if job_id:
-            supabase.update("jobs", job_id, {"status": "ready_for_review"})
-        await _update_job_status(processing_job_id, "completed")
+            await asb.update("jobs", job_id, {"status": "ready_for_review"})
+        await progress.finish("completed")
+
+        if completed > processed_this_run:
+            logger.info(f"Resumed: {completed - processed_this_run}/{total_photos} photos were already complete")
 
-        # Increment images edited counter for billing tracking
+        # Increment images edited counter for billing tracking — only photos
+        # processed by this run, so a resumed job doesn't bill twice
         try:
-            from app.config import get_supabase as _get_sb
-            _sb = _get_sb()
-            import httpx as _httpx
-            url = f"{_sb.base_url}/rest/v1/rpc/increment_images_edited"
-            resp = _httpx.post(url, headers=_sb.headers, json={
+            resp = await asb.rpc("increment_images_edited", {
                 "photographer_uuid": photographer_id,
-                "count": total_photos,
-            }, timeout=10)
+                "count": processed_this_run,
+            })
             if resp.status_code in (200, 204):
-                logger.info(f"Incremented images_edited_count by {total_photos}")
+                logger.info(f"Incremented images_edited_count by {processed_this_run}")
             else:
                 logger.warning(f"Failed to increment counter: {resp.status_code} {resp.text}")
         except Exception as e:
             logger.warning(f"Failed to increment images edited counter: {e}")
 
         logger.info(
-            f"Pipeline complete: {total_photos} photos in {elapsed:.1f}s "
-            f"({elapsed/max(1,total_photos):.1f}s/photo avg), GPU={'yes' if use_gpu else 'no'}"
+            f"Pipeline complete: {processed_this_run}/{total_photos} photos in {elapsed:.1f}s "
+            f"({elapsed/max(1,processed_this_run):.1f}s/photo avg), GPU={'yes' if use_gpu else 'no'}"
         )
+        return "completed"
+
+    except PipelineCancelled as e:
+        if e.reason == PREEMPTED:
+            # A newer run for this gallery owns the job row now — leave it
+            # alone, but keep this run's finished uploads and checkpoints
+            logger.info(f"Pipeline preempted for gallery {gallery_id}")
+            progress.abandon()
+            await run.drain_uploads()
+            await run.flush_writes()
+        else:
+            logger.info(f"Pipeline canceled for gallery {gallery_id}")
+            await run.drain_uploads()
+            await run.flush_writes()
+            await progress.finish("canceled")
+        return "canceled"
 
     except Exception as e:
         logger.error(f"Pipeline failed: {e}\n{traceback.format_exc()}")
-        await _update_job_status(processing_job_id, "failed", error=str(e))
+        # Keep whatever per-photo results (and checkpoints) we already have
+        await run.drain_uploads()
+        await run.flush_writes()
+        if retryable and is_transient(e):
+            await progress.finish("queued", error=f"Retrying after: {e}")
+            return "retry"
+        await progress.finish("failed", error=str(e))
+        return "failed"
 
     finally:
+        await windows.aclose()
         await modal_client.close()
-        # Clean up cached image data to free memory
-        for photo in photos:
-            photo.pop("_img_bytes", None)
-            photo.pop("_processed_img", None)
+        cache.close()
+        progress.close()
+
 
+# ─── Per-photo phase steps ────────────────────────────────────────────
 
-# ─── Helper functions ─────────────────────────────────────────────────
+async def _pending_windows(pages: AsyncIterator[list[dict]], photo_state: dict,
+                           style_profile_id: Optional[str], window_size: int,
+                           metas: dict[str, PhotoMeta]) -> AsyncIterator[tuple[int, list[dict]]]:
+    """Regroup streamed photo pages into windows of photos still to process.
 
-async def _update_phase(processing_job_id: str, phase: str, processed_images: int):
-    """Update the current phase and progress in the processing_jobs table."""
+    Yields (already_done, window), where `already_done` counts the photos
+    skipped since the previous window because every phase is checkpointed;
+    the last item may have an empty window. The others resume from their
+    first incomplete phase. Within each page, pending photos
+    are ordered by `order_for_processing` (largest first, bursts together).
+    Photos get their photo_state entry as they arrive.
+    """
+    window, skipped = [], 0
     try:
-        supabase.update("processing_jobs", processing_job_id, {
-            "current_phase": phase,
-            "processed_images": processed_images,
-            "status": "processing",
-        })
-    except Exception as e:
-        logger.warning(f"Failed to update phase progress: {e}")
+        async for page in pages:
+            pending = []
+            for photo in page:
+                checkpoint = Checkpoint.from_photo(photo, style_profile_id)
+                resume_phase = checkpoint.first_incomplete
+                if resume_phase is None:
+                    skipped += 1
+                    metas.pop(photo["id"], None)
+                    continue
+                checkpoint.resume_from(resume_phase)
+                pending.append((photo, checkpoint))
+            order = {photo["id"]: i for i, photo in enumerate(order_for_processing([p for p, _ in pending], metas))}
+            pending.sort(key=lambda item: order[item[0]["id"]])
+            for photo, checkpoint in pending:
+                photo_state[photo["id"]] = {
+                    "ai_edits": dict(photo.get("ai_edits") or {}),
+                    "quality_score": photo.get("quality_score"),
+                    "face_data": [],
+                    "edited_key": photo.get("edited_key"),
+                    "scene_type": photo.get("scene_type"),
+                    "checkpoint": checkpoint,
+                }
+                window.append(photo)
+                if len(window) == window_size:
+                    yield skipped, window
+                    window, skipped = [], 0
+        if window or skipped:
+            yield skipped, window
+    finally:
+        await pages.aclose()
 
 
-async def _update_job_status(processing_job_id: str, status: str, error: str = None):
-    """Update the processing job status."""
+async def _analyse_window(run: _RunContext, window: list[dict], photo_state: dict):
+    """Phase 0 for one window — concurrent downloads + process-pool analysis.
+
+    Downloads run on the async client (bounded by max_concurrent_images) so
+    they overlap with the CPU-bound `analyse_image` calls in the process pool.
+    Results are merged back into photo_state in window order. Photos with
+    a valid analysis checkpoint are skipped entirely.
+    """
+    window = [p for p in window if not photo_state[p["id"]]["checkpoint"].is_done("analysis")]
+    if not window:
+        return
+    download_slots = asyncio.Semaphore(max(1, settings.max_concurrent_images))
+    retry_slots = asyncio.Semaphore(max(1, settings.max_concurrent_images))
+
+    async def fetch_and_analyse(photo: dict):
+        filename = photo.get("filename", "")
+        async with download_slots:
+            if is_raw_file(filename or photo["original_key"]):
+                # RAWs stream to disk — decoders read the file, no in-memory copy
+                source = await download_photo_to_file_async(photo["original_key"], settings.image_cache_dir or None)
+            else:
+                source = await get_async_supabase().storage_download(run.bucket, photo["original_key"])
+        if not source:
+            return None, None
+        try:
+            await run.yield_to_interactive()
+            analysis = await _analyse_in_pool(photo["id"], source, filename, retry_slots)
+        except BaseException:
+            _discard_source(source)
+            raise
+        return source, analysis
+
+    results = await asyncio.gather(*(fetch_and_analyse(p) for p in window), return_exceptions=True)
+
     try:
-        data = {"status": status}
-        if error:
-            data["error_log"] = error
-        if status in ("completed", "failed"):
-            from datetime import datetime, timezone
-            data["completed_at"] = datetime.now(timezone.utc).isoformat()
-        supabase.update("processing_jobs", processing_job_id, data)
-    except Exception as e:
-        logger.warning(f"Failed to update job status: {e}")
+        for photo, result in zip(window, results):
+            run.check_cancelled()
+            if isinstance(result, BaseException):
+                logger.error(f"Phase 0 failed for photo {photo['id']}: {result}")
+                continue
+            source, analysis = result
+            if not source:
+                logger.warning(f"Could not download {photo['original_key']}, skipping")
+                continue
+            try:
+                await _apply_analysis(run, photo, photo_state[photo["id"]], source, analysis)
+            except Exception as e:
+                logger.error(f"Phase 0 failed for photo {photo['id']}: {e}")
+    finally:
+        for result in results:
+            if isinstance(result, tuple):
+                _discard_source(result[0])
+
+
+def _discard_source(source: Union[bytes, str, None]):
+    """Delete a streamed-to-disk original once Phase 0 is done with it."""
+    if isinstance(source, str):
+        try:
+            os.unlink(source)
+        except OSError:
+            pass
+
+
+async def _apply_analysis(run: _RunContext, photo: dict, ps: dict, source: Union[bytes, str], analysis: dict):
+    """Phase 0 merge for a single photo — RAW→JPEG conversion, buffered DB + state update.
+
+    `source` is the original's bytes, or the local path of a streamed RAW.
+    Caches the original bytes (or the decoded array for RAWs) under the
+    photo id for the later phases of the same window. The RAW demosaic and
+    encodes run in a thread and the previews go up on the async client, so
+    neither holds up the event loop.
+    """
+    filename = photo.get("filename", "")
+
+    if analysis.get("error"):
+        logger.warning(f"Phase 0 analysis error for {photo['id']}: {analysis['error']}")
+        return
+
+    # Cast quality_score to int (DB column is INTEGER CHECK 0-100)
+    raw_quality = analysis.get("quality_score", 50)
+    quality_int = max(0, min(100, int(round(raw_quality))))
+
+    # Sanitise face_data
+    face_data = []
+    for face in (analysis.get("face_data") or []):
+        face_data.append({
+            "bbox": [int(v) for v in face.get("bbox", [0, 0, 0, 0])],
+            "eyes_open": bool(face.get("eyes_open", True)),
+        })
+
+    # Sanitise exif_data
+    import json as _json
+    exif_raw = analysis.get("exif_data") or {}
+    exif_clean = {}
+    for k, v in exif_raw.items():
+        if isinstance(v, (str, int, float, bool, type(None))):
+            exif_clean[k] = v
+        else:
+            try:
+                _json.dumps(v)
+                exif_clean[k] = v
+            except (TypeError, ValueError):
+                exif_clean[k] = str(v)
+
+    # Keep the pre-flight record so later runs don't rescan the header
+    meta = run.preflight.get(photo["id"])
+    if meta is not None:
+        exif_clean["preflight"] = meta.record
+
+    photo_update = {
+        "scene_type": analysis.get("scene_type"),
+        "quality_score": quality_int,
+        "face_data": face_data,
+        "exif_data": exif_clean,
+        "width": int(analysis.get("width", 0)) or None,
+        "height": int(analysis.get("height", 0)) or None,
+    }
+    checkpoint = ps["checkpoint"]
+
+    # ── RAW file handling: convert to JPEG once, use everywhere ──
+    if analysis.get("is_raw"):
+        logger.info(f"RAW file detected: {filename} — converting to JPEG")
+        converted = await asyncio.to_thread(_convert_raw, source, filename)
+        if converted is not None:
+            full_bgr, full_jpeg, web_jpeg, thumb_jpeg = converted
+            keys = get_output_keys(run.photographer_id, run.gallery_id, filename)
+            logger.info(f"RAW→JPEG full-res: {keys['edited_key']} ({len(full_jpeg)/1024/1024:.1f}MB)")
+
+            # All three variants go up concurrently; only keys that made it are recorded
+            uploaded = await get_async_supabase().storage_upload_many(run.bucket, [
+                (keys["edited_key"], full_jpeg, "image/jpeg"),
+                (keys["web_key"], web_jpeg, "image/jpeg"),
+                (keys["thumb_key"], thumb_jpeg, "image/jpeg"),
+            ], semaphore=run._upload_slots)
+            for field in ("edited_key", "web_key", "thumb_key"):
+                if uploaded.get(keys[field]):
+                    photo_update[field] = keys[field]
+                else:
+                    logger.error(f"RAW preview upload failed: {keys[field]}")
+            if "edited_key" in photo_update:
+                ps["edited_key"] = keys["edited_key"]
+
+            logger.info(f"RAW previews uploaded: web={keys['web_key']}, thumb={keys['thumb_key']}")
+
+            # Cache the full BGR for later phases (avoid re-download + re-decode)
+            run.cache.put_array(photo["id"], full_bgr)
+        else:
+            logger.error(f"Failed to decode RAW for JPEG conversion: {filename}")
+
+    # Update DB
+    checkpoint.mark("analysis")
+    photo_update["ai_edits"] = _ai_edits_with_checkpoint(ps)
+    run.writes.update(photo["id"], photo_update)
+
+    # Update local state
+    ps["quality_score"] = quality_int
+    ps["face_data"] = face_data
+    ps["scene_type"] = analysis.get("scene_type")
+    if photo_update.get("edited_key"):
+        ps["edited_key"] = photo_update["edited_key"]
+
+    # Cache image bytes for later phases (avoids re-downloading). Streamed
+    # RAWs aren't read back into memory — later phases use the decoded
+    # array or the uploaded JPEG working copy.
+    if isinstance(source, bytes):
+        run.cache.put_bytes(photo["id"], source)
+
+
+def _convert_raw(source: Union[bytes, str], filename: str) -> Optional[tuple[np.ndarray, bytes, bytes, bytes]]:
+    """Full demosaic of a RAW plus its full-res, web (2048px) and thumb (400px) JPEGs.
+
+    Analysis only decoded a preview — the JPEG conversion needs the full
+    demosaic, and the web / thumb sizes come from the same handle. Returns
+    (full BGR, full JPEG, web JPEG, thumb JPEG), or None if it won't decode.
+    """
+    handle = ImageHandle(source, filename)
+    full_bgr = handle.full()
+    if full_bgr is None:
+        return None
+    _, full_buf = cv2.imencode(".jpg", full_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    _, web_buf = cv2.imencode(".jpg", handle.fit(2048), [cv2.IMWRITE_JPEG_QUALITY, 92])
+    # Thumbnail — downscaled from the web size, not the full image
+    _, thumb_buf = cv2.imencode(".jpg", handle.fit(400), [cv2.IMWRITE_JPEG_QUALITY, 80])
+    handle.release()
+    return full_bgr, full_buf.tobytes(), web_buf.tobytes(), thumb_buf.tobytes()
+
+
+async def _apply_style_window(run: _RunContext, window: list[dict], photo_state: dict, modal_client: ModalClient, model_filename: str) -> bool:
+    """Phase 1 for one window — neural style via Modal in batches.
+
+    Returns False if a GPU batch failed, so later windows skip style
+    instead of hammering a failing endpoint.
+    """
+    batch_items = []
+    for photo in window:
+        if photo_state[photo["id"]]["checkpoint"].is_done("style"):
+            continue
+        if photo.get("original_key"):
+            edited_key = photo["original_key"].replace("/originals/", "/edited/")
+            if not edited_key.lower().endswith((".jpg", ".jpeg")):
+                edited_key = edited_key.rsplit(".", 1)[0] + ".jpg"
+            batch_items.append((photo, {
+                "image_key": photo["original_key"],
+                "output_key": edited_key,
+            }))
+
+    BATCH_SIZE = 20
+    for batch_start in range(0, len(batch_items), BATCH_SIZE):
+        batch = batch_items[batch_start:batch_start + BATCH_SIZE]
+        run.check_cancelled()
+        result = await modal_client.apply_style_batch(
+            images=[item for _, item in batch],
+            model_filename=model_filename,
+            jpeg_quality=95,
+        )
+        if result.get("status") == "error":
+            logger.error(f"GPU style batch failed: {result.get('message')}")
+            return False
+
+        for photo, item in batch:
+            ps = photo_state[photo["id"]]
+            ps["edited_key"] = item["output_key"]
+            ps["ai_edits"]["style_applied"] = "neural_lut"
+            ps["ai_edits"]["has_preset"] = True
+            ps["checkpoint"].mark("style")
+
+            run.writes.update(photo["id"], {
+                "edited_key": item["output_key"],
+                "ai_edits": _ai_edits_with_checkpoint(ps),
+            })
+    return True
+
+
+async def _load_pixels(run: _RunContext, photo: dict, ps: dict) -> Optional[np.ndarray]:
+    """Get a photo's decoded pixels — cached array, then cached bytes, then download.
+
+    The download goes through the async client and the decode runs in a
+    thread, so neither holds up the event loop. Whatever had to be decoded
+    is put back in the cache so the next phase asking for the same photo
+    gets it for free.
+    """
+    img_array = run.cache.get_array(photo["id"])
+    if img_array is not None:
+        return img_array
+
+    # Try cached bytes from Phase 0
+    img_bytes = run.cache.get_bytes(photo["id"])
+    if img_bytes is None:
+        # Last resort: download
+        source_key = ps["edited_key"] or photo["original_key"]
+        img_bytes = await get_async_supabase().storage_download(run.bucket, source_key)
+        if not img_bytes:
+            return None
+
+    img_array = await asyncio.to_thread(decode_image, img_bytes, photo.get("filename", ""))
+    if img_array is not None:
+        run.cache.put_array(photo["id"], img_array)
+    return img_array
+
+
+async def _output_photo(run: _RunContext, photo: dict, ps: dict, has_style: bool):
+    """Phase 5 for a single photo — generate web/thumb (and full-res if unstyled) and queue the uploads.
+
+    Rendering runs in a thread so queued uploads of earlier photos keep
+    moving; the photo's final row update (and output checkpoint) is only
+    recorded once all of its variants are uploaded.
+    """
+    # Get the processed image — prefer cache, avoid re-download
+    img_array = await _load_pixels(run, photo, ps)
+    if img_array is None:
+        logger.warning(f"No image data for {photo['id']}, skipping output generation")
+        return
+
+    # Generate web + thumb outputs
+    outputs = await asyncio.to_thread(generate_outputs, img_array)
+    del img_array
+    keys = get_output_keys(run.photographer_id, run.gallery_id, photo["filename"])
+
+    items = [
+        (keys["web_key"], outputs["web_res"], "image/jpeg"),
+        (keys["thumb_key"], outputs["thumbnail"], "image/jpeg"),
+    ]
+    # If no edited_key yet (no GPU style applied), upload full-res as edited
+    edited_key = ps["edited_key"]
+    if not edited_key:
+        edited_key = keys["edited_key"]
+        items.append((edited_key, outputs["full_res"], "image/jpeg"))
+
+    # Calculate edit confidence from accumulated state
+    quality = ps["quality_score"] or 50
+    ai_edits = ps["ai_edits"]
+
+    confidence = min(100, int(quality))
+    if ai_edits.get("style_applied") and ai_edits["style_applied"] != False:
+        confidence = min(100, confidence + 5)
+    if ai_edits.get("face_retouch"):
+        confidence = min(100, confidence + 3)
+    if ai_edits.get("composition", {}).get("horizon_corrected"):
+        confidence = min(100, confidence + 2)
+
+    def record():
+        # Final ai_edits with pipeline metadata
+        ai_edits["pipeline_version"] = PIPELINE_VERSION
+        ai_edits["has_preset"] = has_style
+        ps["checkpoint"].mark("output")
+
+        # Final photo update — all accumulated data
+        run.writes.update(photo["id"], {
+            "edited_key": edited_key,
+            "web_key": keys["web_key"],
+            "thumb_key": keys["thumb_key"],
+            "width": outputs.get("full_width"),
+            "height": outputs.get("full_height"),
+            "status": "edited",
+            "edit_confidence": confidence,
+            "ai_edits": _ai_edits_with_checkpoint(ps),
+        })
+
+    run.upload_in_background(photo["id"], items, record)
+
+
+def _ai_edits_with_checkpoint(ps: dict) -> dict:
+    """The photo's accumulated ai_edits with its current checkpoint embedded."""
+    ps["ai_edits"]["checkpoint"] = ps["checkpoint"].to_dict()
+    return ps["ai_edits"]
+
@@ -10,71 +10,17 @@ Extracts metadata and scores each image:
 """
 import io
 import logging
+from functools import cached_property
 import numpy as np
 import cv2
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
-from typing import Optional
+from typing import Optional, Union
 from datetime import datetime
 
-log = logging.getLogger(__name__)
-
-# RAW file extensions supported by rawpy/libraw
-RAW_EXTENSIONS = {
-    '.dng', '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2',
-    '.orf', '.rw2', '.pef', '.raf', '.raw', '.3fr', '.mef', '.mrw',
-    '.x3f', '.srw', '.erf', '.kdc', '.dcr', '.rwl', '.iiq',
-}
-
-
-def is_raw_file(filename: str) -> bool:
-    """Check if a filename has a RAW extension."""
-    import os
-    ext = os.path.splitext(filename.lower())[1]
-    return ext in RAW_EXTENSIONS
-
-
-def decode_raw(image_bytes: bytes) -> Optional[np.ndarray]:
-    """
-    Decode a RAW image file to full-resolution BGR numpy array using rawpy.
-
-    Returns None if decoding fails.
-    """
-    try:
-        import rawpy
-        import tempfile
-        import os
-
-        # rawpy needs a file path — write to temp file
-        with tempfile.NamedTemporaryFile(suffix='.dng', delete=False) as tmp:
-            tmp.write(image_bytes)
-            tmp_path = tmp.name
-
-        try:
-            with rawpy.imread(tmp_path) as raw:
-                # Process with reasonable defaults for photography
-                rgb = raw.postprocess(
-                    use_camera_wb=True,       # Use camera white balance
-                    half_size=False,           # Full resolution
-                    no_auto_bright=False,      # Auto brightness
-                    output_bps=8,              # 8-bit output
-                    bright=1.0,                # Normal brightness
-                    demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD,
-                )
-                # Convert RGB to BGR for OpenCV
-                bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-                log.info(f"RAW decoded: {bgr.shape[1]}x{bgr.shape[0]}")
-                return bgr
-        finally:
-            os.unlink(tmp_path)
-
-    except ImportError:
-        log.error("rawpy not installed — cannot decode RAW files")
-        return None
-    except Exception as e:
-        log.error(f"RAW decode failed: {e}")
-        return None
+from app.pipeline.decoder import ImageHandle
 
+log = logging.getLogger(__name__)
 
 def generate_web_preview(img_array: np.ndarray, max_dimension: int = 2048, quality: int = 92) -> bytes:
     """
@@ -94,66 +40,161 @@ def generate_web_preview(img_array: np.ndarray, max_dimension: int = 2048, quali
 
 # ── EXIF Extraction ──────────────────────────────────────────
 
-def extract_exif(image_bytes: bytes) -> dict:
-    """Extract useful EXIF data from image bytes."""
+_EXIF_FIELDS = (
+    "Make", "Model", "LensModel", "LensMake",
+    "ISOSpeedRatings", "ExposureTime", "FNumber", "FocalLength",
+    "DateTimeOriginal", "DateTimeDigitized", "DateTime",
+    "ImageWidth", "ImageLength", "Orientation",
+    "Flash", "WhiteBalance", "ExposureProgram", "MeteringMode",
+    "ExposureBiasValue", "BrightnessValue",
+)
+EXIF_IFD = 0x8769
+
+
+def exif_fields(raw_exif) -> dict:
+    """Useful, serialisable fields from a PIL Exif — IFD0 plus the Exif sub-IFD."""
+    tags = dict(raw_exif.items())
+    try:
+        # Capture time, exposure and lens details live in the Exif sub-IFD
+        tags.update(raw_exif.get_ifd(EXIF_IFD))
+    except Exception:
+        pass
+
+    exif = {}
+    for tag_id, value in tags.items():
+        tag = TAGS.get(tag_id, str(tag_id))
+        if tag not in _EXIF_FIELDS:
+            continue
+        # Convert rationals to float
+        if hasattr(value, "numerator"):
+            value = float(value)
+            if value != value:  # 0/0 rational
+                continue
+        elif isinstance(value, bytes):
+            value = value.decode(errors="replace").rstrip("\x00")
+        exif[tag] = value
+    return exif
+
+
+def extract_exif(image: Union[bytes, str]) -> dict:
+    """Extract useful EXIF data from image bytes or a local path."""
     try:
-        img = Image.open(io.BytesIO(image_bytes))
+        img = Image.open(image if isinstance(image, str) else io.BytesIO(image))
         raw_exif = img.getexif()
         if not raw_exif:
             return {}
-
-        exif = {}
-        for tag_id, value in raw_exif.items():
-            tag = TAGS.get(tag_id, str(tag_id))
-            # Only keep useful, serialisable fields
-            if tag in (
-                "Make", "Model", "LensModel", "LensMake",
-                "ISOSpeedRatings", "ExposureTime", "FNumber", "FocalLength",
-                "DateTimeOriginal", "DateTimeDigitized", "DateTime",
-                "ImageWidth", "ImageLength", "Orientation",
-                "Flash", "WhiteBalance", "ExposureProgram", "MeteringMode",
-                "ExposureBiasValue", "BrightnessValue",
-            ):
-                # Convert rationals to float
-                if hasattr(value, "numerator"):
-                    value = float(value)
-                exif[tag] = value
-
-        return exif
+        return exif_fields(raw_exif)
     except Exception as e:
         log.warning(f"EXIF extraction failed: {e}")
         return {}
 
 
+# ── Analysis Context ─────────────────────────────────────────
+
+class AnalysisContext:
+    """
+    One analysis image plus its derived representations, shared by every scorer.
+
+    Each representation (grayscale, HSV, LAB, histograms, Sobel gradients,
+    edge maps) is computed on first use and cached, so the scorers never
+    convert the same image twice and unused ones cost nothing.
+    """
+
+    def __init__(self, img: np.ndarray):
+        self.img = img
+        self._edges: dict[tuple[int, int], np.ndarray] = {}
+
+    @property
+    def is_color(self) -> bool:
+        return self.img.ndim == 3
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY) if self.is_color else self.img
+
+    @cached_property
+    def hsv(self) -> np.ndarray:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2HSV)
+
+    @cached_property
+    def lab(self) -> np.ndarray:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2LAB)
+
+    @cached_property
+    def channel_means(self) -> tuple[float, ...]:
+        """Per-channel means of the BGR image."""
+        return tuple(cv2.mean(self.img)[:3])
+
+    @cached_property
+    def gray_hist(self) -> np.ndarray:
+        """256-bin histogram of the grayscale image."""
+        return _histogram(self.gray)
+
+    @cached_property
+    def lightness_hist(self) -> np.ndarray:
+        """256-bin histogram of the LAB L channel."""
+        return _histogram(self.lab[:, :, 0])
+
+    @cached_property
+    def gradients(self) -> tuple[np.ndarray, np.ndarray]:
+        """3x3 Sobel derivatives of the grayscale image — the same ones Canny computes."""
+        dx = cv2.Sobel(self.gray, cv2.CV_16S, 1, 0, borderType=cv2.BORDER_REPLICATE)
+        dy = cv2.Sobel(self.gray, cv2.CV_16S, 0, 1, borderType=cv2.BORDER_REPLICATE)
+        return dx, dy
+
+    def edges(self, low: int, high: int) -> np.ndarray:
+        """Canny edge map for the given thresholds, sharing one gradient pass."""
+        key = (low, high)
+        if key not in self._edges:
+            dx, dy = self.gradients
+            self._edges[key] = cv2.Canny(dx, dy, low, high)
+        return self._edges[key]
+
+
+def _histogram(channel: np.ndarray) -> np.ndarray:
+    return cv2.calcHist([channel], [0], None, [256], [0, 256]).flatten()
+
+
+def _hist_percentile(hist: np.ndarray, q: float) -> float:
+    """np.percentile (linear interpolation) of 8-bit data, computed from its histogram."""
+    cumulative = np.cumsum(hist)
+    position = q / 100 * (cumulative[-1] - 1)
+    lower = int(np.floor(position))
+    lo = int(np.searchsorted(cumulative, lower, side="right"))
+    hi = int(np.searchsorted(cumulative, min(lower + 1, cumulative[-1] - 1), side="right"))
+    return float(lo + (position - lower) * (hi - lo))
+
+
+def _as_context(image: Union[np.ndarray, AnalysisContext]) -> AnalysisContext:
+    return image if isinstance(image, AnalysisContext) else AnalysisContext(image)
+
+
 # ── Scene Type Detection ─────────────────────────────────────
 
-def detect_scene_type(img_array: np.ndarray, face_count: int) -> str:
+def detect_scene_type(image: Union[np.ndarray, AnalysisContext], face_count: int) -> str:
     """
     Classify scene type based on image characteristics and face count.
 
     Categories: portrait, group, landscape, detail, ceremony, reception, candid
     """
-    h, w = img_array.shape[:2]
+    ctx = _as_context(image)
+    h, w = ctx.img.shape[:2]
     aspect = w / h
 
-    # Convert to grayscale for analysis
-    gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY) if len(img_array.shape) == 3 else img_array
-
     # Compute image properties
-    edges = cv2.Canny(gray, 50, 150)
-    edge_density = np.sum(edges > 0) / edges.size
+    edges = ctx.edges(50, 150)
+    edge_density = cv2.countNonZero(edges) / edges.size
 
     # Colour analysis — check for warm tones (reception), greens (outdoor), etc.
-    if len(img_array.shape) == 3:
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_BGR2HSV)
-        avg_saturation = np.mean(hsv[:, :, 1])
-        avg_brightness = np.mean(hsv[:, :, 2])
+    if ctx.is_color:
+        _, avg_saturation, avg_brightness, _ = cv2.mean(ctx.hsv)
 
         # Green channel ratio (outdoor/landscape indicator)
-        green_ratio = np.mean(img_array[:, :, 1]) / (np.mean(img_array) + 1e-6)
+        means = ctx.channel_means
+        green_ratio = means[1] / (sum(means) / 3 + 1e-6)
     else:
         avg_saturation = 0
-        avg_brightness = np.mean(gray)
+        avg_brightness = cv2.mean(ctx.gray)[0]
         green_ratio = 1.0
 
     # Face-based classification
@@ -187,7 +228,7 @@ def detect_scene_type(img_array: np.ndarray, face_count: int) -> str:
 
 # ── Quality Scoring ──────────────────────────────────────────
 
-def score_quality(img_array: np.ndarray) -> dict:
+def score_quality(image: Union[np.ndarray, AnalysisContext]) -> dict:
     """
     Score image quality on multiple dimensions (0-100 each).
 
@@ -200,14 +241,15 @@ def score_quality(img_array: np.ndarray) -> dict:
             "composition": float,
         }
     """
-    gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY) if len(img_array.shape) == 3 else img_array
+    ctx = _as_context(image)
+    gray = ctx.gray
     h, w = gray.shape
 
     # ── Exposure score (check histogram spread and mean brightness)
-    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).flatten()
+    hist = ctx.gray_hist
     hist_norm = hist / hist.sum()
 
-    mean_brightness = np.mean(gray)
+    mean_brightness = float(np.dot(hist_norm, np.arange(256)))
     # Ideal range: 90-170
     if 90 <= mean_brightness <= 170:
         exposure_score = 90 + 10 * (1 - abs(mean_brightness - 128) / 42)
@@ -248,7 +290,7 @@ def score_quality(img_array: np.ndarray) -> dict:
 
     # ── Composition (rule of thirds interest points)
     # Check if high-contrast regions align with power points
-    edges = cv2.Canny(gray, 80, 200)
+    edges = ctx.edges(80, 200)
     third_h, third_w = h // 3, w // 3
 
     # Power zones (intersections of thirds)
@@ -259,8 +301,8 @@ def score_quality(img_array: np.ndarray) -> dict:
         edges[2*third_h-20:2*third_h+20, 2*third_w-20:2*third_w+20],
     ]
 
-    zone_activity = sum(np.sum(z > 0) for z in zones if z.size > 0)
-    total_edges = max(1, np.sum(edges > 0))
+    zone_activity = sum(cv2.countNonZero(z) for z in zones if z.size > 0)
+    total_edges = max(1, cv2.countNonZero(edges))
     thirds_ratio = zone_activity / total_edges
 
     composition_score = min(100, max(40, 50 + thirds_ratio * 500))
@@ -274,11 +316,11 @@ def score_quality(img_array: np.ndarray) -> dict:
     )
 
     return {
-        "overall": round(overall, 1),
-        "exposure": round(exposure_score, 1),
-        "sharpness": round(sharpness_score, 1),
-        "noise": round(noise_score, 1),
-        "composition": round(composition_score, 1),
+        "overall": round(float(overall), 1),
+        "exposure": round(float(exposure_score), 1),
+        "sharpness": round(float(sharpness_score), 1),
+        "noise": round(float(noise_score), 1),
+        "composition": round(float(composition_score), 1),
     }
 
 
@@ -295,14 +337,14 @@ def _get_face_cascade():
     return _face_cascade
 
 
-def detect_faces(img_array: np.ndarray) -> list[dict]:
+def detect_faces(image: Union[np.ndarray, AnalysisContext]) -> list[dict]:
     """
     Detect faces and return bounding boxes.
 
     Returns list of:
         {"bbox": [x, y, w, h], "eyes_open": True}
     """
-    gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY) if len(img_array.shape) == 3 else img_array
+    gray = _as_context(image).gray
 
     # Resize for speed if image is very large
     h, w = gray.shape
@@ -337,10 +379,14 @@ def detect_faces(img_array: np.ndarray) -> list[dict]:
 
 # ── Duplicate/Burst Grouping ─────────────────────────────────
 
-def compute_image_hash(img_array: np.ndarray) -> str:
-    """Compute a perceptual hash (pHash) for duplicate detection."""
-    # Resize to 32x32, greyscale
-    resized = cv2.resize(img_array, (32, 32))
+def compute_image_hash(image: Union[np.ndarray, AnalysisContext]) -> int:
+    """
+    Compute a 64-bit perceptual hash (pHash) for duplicate detection, packed
+    into an int — bit 63 is the first of the 8x8 low-frequency DCT terms.
+    """
+    # Resized to 32x32, then greyscale — in that order, so hashes stay
+    # comparable with the ones already stored
+    resized = cv2.resize(_as_context(image).img, (32, 32))
     if len(resized.shape) == 3:
         resized = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
 
@@ -349,57 +395,99 @@ def compute_image_hash(img_array: np.ndarray) -> str:
     dct_low = dct[:8, :8]
     median = np.median(dct_low)
     bits = (dct_low > median).flatten()
-    return "".join(str(int(b)) for b in bits)
+    return int(np.packbits(bits).view(">u8")[0])
 
 
-def hamming_distance(hash1: str, hash2: str) -> int:
+def _as_hash(value: Union[int, str, None]) -> Optional[int]:
+    """A packed hash — legacy 64-char '0'/'1' strings are converted."""
+    if value is None or value == "":
+        return None
+    return int(value, 2) if isinstance(value, str) else int(value)
+
+
+def hamming_distance(hash1: Union[int, str], hash2: Union[int, str]) -> int:
     """Count differing bits between two hashes."""
-    return sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
+    return (_as_hash(hash1) ^ _as_hash(hash2)).bit_count()
+
+
+def hamming_distances(hash_: Union[int, str, np.ndarray], hashes: np.ndarray) -> np.ndarray:
+    """Hamming distances from one hash to each hash in a uint64 array (vectorised popcount).
+
+    Given a uint64 array of hashes instead of one, returns the
+    len(hash_) x len(hashes) matrix of pairwise distances.
+    """
+    if isinstance(hash_, np.ndarray):
+        return np.bitwise_count(np.bitwise_xor(hash_[:, None], hashes[None, :]))
+    return np.bitwise_count(np.bitwise_xor(hashes, np.uint64(_as_hash(hash_))))
+
+
+# Photos compared against the group leaders per vectorised step
+_GROUPING_BLOCK = 512
 
 
 def group_duplicates(photos: list[dict], threshold: int = 10) -> dict[str, list[str]]:
     """
     Group photos by visual similarity using perceptual hashing.
 
+    Each photo joins the earliest group whose leader is fewer than
+    `threshold` bits away, or leads a new group. Photos are compared with
+    the leaders a block at a time — one vectorised XOR + popcount over a
+    uint64 matrix — and only leaders created within the current block are
+    checked one by one.
+
     Returns: {group_id: [photo_id, ...]}
     """
     if not photos:
         return {}
 
+    photo_hashes = [_as_hash(photo.get("_phash")) for photo in photos]
+    packed = np.array([h or 0 for h in photo_hashes], dtype=np.uint64)
+    leader_hashes = np.empty(len(photos), dtype=np.uint64)
+    leader_ids: list[str] = []
     groups: dict[str, list[str]] = {}
-    group_leaders: list[tuple[str, str]] = []  # (group_id, hash)
-
-    for photo in photos:
-        p_hash = photo.get("_phash", "")
-        p_id = photo["id"]
-
-        if not p_hash:
-            # Each unhashed photo is its own group
-            groups[p_id] = [p_id]
-            continue
 
-        matched = False
-        for leader_id, leader_hash in group_leaders:
-            if hamming_distance(p_hash, leader_hash) < threshold:
-                groups[leader_id].append(p_id)
-                matched = True
-                break
-
-        if not matched:
-            groups[p_id] = [p_id]
-            group_leaders.append((p_id, p_hash))
+    for start in range(0, len(photos), _GROUPING_BLOCK):
+        block = packed[start:start + _GROUPING_BLOCK]
+        known = len(leader_ids)
+        if known:
+            near = hamming_distances(block, leader_hashes[:known]) < threshold
+            earliest = np.where(near.any(axis=1), near.argmax(axis=1), -1)
+        else:
+            earliest = np.full(len(block), -1)
+
+        for offset, leader in enumerate(earliest.tolist()):
+            p_hash = photo_hashes[start + offset]
+            p_id = photos[start + offset]["id"]
+
+            if p_hash is None:
+                # Each unhashed photo is its own group
+                groups[p_id] = [p_id]
+                continue
+
+            if leader < 0:
+                # Not near an earlier block's leader — try this block's new ones
+                near_new = np.flatnonzero(hamming_distances(p_hash, leader_hashes[known:len(leader_ids)]) < threshold)
+                if near_new.size:
+                    leader = known + int(near_new[0])
+
+            if leader >= 0:
+                groups[leader_ids[leader]].append(p_id)
+            else:
+                groups[p_id] = [p_id]
+                leader_hashes[len(leader_ids)] = p_hash
+                leader_ids.append(p_id)
 
     return groups
 
 
 # ── Main Phase 0 Entry Point ─────────────────────────────────
 
-def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
+def analyse_image(image: Union[bytes, str], filename: str = "") -> dict:
     """
     Run full Phase 0 analysis on a single image.
 
     Args:
-        image_bytes: Raw file bytes
+        image: Raw file bytes, or a local path (large RAWs are streamed to disk)
         filename: Original filename (used to detect RAW format)
 
     Returns:
@@ -410,71 +498,55 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
             "quality_details": {...},
             "face_data": [...],
             "face_count": int,
-            "phash": str,
+            "phash": int,        # packed 64-bit pHash
             "width": int,
             "height": int,
             "is_raw": bool,
             "web_preview_bytes": bytes | None,  # JPEG preview for RAW files
         }
     """
-    is_raw = is_raw_file(filename) if filename else False
     web_preview_bytes = None
 
-    # Decode image
-    img = None
-    nparr = np.frombuffer(image_bytes, np.uint8)
-
-    if not is_raw:
-        # Try standard decode first (JPEG, PNG, TIFF, etc.)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    # Analysis (face detection, scene, quality) doesn't need full resolution —
+    # images are resized to this before analysing, which also prevents OOM
+    # on memory-constrained containers
+    MAX_ANALYSIS_DIM = 1600
+    # RAWs also get a web preview, so their decode has to cover that size
+    RAW_PREVIEW_DIM = 2048
 
+    # Decode at the smallest scale that covers what's needed: a reduced-DCT
+    # JPEG, or a RAW's embedded preview / half-size demosaic
+    handle = ImageHandle(image, filename)
+    img = handle.at_least(RAW_PREVIEW_DIM if handle.is_raw else MAX_ANALYSIS_DIM)
     if img is None:
-        # Either it's a known RAW or cv2 couldn't decode it — try rawpy
-        img = decode_raw(image_bytes)
-        if img is not None:
-            is_raw = True
-        else:
-            # Last resort: PIL (may only get thumbnail for some formats)
-            try:
-                pil_img = Image.open(io.BytesIO(image_bytes))
-                pil_img = pil_img.convert("RGB")
-                img = np.array(pil_img)[:, :, ::-1]  # RGB → BGR for OpenCV
-                log.warning(f"Fell back to PIL for {filename} — image may be low resolution ({img.shape[1]}x{img.shape[0]})")
-            except Exception:
-                log.error(f"Failed to decode image: {filename}")
-                return {"error": "Failed to decode image"}
-
-    h, w = img.shape[:2]
+        return {"error": "Failed to decode image"}
+    is_raw = handle.is_raw
+    w, h = handle.size
 
     # For RAW files, generate a web-viewable JPEG preview
     if is_raw:
         try:
-            web_preview_bytes = generate_web_preview(img, max_dimension=2048, quality=92)
+            web_preview_bytes = generate_web_preview(handle.fit(2048), max_dimension=2048, quality=92)
             log.info(f"Generated web preview for RAW {filename}: {len(web_preview_bytes)} bytes")
         except Exception as e:
             log.error(f"Failed to generate web preview for {filename}: {e}")
 
-    # Resize for analysis to prevent OOM on memory-constrained containers
-    # Analysis (face detection, scene, quality) doesn't need full resolution
-    MAX_ANALYSIS_DIM = 1600
-    if max(h, w) > MAX_ANALYSIS_DIM:
-        scale = MAX_ANALYSIS_DIM / max(h, w)
-        analysis_img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-    else:
-        analysis_img = img
-    # Free full-res immediately
+    analysis_img = handle.fit(MAX_ANALYSIS_DIM)
+    # Free the larger decodes immediately
     del img
+    handle.release()
 
-    # Run all analyses on the resized image
-    exif = extract_exif(image_bytes)
-    faces = detect_faces(analysis_img)
+    # Run all analyses on the resized image, sharing its derived representations
+    exif = extract_exif(image)
+    ctx = AnalysisContext(analysis_img)
+    faces = detect_faces(ctx)
     face_count = len(faces)
-    scene = detect_scene_type(analysis_img, face_count)
-    quality = score_quality(analysis_img)
-    phash = compute_image_hash(analysis_img)
+    scene = detect_scene_type(ctx, face_count)
+    quality = score_quality(ctx)
+    phash = compute_image_hash(ctx)
 
     # Image characteristics for adaptive editing
-    characteristics = _compute_image_characteristics(analysis_img)
+    characteristics = _compute_image_characteristics(ctx)
 
     return {
         "exif_data": exif,
@@ -492,60 +564,60 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
     }
 
 
-def _compute_image_characteristics(img: np.ndarray) -> dict:
+def _compute_image_characteristics(image: Union[np.ndarray, AnalysisContext]) -> dict:
     """Compute image characteristics used by adaptive preset system."""
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB).astype(np.float32)
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    ctx = _as_context(image)
+    L = ctx.lab[:, :, 0]
+    h_img, w_img = ctx.img.shape[:2]
 
-    L = lab[:, :, 0]
-    h_img, w_img = img.shape[:2]
+    # Luminance statistics come from the L histogram — no float copies or sorts
+    hist = ctx.lightness_hist
+    hist_norm = hist / hist.sum()
+    levels = np.arange(256)
 
     # Brightness
-    mean_brightness = float(np.mean(L))
+    mean_brightness = float(np.dot(hist_norm, levels))
     # How underexposed (0=correct, negative=under, positive=over)
     exposure_bias = (mean_brightness - 128.0) / 128.0  # -1 to +1
 
     # Contrast (std dev of luminance)
-    contrast = float(np.std(L))
+    contrast = float(np.sqrt(np.dot(hist_norm, (levels - mean_brightness) ** 2)))
     is_low_contrast = contrast < 35
     is_high_contrast = contrast > 65
 
     # Clipping
-    dark_clip = float(np.mean(L < 10))    # % of pixels near black
-    bright_clip = float(np.mean(L > 245))  # % of pixels near white
+    dark_clip = float(hist_norm[:10].sum())    # % of pixels near black
+    bright_clip = float(hist_norm[246:].sum())  # % of pixels near white
 
     # Backlit detection — bright background, dark foreground
     center_h, center_w = h_img // 4, w_img // 4
     center_L = L[center_h:3*center_h, center_w:3*center_w]
     edge_L = np.mean([
-        np.mean(L[:center_h, :]),           # top
-        np.mean(L[3*center_h:, :]),         # bottom
-        np.mean(L[:, :center_w]),           # left
-        np.mean(L[:, 3*center_w:]),         # right
+        cv2.mean(L[:center_h, :])[0],           # top
+        cv2.mean(L[3*center_h:, :])[0],         # bottom
+        cv2.mean(L[:, :center_w])[0],           # left
+        cv2.mean(L[:, 3*center_w:])[0],         # right
     ])
-    center_mean = float(np.mean(center_L))
+    center_mean = float(cv2.mean(center_L)[0])
     is_backlit = edge_L > center_mean + 30
 
     # Colour temperature estimate from white balance
     # LAB b channel: negative=blue/cool, positive=yellow/warm
-    wb_warmth = float(np.mean(lab[:, :, 2]))  # >128 = warm, <128 = cool
-    wb_tint = float(np.mean(lab[:, :, 1]))    # >128 = green-magenta
+    _, wb_tint, wb_warmth, _ = cv2.mean(ctx.lab)  # b >128 = warm, <128 = cool; a >128 = green-magenta
 
     # Saturation
-    mean_saturation = float(np.mean(hsv[:, :, 1]))
+    mean_saturation = float(cv2.mean(ctx.hsv)[1])
     is_desaturated = mean_saturation < 40
     is_oversaturated = mean_saturation > 180
 
     # Noise estimate (quick)
-    noise_sigma = float(np.mean(np.abs(
-        gray.astype(float) - cv2.GaussianBlur(gray, (5, 5), 0).astype(float)
-    )))
+    gray = ctx.gray
+    noise_sigma = float(cv2.mean(cv2.absdiff(gray, cv2.GaussianBlur(gray, (5, 5), 0)))[0])
     is_noisy = noise_sigma > 8
 
     # Dynamic range
-    p2 = float(np.percentile(L, 2))
-    p98 = float(np.percentile(L, 98))
+    p2 = _hist_percentile(hist, 2)
+    p98 = _hist_percentile(hist, 98)
     dynamic_range = p98 - p2
 
     return {
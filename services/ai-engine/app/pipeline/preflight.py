@@ -0,0 +1,256 @@
+"""
+Pre-flight scan — per-photo metadata from the first few hundred KB of each original.
+
+Before any pixel work, every photo in the gallery gets one range request
+for its first PREFLIGHT_HEAD_BYTES (JPEG APP1 and RAW/TIFF IFDs sit at the
+start of the file), and the header is parsed without decoding the image:
+  - dimensions, capture time, camera, RAW/JPEG type and total file size
+  - the usual EXIF fields, written to photos.exif_data straight away —
+    the whole gallery has them within seconds, long before Phase 0 runs
+
+Results are stored under exif_data.preflight (tagged with PREFLIGHT_VERSION)
+so a resumed or re-queued run reuses them instead of re-reading headers.
+The pipeline uses them to estimate each photo's processing cost (RAW and
+high-megapixel files cost more), to weigh its fair-share scheduler slots,
+and to order work largest-first while keeping bursts together.
+
+photos.file_size is never written here — it is part of every checkpoint's
+input fingerprint, so filling it in would invalidate finished work.
+"""
+import asyncio
+import io
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from PIL import Image
+
+from app.config import get_async_supabase, get_settings
+from app.pipeline.cancellation import CancelToken
+from app.pipeline.decoder import MAGIC_BYTES, detect_format
+from app.pipeline.phase0_analysis import EXIF_IFD, exif_fields
+from app.storage.write_buffer import WriteBehindBuffer
+
+logger = logging.getLogger("apelier.preflight")
+
+PREFLIGHT_VERSION = 1
+
+PREFLIGHT_PHOTO_COLUMNS = "id,gallery_id,photographer_id,original_key,filename,file_size,width,height,exif_data"
+
+# Consecutive frames from one camera at most this far apart form a burst
+BURST_GAP_S = 2.0
+
+# Cost model — 1.0 is a 24 MP JPEG; a RAW pays for demosaicing and the
+# JPEG conversion on top of the same analysis work
+REFERENCE_MEGAPIXELS = 24.0
+RAW_COST_FACTOR = 3.0
+# Rough compressed sizes, for estimating megapixels when the header has no dimensions
+RAW_BYTES_PER_MEGAPIXEL = 1.25e6
+JPEG_BYTES_PER_MEGAPIXEL = 0.4e6
+# Smaller dimensions in a RAW header belong to an embedded thumbnail
+MIN_RAW_MEGAPIXELS = 2.0
+
+_EXIF_IMAGE_WIDTH = 0xA002
+_EXIF_IMAGE_HEIGHT = 0xA003
+
+
+class PhotoMeta:
+    """What the pre-flight scan learned about one photo."""
+    __slots__ = ("photo_id", "is_raw", "file_size", "width", "height", "captured_at", "camera", "cost")
+
+    def __init__(self, photo_id: str, is_raw: bool, file_size: Optional[int] = None,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 captured_at: Optional[str] = None, camera: Optional[str] = None):
+        self.photo_id = photo_id
+        self.is_raw = is_raw
+        self.file_size = file_size
+        self.width = width
+        self.height = height
+        self.captured_at = captured_at
+        self.camera = camera
+        self.cost = estimate_cost(is_raw, width, height, file_size)
+
+    @classmethod
+    def from_record(cls, photo_id: str, record: dict) -> "PhotoMeta":
+        return cls(
+            photo_id, record.get("kind") == "raw", record.get("file_size"),
+            record.get("width"), record.get("height"), record.get("captured_at"), record.get("camera"),
+        )
+
+    @property
+    def record(self) -> dict:
+        """The exif_data.preflight entry for this photo."""
+        return {
+            "version": PREFLIGHT_VERSION,
+            "kind": "raw" if self.is_raw else "jpeg",
+            "file_size": self.file_size,
+            "width": self.width,
+            "height": self.height,
+            "captured_at": self.captured_at,
+            "camera": self.camera,
+            "cost": self.cost,
+        }
+
+    @property
+    def timestamp(self) -> Optional[float]:
+        return _parse_exif_time(self.captured_at)
+
+
+def estimate_cost(is_raw: bool, width: Optional[int], height: Optional[int], file_size: Optional[int]) -> float:
+    """Relative processing cost of a photo (1.0 = a 24 MP JPEG)."""
+    if width and height:
+        megapixels = width * height / 1e6
+    elif file_size:
+        megapixels = file_size / (RAW_BYTES_PER_MEGAPIXEL if is_raw else JPEG_BYTES_PER_MEGAPIXEL)
+    else:
+        megapixels = REFERENCE_MEGAPIXELS
+    cost = max(megapixels, 1.0) / REFERENCE_MEGAPIXELS
+    return round(cost * (RAW_COST_FACTOR if is_raw else 1.0), 3)
+
+
+def parse_header(photo_id: str, head: bytes, filename: str, file_size: Optional[int]) -> tuple[PhotoMeta, dict]:
+    """Parse the first bytes of an original into (PhotoMeta, EXIF fields).
+
+    Only headers are read — PIL stops at the first frame marker / IFD, and a
+    truncated or unrecognised file (e.g. CR3) just yields fewer fields.
+    """
+    is_raw = detect_format(head[:MAGIC_BYTES], filename) == "raw"
+    width = height = None
+    exif = {}
+    try:
+        img = Image.open(io.BytesIO(head))
+        width, height = img.size
+        raw_exif = img.getexif()
+        exif = exif_fields(raw_exif)
+        # IFD0 of a RAW describes its thumbnail; the Exif IFD has the real size
+        sub_ifd = raw_exif.get_ifd(EXIF_IFD)
+        if sub_ifd.get(_EXIF_IMAGE_WIDTH) and sub_ifd.get(_EXIF_IMAGE_HEIGHT):
+            width, height = int(sub_ifd[_EXIF_IMAGE_WIDTH]), int(sub_ifd[_EXIF_IMAGE_HEIGHT])
+    except Exception as e:
+        logger.debug(f"Pre-flight header parse failed for {filename}: {e}")
+
+    if is_raw and width and height and width * height < MIN_RAW_MEGAPIXELS * 1e6:
+        width = height = None
+
+    camera = " ".join(str(exif[k]).strip() for k in ("Make", "Model") if exif.get(k)) or None
+    meta = PhotoMeta(
+        photo_id, is_raw, file_size, width, height,
+        captured_at=exif.get("DateTimeOriginal") or exif.get("DateTime"),
+        camera=camera,
+    )
+    return meta, exif
+
+
+def order_for_processing(photos: list[dict], metas: dict[str, PhotoMeta]) -> list[dict]:
+    """Order photos largest work first, keeping each burst together in capture order.
+
+    A burst is consecutive frames from one camera at most BURST_GAP_S apart;
+    it is ranked by its most expensive frame. Photos without metadata keep
+    their relative order after everything else of equal cost.
+    """
+    timed, groups = [], []
+    for photo in photos:
+        meta = metas.get(photo["id"])
+        if meta is not None and meta.timestamp is not None:
+            timed.append((meta.camera or "", meta.timestamp, photo))
+        else:
+            groups.append([photo])
+
+    timed.sort(key=lambda t: (t[0], t[1]))
+    bursts, prev = [], None
+    for camera, ts, photo in timed:
+        if prev is not None and camera == prev[0] and ts - prev[1] <= BURST_GAP_S:
+            bursts[-1].append(photo)
+        else:
+            bursts.append([photo])
+        prev = (camera, ts)
+
+    def group_cost(group: list[dict]) -> float:
+        return max(photo_cost(metas, photo) for photo in group)
+
+    # sorted() is stable, so equal-cost groups keep their order
+    ordered = sorted(bursts + groups, key=group_cost, reverse=True)
+    return [photo for group in ordered for photo in group]
+
+
+def photo_cost(metas: dict[str, PhotoMeta], photo: dict) -> float:
+    """A photo's scheduler cost — 1.0 when the pre-flight scan knows nothing about it."""
+    meta = metas.get(photo["id"])
+    return meta.cost if meta is not None else 1.0
+
+
+async def run_preflight(gallery_id: str, filters: dict, bucket: str,
+                        cancel_token: Optional[CancelToken] = None) -> dict[str, PhotoMeta]:
+    """Scan every photo matching `filters` and return {photo_id: PhotoMeta}.
+
+    Headers are read PREFLIGHT_CONCURRENCY at a time; EXIF fields (and any
+    missing width / height) are written per page as batched updates. A photo
+    whose header can't be read gets no PhotoMeta and is retried next run.
+    """
+    s = get_settings()
+    asb = get_async_supabase()
+    t_start = time.time()
+    head_bytes = max(4096, s.preflight_head_bytes)
+    slots = asyncio.Semaphore(max(1, s.preflight_concurrency))
+    writes = WriteBehindBuffer("photos")
+    metas: dict[str, PhotoMeta] = {}
+    scanned = reused = failed = 0
+
+    async def scan(photo: dict) -> Optional[PhotoMeta]:
+        async with slots:
+            head = await asb.storage_read_head(bucket, photo["original_key"], head_bytes)
+        if head is None:
+            return None
+        data, total = head
+        meta, exif = parse_header(photo["id"], data, photo.get("filename", ""), total or photo.get("file_size"))
+        fields = {"exif_data": {**(photo.get("exif_data") or {}), **exif, "preflight": meta.record}}
+        if meta.width and meta.height and not photo.get("width"):
+            fields["width"], fields["height"] = meta.width, meta.height
+        writes.update(photo["id"], fields)
+        return meta
+
+    pages = asb.select_pages("photos", columns=PREFLIGHT_PHOTO_COLUMNS, filters={"gallery_id": gallery_id, **filters})
+    try:
+        async for page in pages:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            todo = []
+            for photo in page:
+                record = (photo.get("exif_data") or {}).get("preflight") or {}
+                if record.get("version") == PREFLIGHT_VERSION:
+                    metas[photo["id"]] = PhotoMeta.from_record(photo["id"], record)
+                    reused += 1
+                else:
+                    todo.append(photo)
+
+            results = await asyncio.gather(*(scan(p) for p in todo), return_exceptions=True)
+            for photo, result in zip(todo, results):
+                if isinstance(result, PhotoMeta):
+                    metas[photo["id"]] = result
+                    scanned += 1
+                else:
+                    if isinstance(result, BaseException):
+                        logger.warning(f"Pre-flight read failed for {photo['id']}: {result}")
+                    failed += 1
+            await asyncio.to_thread(writes.flush)
+    finally:
+        await pages.aclose()
+
+    total_bytes = sum(m.file_size or 0 for m in metas.values())
+    logger.info(
+        f"Pre-flight: {len(metas)} photos ({scanned} scanned, {reused} cached, {failed} failed), "
+        f"{sum(m.is_raw for m in metas.values())} RAW, {total_bytes / 1e9:.2f} GB, "
+        f"estimated cost {sum(m.cost for m in metas.values()):.1f} in {time.time() - t_start:.1f}s"
+    )
+    return metas
+
+
+def _parse_exif_time(value) -> Optional[float]:
+    """EXIF "YYYY:MM:DD HH:MM:SS" as a POSIX timestamp (camera local time, compared as-is)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip()[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
@@ -0,0 +1,121 @@
+"""
+Progress reporter — throttled, off-loop writes to processing_jobs.
+
+The pipeline updates counters in memory; a background writer thread sends
+the latest snapshot to processing_jobs:
+  - immediately on phase transitions
+  - every PROGRESS_FLUSH_EVERY photos
+  - otherwise at most once per PROGRESS_FLUSH_INTERVAL_MS
+  - always on terminal states (completed / failed / canceled), after any pending progress
+
+Updates made while a write is in flight are coalesced into the next one,
+so a slow Supabase round trip never stalls image processing.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import get_settings, supabase
+
+logger = logging.getLogger("apelier.progress")
+
+
+class ProgressReporter:
+    """Coalescing progress writer for a single processing job."""
+
+    def __init__(self, processing_job_id: str, interval_ms: Optional[int] = None, every: Optional[int] = None):
+        s = get_settings()
+        self.processing_job_id = processing_job_id
+        self.interval = (interval_ms if interval_ms is not None else s.progress_flush_interval_ms) / 1000
+        self.every = max(1, every or s.progress_flush_every)
+
+        self._cond = threading.Condition()
+        self._pending: dict = {}
+        self._urgent = False
+        self._closed = False
+        self._last_flush = 0.0
+        self._last_sent_processed = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"progress-{processing_job_id[:8]}", daemon=True,
+        )
+        self._thread.start()
+
+    # ── Hot-path API (never blocks on I/O) ──
+
+    def phase(self, phase: str, processed_images: int):
+        """Record a phase transition — flushed right away."""
+        with self._cond:
+            self._pending.update({
+                "current_phase": phase,
+                "processed_images": processed_images,
+                "status": "processing",
+            })
+            self._urgent = True
+            self._cond.notify()
+
+    def advance(self, processed_images: int):
+        """Record progress within the current phase — flushed when due."""
+        with self._cond:
+            self._pending.update({"processed_images": processed_images, "status": "processing"})
+            if processed_images - self._last_sent_processed >= self.every:
+                self._urgent = True
+            self._cond.notify()
+
+    async def finish(self, status: str, error: Optional[str] = None):
+        """Write the terminal status (after pending progress) and stop the writer."""
+        data = {"status": status}
+        if error:
+            data["error_log"] = error
+        if status in ("completed", "failed", "canceled"):
+            data["completed_at"] = datetime.now(timezone.utc).isoformat()
+        with self._cond:
+            self._pending.update(data)
+            self._urgent = True
+            self._closed = True
+            self._cond.notify()
+        await asyncio.to_thread(self._thread.join)
+
+    def abandon(self):
+        """Stop the writer and drop anything pending — the job row now belongs to someone else."""
+        with self._cond:
+            self._pending = {}
+            self._closed = True
+            self._cond.notify()
+
+    def close(self):
+        """Stop the writer once anything pending has been sent. Safe to call twice."""
+        with self._cond:
+            self._closed = True
+            self._urgent = True
+            self._cond.notify()
+
+    # ── Writer thread ──
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        wait = 0.0 if self._urgent else self._last_flush + self.interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    elif self._closed:
+                        return
+                    else:
+                        wait = None
+                    self._cond.wait(timeout=wait)
+                data, self._pending, self._urgent = self._pending, {}, False
+                if "processed_images" in data:
+                    self._last_sent_processed = data["processed_images"]
+                self._last_flush = time.monotonic()
+            self._write(data)
+
+    def _write(self, data: dict):
+        try:
+            supabase.update("processing_jobs", self.processing_job_id, data)
+        except Exception as e:
+            logger.warning(f"Failed to update job progress: {e}")
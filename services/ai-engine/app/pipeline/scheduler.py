@@ -0,0 +1,293 @@
+"""
+Fair scheduler — weighted fair queuing of pipeline windows across photographers.
+
+Every pipeline asks for a slot before processing each window of photos.
+There are SCHEDULER_SLOTS slots across the whole engine, and a photographer
+never holds more than SCHEDULER_MAX_PER_PHOTOGRAPHER at once. When a slot
+frees up it goes to the waiting request with the smallest virtual finish
+tag (start tag + cost / weight), so:
+  - a 3,000-photo gallery and a 50-photo session interleave window by window
+    instead of first-come-first-served
+  - a photographer arriving while a large job runs is served next, not last
+  - higher subscription tiers get a proportionally larger share
+
+Pipelines run in separate threads with their own event loops, so the
+scheduler is thread-safe and the async `slot()` waits off the event loop.
+A wait can be abandoned through a cancel event (PipelineCancelled), and
+cancelling the awaiting task abandons the waiting thread too — a slot it
+is granted anyway is given straight back.
+
+Interactive work (restyle clicks) runs in a separate priority lane:
+  - it has its own INTERACTIVE_SLOTS reservation and never queues behind
+    batch windows
+  - while any interactive request is running, no new batch window starts
+    and running pipelines pause at photo boundaries (`yield_to_interactive`),
+    so the CPU goes to the click — for at most INTERACTIVE_YIELD_MAX_MS at a
+    time, so a stream of clicks can't starve batch work
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+
+from app.config import get_settings
+from app.pipeline.cancellation import CancelToken
+
+logger = logging.getLogger("apelier.scheduler")
+
+TIER_WEIGHTS = {
+    "free": 1.0,
+    "starter": 1.0,
+    "professional": 2.0,
+    "studio": 3.0,
+    "enterprise": 4.0,
+}
+
+
+class _Request:
+    __slots__ = ("tenant", "start_tag", "finish_tag", "seq", "granted")
+
+    def __init__(self, tenant: str, start_tag: float, finish_tag: float, seq: int):
+        self.tenant = tenant
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.granted = False
+
+
+class _Handoff:
+    """A blocking wait run in a worker thread for an async caller. Guarded by the scheduler lock."""
+    __slots__ = ("abandoned", "granted")
+
+    def __init__(self):
+        self.abandoned = False
+        self.granted = False
+
+    def take(self) -> bool:
+        """Called by the thread once granted — False if the caller already gave up."""
+        if self.abandoned:
+            return False
+        self.granted = True
+        return True
+
+
+class FairScheduler:
+    """Weighted fair queuing with per-tenant concurrency caps."""
+
+    def __init__(self, slots: int, max_per_tenant: int,
+                 interactive_slots: int = 2, interactive_yield_max_s: float = 5.0):
+        self.slots = max(1, slots)
+        self.max_per_tenant = max(1, max_per_tenant)
+        self.interactive_slots = max(1, interactive_slots)
+        self.interactive_yield_max_s = interactive_yield_max_s
+        self._interactive_active = 0
+        self._interactive_waiting = 0
+        self._interactive_since: Optional[float] = None
+        self._cond = threading.Condition()
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._running: dict[str, int] = {}
+        self._in_use = 0
+        self._waiting: list[_Request] = []
+        self._seq = itertools.count()
+
+    def acquire(self, tenant: str, cost: float = 1.0, weight: float = 1.0,
+                cancel: Optional[CancelToken] = None):
+        """Block until `tenant` is granted a slot for work of the given cost.
+
+        Raises PipelineCancelled (without holding a slot) if `cancel` is set
+        while waiting.
+        """
+        self._acquire(tenant, cost, weight, cancel, None)
+
+    def _acquire(self, tenant: str, cost: float, weight: float,
+                 cancel: Optional[CancelToken], handoff: Optional[_Handoff]):
+        with self._cond:
+            start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            finish = start + max(cost, 1e-6) / max(weight, 1e-6)
+            self._last_finish[tenant] = finish
+            req = _Request(tenant, start, finish, next(self._seq))
+            self._waiting.append(req)
+            self._dispatch()
+            while not req.granted:
+                if (cancel is not None and cancel.is_cancelled) or (handoff is not None and handoff.abandoned):
+                    self._waiting.remove(req)
+                    self._dispatch()
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    return
+                self._cond.wait(timeout=0.5)
+                # Re-check: an interactive hold may have expired
+                self._dispatch()
+            if handoff is not None and not handoff.take():
+                self.release(tenant)
+
+    def release(self, tenant: str):
+        with self._cond:
+            self._in_use -= 1
+            self._running[tenant] -= 1
+            if not self._running[tenant]:
+                del self._running[tenant]
+            self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant: str, cost: float = 1.0, weight: float = 1.0,
+                   cancel: Optional[CancelToken] = None):
+        """Async context manager holding a slot for the duration of the block."""
+        await self._wait_in_thread(self._acquire, lambda: self.release(tenant), tenant, cost, weight, cancel)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+    # ── Interactive lane ──
+
+    def acquire_interactive(self):
+        """Block until an interactive slot is free — only waits on other interactive work."""
+        self._acquire_interactive(None)
+
+    def _acquire_interactive(self, handoff: Optional[_Handoff]):
+        with self._cond:
+            self._interactive_waiting += 1
+            self._mark_interactive()
+            while self._interactive_active >= self.interactive_slots:
+                if handoff is not None and handoff.abandoned:
+                    self._interactive_waiting -= 1
+                    if not self.interactive_busy:
+                        self._interactive_since = None
+                    self._dispatch()
+                    return
+                self._cond.wait()
+            self._interactive_waiting -= 1
+            self._interactive_active += 1
+            if handoff is not None and not handoff.take():
+                self.release_interactive()
+
+    def release_interactive(self):
+        with self._cond:
+            self._interactive_active -= 1
+            if not self.interactive_busy:
+                self._interactive_since = None
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def interactive(self):
+        """Async context manager running the block in the interactive lane."""
+        with self._cond:
+            free = self._interactive_active < self.interactive_slots
+            if free:
+                self._mark_interactive()
+                self._interactive_active += 1
+        if not free:
+            await self._wait_in_thread(self._acquire_interactive, self.release_interactive)
+        try:
+            yield
+        finally:
+            self.release_interactive()
+
+    @property
+    def interactive_busy(self) -> bool:
+        return self._interactive_active > 0 or self._interactive_waiting > 0
+
+    def wait_for_interactive(self, cancel: Optional[CancelToken] = None):
+        """Block a batch pipeline while interactive work holds priority."""
+        self._wait_for_interactive(cancel, None)
+
+    def _wait_for_interactive(self, cancel: Optional[CancelToken], handoff: Optional[_Handoff]):
+        with self._cond:
+            while self._batch_held():
+                if (cancel is not None and cancel.is_cancelled) or (handoff is not None and handoff.abandoned):
+                    return
+                self._cond.wait(timeout=0.5)
+
+    async def yield_to_interactive(self, cancel: Optional[CancelToken] = None):
+        """Batch-side checkpoint — pause here if interactive work is running."""
+        if self.interactive_busy:
+            await self._wait_in_thread(self._wait_for_interactive, None, cancel)
+
+    async def _wait_in_thread(self, wait, give_back, *args):
+        """Run a blocking `wait(*args, handoff)` off the event loop.
+
+        If the awaiting task is cancelled, the thread is told to stop waiting;
+        whatever it was granted meanwhile is handed to `give_back` — by this
+        coroutine or by the thread, whichever sees it second.
+        """
+        handoff = _Handoff()
+        try:
+            await asyncio.to_thread(wait, *args, handoff)
+        except asyncio.CancelledError:
+            with self._cond:
+                handoff.abandoned = True
+                granted = handoff.granted
+                self._cond.notify_all()
+            if granted and give_back is not None:
+                give_back()
+            raise
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "in_use": self._in_use,
+                "waiting": len(self._waiting),
+                "running_by_photographer": dict(self._running),
+                "interactive_slots": self.interactive_slots,
+                "interactive_active": self._interactive_active,
+                "interactive_waiting": self._interactive_waiting,
+            }
+
+    def _mark_interactive(self):
+        """Start the priority hold if this is the first interactive request. Caller holds the lock."""
+        if self._interactive_since is None:
+            self._interactive_since = time.monotonic()
+
+    def _batch_held(self) -> bool:
+        """Whether batch work should hold off for interactive work. Caller holds the lock."""
+        if not self.interactive_busy or self._interactive_since is None:
+            return False
+        return time.monotonic() - self._interactive_since < self.interactive_yield_max_s
+
+    def _dispatch(self):
+        """Grant free slots to eligible waiters in finish-tag order. Caller holds the lock."""
+        granted = False
+        # Interactive work has priority — batch windows start once it's done
+        while self._in_use < self.slots and not self._batch_held():
+            eligible = [r for r in self._waiting if self._running.get(r.tenant, 0) < self.max_per_tenant]
+            if not eligible:
+                break
+            req = min(eligible, key=lambda r: (r.finish_tag, r.seq))
+            self._waiting.remove(req)
+            req.granted = True
+            self._in_use += 1
+            self._running[req.tenant] = self._running.get(req.tenant, 0) + 1
+            self._virtual_time = max(self._virtual_time, req.start_tag)
+            granted = True
+        if not self._waiting and not self._in_use:
+            # Idle — forget history so old tags don't penalise anyone
+            self._last_finish.clear()
+        if granted:
+            self._cond.notify_all()
+
+
+_scheduler: Optional[FairScheduler] = None
+
+
+def get_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        s = get_settings()
+        _scheduler = FairScheduler(
+            s.scheduler_slots,
+            s.scheduler_max_per_photographer,
+            interactive_slots=s.interactive_slots,
+            interactive_yield_max_s=s.interactive_yield_max_ms / 1000,
+        )
+    return _scheduler
+
+
+def tier_weight(tier: Optional[str]) -> float:
+    return TIER_WEIGHTS.get(tier or "free", 1.0)
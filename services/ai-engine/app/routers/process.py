@@ -3,18 +3,72 @@ Processing API routes — trigger and monitor gallery processing.
 """
 import asyncio
 import logging
-from threading import Thread
+import os
+from datetime import datetime, timezone
 from fastapi import APIRouter, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional
 
+from app.pipeline import cancellation
 from app.pipeline.orchestrator import run_pipeline
-from app.storage.db import get_gallery_photos, get_gallery
-from app.config import get_supabase
+from app.pipeline.scheduler import get_scheduler
+from app.storage.db import count_gallery_photos_async, get_gallery_async, iter_gallery_photos_async
+from app.storage.object_cache import get_object_cache
+from app.storage.supabase_storage import get_signed_urls_async
+from app.config import close_async_supabase, get_async_supabase, get_limiter, get_supabase
+from app.workers.job_queue import QUEUED, RUNNING, PermanentJobError, get_job_queue, register_handler
 
 router = APIRouter()
 log = logging.getLogger(__name__)
 
+GALLERY_JOB = "gallery_pipeline"
+
+
+def _gallery_dedupe_key(gallery_id: str) -> str:
+    return f"gallery:{gallery_id}"
+
+
+def run_gallery_job(job_id: str, payload: dict):
+    """Job queue handler — runs the pipeline.
+
+    A transient failure (Supabase overloaded or unreachable) raises so the
+    queue retries it; anything else fails the job for good.
+    """
+    queue = get_job_queue()
+    token = cancellation.register(job_id)
+    # Cancelled after the worker claimed it but before the token existed
+    reason = queue.cancel_reason(job_id)
+    if reason:
+        token.cancel(reason)
+    retryable = queue.retries_left(job_id) > 0
+
+    async def run() -> str:
+        try:
+            return await run_pipeline(
+                processing_job_id=payload["processing_job_id"],
+                gallery_id=payload["gallery_id"],
+                style_profile_id=payload.get("style_profile_id"),
+                settings_override=payload.get("settings"),
+                included_images=payload.get("included_images"),
+                cancel_token=token,
+                retryable=retryable,
+            )
+        finally:
+            # The worker's event loop ends with this job — close its async client
+            await close_async_supabase()
+
+    try:
+        status = asyncio.run(run())
+    finally:
+        cancellation.unregister(job_id)
+    if status == "retry":
+        raise RuntimeError(f"Pipeline for gallery {payload['gallery_id']} hit a transient error")
+    if status not in ("completed", "canceled"):
+        raise PermanentJobError(f"Pipeline for gallery {payload['gallery_id']} finished with status '{status}'")
+
+
+register_handler(GALLERY_JOB, run_gallery_job)
+
 
 class ProcessRequest(BaseModel):
     gallery_id: str
@@ -32,23 +86,23 @@ class ProcessResponse(BaseModel):
 
 @router.post("/gallery", response_model=ProcessResponse)
 async def process_gallery(request: ProcessRequest, background_tasks: BackgroundTasks):
-    gallery = get_gallery(request.gallery_id)
+    gallery = await get_gallery_async(request.gallery_id)
     if not gallery:
         return ProcessResponse(
             job_id="", status="error",
             message=f"Gallery {request.gallery_id} not found", total_images=0,
         )
 
-    photos = get_gallery_photos(request.gallery_id)
-    if not photos:
+    # Counts only — a 10k-photo gallery isn't fetched just to size the job
+    total = await count_gallery_photos_async(request.gallery_id)
+    if not total:
         return ProcessResponse(
             job_id="", status="error",
             message="No photos found in gallery. Upload photos first.", total_images=0,
         )
 
     # Count only unprocessed photos (no edited_key yet)
-    unprocessed = [p for p in photos if not p.get("edited_key")]
-    total = len(photos)
+    unprocessed = await count_gallery_photos_async(request.gallery_id, {"edited_key": "is.null"})
 
     if not unprocessed:
         return ProcessResponse(
@@ -56,10 +110,21 @@ async def process_gallery(request: ProcessRequest, background_tasks: BackgroundT
             message="All photos already processed", total_images=total,
         )
 
-    sb = get_supabase()
+    # Already running? Preempt it — the new submission supersedes it. The
+    # old run stops at its next photo boundary; the queue doesn't start the
+    # new job until it has, so the two never write the same rows, and the
+    # new one resumes from the checkpoints it leaves behind.
+    queue = get_job_queue()
+    active = queue.find_active(_gallery_dedupe_key(request.gallery_id))
+    if active and active["status"] == RUNNING:
+        queue.cancel(active["id"], cancellation.PREEMPTED)
+        cancellation.cancel(active["id"], cancellation.PREEMPTED)
+        log.info(f"Preempting running job {active['id']} for gallery {request.gallery_id}")
+
+    sb = get_async_supabase()
 
     # Check for existing processing job for this gallery — reuse it instead of creating a new one
-    existing_jobs = sb.select(
+    existing_jobs = await sb.select(
         "processing_jobs",
         filters={"gallery_id": request.gallery_id},
         order="created_at.desc",
@@ -69,9 +134,9 @@ async def process_gallery(request: ProcessRequest, background_tasks: BackgroundT
     if existing_jobs:
         # Reuse the most recent job — reset it for re-processing
         existing = existing_jobs[0]
-        sb.update("processing_jobs", {
+        await sb.update("processing_jobs", {
             "total_images": total,
-            "processed_images": total - len(unprocessed),
+            "processed_images": total - unprocessed,
             "status": "queued",
             "current_phase": "queued",
             "completed_at": None,
@@ -81,7 +146,7 @@ async def process_gallery(request: ProcessRequest, background_tasks: BackgroundT
         log.info(f"Reusing existing processing job {existing['id']} for gallery {request.gallery_id}")
     else:
         # Create new processing job
-        job_row = sb.insert("processing_jobs", {
+        job_row = await sb.insert("processing_jobs", {
             "gallery_id": request.gallery_id,
             "photographer_id": gallery["photographer_id"],
             "style_profile_id": request.style_profile_id,
@@ -99,27 +164,51 @@ async def process_gallery(request: ProcessRequest, background_tasks: BackgroundT
 
     job_id = job_row["id"]
 
-    def run_in_thread():
-        try:
-            asyncio.run(run_pipeline(
-                processing_job_id=job_id,
-                gallery_id=request.gallery_id,
-                style_profile_id=request.style_profile_id,
-                settings_override=request.settings,
-                included_images=request.included_images,
-            ))
-        except Exception as e:
-            log.error(f"Pipeline thread error: {e}")
-
-    thread = Thread(target=run_in_thread, daemon=True)
-    thread.start()
+    # Repeat submissions for a queued gallery collapse into one queue entry
+    queued = queue.submit(GALLERY_JOB, {
+        "processing_job_id": job_id,
+        "gallery_id": request.gallery_id,
+        "style_profile_id": request.style_profile_id,
+        "settings": request.settings,
+        "included_images": request.included_images,
+    }, dedupe_key=_gallery_dedupe_key(request.gallery_id))
 
     return ProcessResponse(
         job_id=job_id, status="queued",
-        message=f"Processing queued for {total} photos", total_images=total,
+        message=f"Processing queued for {total} photos (queue position {queued['position']})",
+        total_images=total,
     )
 
 
+@router.post("/cancel/{job_id}")
+async def cancel_processing(job_id: str):
+    """Cancel a queued or running gallery job (job_id is the processing_jobs id)."""
+    sb = get_async_supabase()
+    job = await sb.select_single("processing_jobs", filters={"id": job_id})
+    if not job:
+        return {"job_id": job_id, "status": "error", "message": "Job not found"}
+
+    queue = get_job_queue()
+    active = queue.find_active(_gallery_dedupe_key(job["gallery_id"]))
+    if not active or active["payload"].get("processing_job_id") != job_id:
+        return {"job_id": job_id, "status": job.get("status"), "message": "Job is not queued or running"}
+
+    previous = queue.cancel(active["id"])
+    if previous == RUNNING:
+        # The pipeline writes the 'canceled' status itself once it stops
+        cancellation.cancel(active["id"])
+        message = "Cancellation requested — stopping after the current photo"
+    elif previous == QUEUED:
+        await sb.update("processing_jobs", job_id, {
+            "status": "canceled",
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        })
+        message = "Queued job canceled"
+    else:
+        message = "Job already finished"
+    return {"job_id": job_id, "status": "canceled", "message": message}
+
+
 @router.post("/single/{photo_id}")
 async def process_single_photo(photo_id: str, prompt: Optional[str] = None):
     return {
@@ -138,9 +227,19 @@ class RestyleRequest(BaseModel):
 
 @router.post("/restyle")
 async def restyle_photo(request: RestyleRequest):
-    """Re-apply a different style profile to a single photo."""
+    """Re-apply a different style profile to a single photo.
+
+    Runs in the scheduler's interactive lane: it doesn't queue behind batch
+    pipelines, and they pause at photo boundaries while it runs.
+    """
+    async with get_scheduler().interactive():
+        return await asyncio.to_thread(_restyle_photo, request)
+
+
+def _restyle_photo(request: RestyleRequest) -> dict:
     from app.pipeline.phase1_style import apply_style, load_image_from_bytes, compute_channel_stats
-    from app.storage.supabase_storage import download_photo, upload_photo
+    from app.pipeline.decoder import is_raw_file
+    from app.storage.supabase_storage import download_photo, download_photo_to_file, upload_photo
     import cv2
     import numpy as np
 
@@ -166,12 +265,20 @@ async def restyle_photo(request: RestyleRequest):
 
         settings = profile.get("settings") or {}
 
-        # Download the original photo
-        img_bytes = download_photo(original_key)
-        if not img_bytes:
-            return {"error": "Could not download original photo", "status": "error"}
-
-        img = load_image_from_bytes(img_bytes)
+        # Download the original photo — RAWs stream to a temp file
+        if is_raw_file(original_key):
+            raw_path = download_photo_to_file(original_key)
+            if not raw_path:
+                return {"error": "Could not download original photo", "status": "error"}
+            try:
+                img = load_image_from_bytes(raw_path)
+            finally:
+                os.unlink(raw_path)
+        else:
+            img_bytes = download_photo(original_key)
+            if not img_bytes:
+                return {"error": "Could not download original photo", "status": "error"}
+            img = load_image_from_bytes(img_bytes)
         if img is None:
             return {"error": "Could not decode photo", "status": "error"}
 
@@ -228,14 +335,55 @@ async def restyle_photo(request: RestyleRequest):
         return {"error": str(e), "status": "error"}
 
 
+# Photo columns holding each servable variant's storage key
+_URL_VARIANTS = {"thumb": "thumb_key", "web": "web_key", "edited": "edited_key", "original": "original_key"}
+
+
+@router.get("/gallery/{gallery_id}/urls")
+async def get_gallery_urls(gallery_id: str, variant: str = "web", expires_in: int = 3600):
+    """Signed URLs for every photo in a gallery — one signing round trip per page of photos."""
+    column = _URL_VARIANTS.get(variant)
+    if column is None:
+        return {"error": f"Unknown variant '{variant}' (expected one of {', '.join(_URL_VARIANTS)})", "status": "error"}
+
+    photos = []
+    try:
+        async for page in iter_gallery_photos_async(gallery_id, columns=f"id,filename,{column}"):
+            keys = [p[column] for p in page if p.get(column)]
+            urls = await get_signed_urls_async(keys, expires_in) if keys else {}
+            photos.extend(
+                {"id": p["id"], "filename": p.get("filename"), "url": urls.get(p.get(column))}
+                for p in page
+            )
+    except Exception as e:
+        return {"error": f"Failed to list photos for gallery {gallery_id}: {e}", "status": "error"}
+    return {"gallery_id": gallery_id, "variant": variant, "photos": photos}
+
+
+@router.get("/queue")
+async def get_queue_status():
+    """Queue depth — jobs waiting and running, scheduler slots, Supabase concurrency, object cache."""
+    cache = get_object_cache()
+    return {
+        **get_job_queue().stats(),
+        "scheduler": get_scheduler().stats(),
+        "supabase_limiter": get_limiter().stats(),
+        "object_cache": cache.stats() if cache else None,
+    }
+
+
 @router.get("/status/{job_id}")
 async def get_processing_status(job_id: str):
     try:
-        sb = get_supabase()
-        job = sb.select_single("processing_jobs", filters={"id": job_id})
+        sb = get_async_supabase()
+        job = await sb.select_single("processing_jobs", filters={"id": job_id})
         if not job:
             return {"error": "Job not found"}
 
+        queue = get_job_queue()
+        queued = queue.find_active(_gallery_dedupe_key(job["gallery_id"]))
+        queue_position = queue.position(queued["id"]) if queued else None
+
         return {
             "job_id": job["id"],
             "status": job["status"],
@@ -246,6 +394,7 @@ async def get_processing_status(job_id: str):
                 (job.get("processed_images", 0) / max(1, job.get("total_images", 1))) * 100, 1
             ),
             "error_log": job.get("error_log"),
+            "queue_position": queue_position,
             "started_at": job.get("started_at"),
             "completed_at": job.get("completed_at"),
         }
@@ -4,18 +4,27 @@ Style training router — supports both:
 2. Reference-only training (CPU histogram method — legacy)
 """
 
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Optional
 import asyncio
 import logging
 
-from app.config import settings, supabase
+from app.config import close_async_supabase, get_async_supabase, settings
 from app.modal.client import ModalClient
+from app.storage.db import update_style_profile_async
+from app.workers.job_queue import get_job_queue, register_handler
 
 router = APIRouter()
 logger = logging.getLogger("apelier.style")
 
+NEURAL_STYLE_JOB = "style_neural"
+HISTOGRAM_STYLE_JOB = "style_histogram"
+
+
+def _style_dedupe_key(style_profile_id: str) -> str:
+    return f"style:{style_profile_id}"
+
 
 class TrainStyleRequest(BaseModel):
     photographer_id: str
@@ -37,35 +46,33 @@ class CreateStyleRequest(BaseModel):
 # Routes use relative paths — main.py adds prefix="/api/style"
 
 @router.post("/train")
-async def train_style(req: TrainStyleRequest, background_tasks: BackgroundTasks):
+async def train_style(req: TrainStyleRequest):
     """Start style model training."""
     if req.pairs and len(req.pairs) >= 5:
         logger.info(f"Starting GPU style training: {len(req.pairs)} pairs")
-        supabase.update("style_profiles", req.style_profile_id, {
+        await get_async_supabase().update("style_profiles", req.style_profile_id, {
             "training_status": "training",
             "training_method": "neural_lut",
         })
-        background_tasks.add_task(
-            _train_neural_style_sync,
-            req.photographer_id,
-            req.style_profile_id,
-            req.pairs,
-            req.epochs,
-        )
+        get_job_queue().submit(NEURAL_STYLE_JOB, {
+            "photographer_id": req.photographer_id,
+            "style_profile_id": req.style_profile_id,
+            "pairs": req.pairs,
+            "epochs": req.epochs,
+        }, dedupe_key=_style_dedupe_key(req.style_profile_id))
         return {"status": "training", "message": f"Neural LUT training started with {len(req.pairs)} pairs"}
 
     elif req.reference_keys and len(req.reference_keys) >= 5:
         logger.info(f"Starting CPU style training: {len(req.reference_keys)} references")
-        supabase.update("style_profiles", req.style_profile_id, {
+        await get_async_supabase().update("style_profiles", req.style_profile_id, {
             "training_status": "training",
             "training_method": "histogram",
         })
-        background_tasks.add_task(
-            _train_histogram_style_sync,
-            req.photographer_id,
-            req.style_profile_id,
-            req.reference_keys,
-        )
+        get_job_queue().submit(HISTOGRAM_STYLE_JOB, {
+            "photographer_id": req.photographer_id,
+            "style_profile_id": req.style_profile_id,
+            "reference_keys": req.reference_keys,
+        }, dedupe_key=_style_dedupe_key(req.style_profile_id))
         return {"status": "training", "message": f"Histogram training started with {len(req.reference_keys)} references"}
 
     else:
@@ -77,7 +84,7 @@ async def create_style(req: CreateStyleRequest):
     """Create a new style profile and start training."""
     try:
         # Create style profile record
-        profile = supabase.insert("style_profiles", {
+        profile = await get_async_supabase().insert("style_profiles", {
             "photographer_id": req.photographer_id,
             "name": req.name,
             "description": req.description or "",
@@ -91,16 +98,12 @@ async def create_style(req: CreateStyleRequest):
 
         profile_id = profile["id"]
 
-        # Start training in background
-        from threading import Thread
-
-        def train_bg():
-            asyncio.run(_train_histogram_style(
-                req.photographer_id, profile_id, req.reference_image_keys
-            ))
-
-        thread = Thread(target=train_bg, daemon=True)
-        thread.start()
+        # Queue training
+        get_job_queue().submit(HISTOGRAM_STYLE_JOB, {
+            "photographer_id": req.photographer_id,
+            "style_profile_id": profile_id,
+            "reference_keys": req.reference_image_keys,
+        }, dedupe_key=_style_dedupe_key(profile_id))
 
         return {
             "status": "training",
@@ -115,7 +118,7 @@ async def create_style(req: CreateStyleRequest):
 @router.get("/status/{style_profile_id}")
 async def get_training_status(style_profile_id: str):
     """Check training status for a style profile."""
-    profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
+    profile = await get_async_supabase().select_single("style_profiles", filters={"id": style_profile_id})
     if not profile:
         return {"status": "error", "message": "Style profile not found"}
     return {
@@ -128,23 +131,22 @@ async def get_training_status(style_profile_id: str):
 @router.post("/{style_profile_id}/retrain")
 async def retrain_style(style_profile_id: str):
     """Re-train an existing style profile."""
-    profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
+    profile = await get_async_supabase().select_single("style_profiles", filters={"id": style_profile_id})
     if not profile:
         return {"status": "error", "message": "Style profile not found"}
 
-    supabase.update("style_profiles", style_profile_id, {
+    await get_async_supabase().update("style_profiles", style_profile_id, {
         "status": "training",
     })
 
     ref_keys = profile.get("reference_image_keys", [])
     photographer_id = profile["photographer_id"]
 
-    from threading import Thread
-    def retrain_bg():
-        asyncio.run(_train_histogram_style(photographer_id, style_profile_id, ref_keys))
-
-    thread = Thread(target=retrain_bg, daemon=True)
-    thread.start()
+    get_job_queue().submit(HISTOGRAM_STYLE_JOB, {
+        "photographer_id": photographer_id,
+        "style_profile_id": style_profile_id,
+        "reference_keys": ref_keys,
+    }, dedupe_key=_style_dedupe_key(style_profile_id))
 
     return {"status": "training", "message": "Retraining started"}
 
@@ -152,14 +154,30 @@ async def retrain_style(style_profile_id: str):
 # ─── Background Training Tasks ───────────────────────────────
 
 
-def _train_neural_style_sync(photographer_id, style_profile_id, pairs, epochs):
-    """Synchronous wrapper for background task."""
-    asyncio.run(_train_neural_style(photographer_id, style_profile_id, pairs, epochs))
+def _train_neural_style_job(job_id: str, payload: dict):
+    """Job queue handler for neural LUT training."""
+    asyncio.run(_closing_async_client(_train_neural_style(
+        payload["photographer_id"], payload["style_profile_id"], payload["pairs"], payload["epochs"],
+    )))
 
 
-def _train_histogram_style_sync(photographer_id, style_profile_id, reference_keys):
-    """Synchronous wrapper for background task."""
-    asyncio.run(_train_histogram_style(photographer_id, style_profile_id, reference_keys))
+def _train_histogram_style_job(job_id: str, payload: dict):
+    """Job queue handler for histogram training."""
+    asyncio.run(_closing_async_client(_train_histogram_style(
+        payload["photographer_id"], payload["style_profile_id"], payload["reference_keys"],
+    )))
+
+
+async def _closing_async_client(coro):
+    """Run a job's coroutine, then close the async client of its short-lived event loop."""
+    try:
+        return await coro
+    finally:
+        await close_async_supabase()
+
+
+register_handler(NEURAL_STYLE_JOB, _train_neural_style_job)
+register_handler(HISTOGRAM_STYLE_JOB, _train_histogram_style_job)
 
 
 async def _train_neural_style(
@@ -178,21 +196,18 @@ async def _train_neural_style(
             epochs=epochs,
         )
         if result.get("status") == "success":
-            supabase.update("style_profiles", style_profile_id, {
-                "status": "ready",
-                "model_key": result["model_key"],
-                "model_weights_key": result["model_key"],
-            })
+            await update_style_profile_async(
+                style_profile_id,
+                status="ready",
+                model_key=result["model_key"],
+                model_weights_key=result["model_key"],
+            )
             logger.info(f"Neural style training complete: {result['model_key']}")
         else:
-            supabase.update("style_profiles", style_profile_id, {
-                "status": "error",
-            })
+            await update_style_profile_async(style_profile_id, status="error")
             logger.error(f"Neural style training failed: {result.get('message')}")
     except Exception as e:
-        supabase.update("style_profiles", style_profile_id, {
-            "status": "error",
-        })
+        await update_style_profile_async(style_profile_id, status="error")
         logger.error(f"Neural style training error: {e}")
     finally:
         await modal_client.close()
@@ -203,15 +218,9 @@ async def _train_histogram_style(
     style_profile_id: str,
     reference_keys: list[str],
 ):
-    """Background task: train histogram-based style (CPU method)."""
-    try:
-        from app.workers.style_trainer import train_style_profile
-        await train_style_profile(photographer_id, style_profile_id, reference_keys)
-        supabase.update("style_profiles", style_profile_id, {
-            "status": "ready",
-        })
-    except Exception as e:
-        supabase.update("style_profiles", style_profile_id, {
-            "status": "error",
-        })
-        logger.error(f"Histogram style training error: {e}")
+    """Background task: train histogram-based style (CPU method).
+
+    train_profile records the outcome (ready / error) on the profile itself.
+    """
+    from app.workers.style_trainer import train_profile
+    await train_profile(style_profile_id, reference_keys)
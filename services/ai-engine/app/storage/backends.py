@@ -0,0 +1,421 @@
+"""
+Pluggable table and object backends behind get_supabase().
+
+The pipeline talks to one client object with two halves:
+  - tables:  select, select_single, select_pages, count, insert, update,
+             update_many, update_rows, rpc
+  - objects: storage_download, storage_download_to_file, storage_read_head,
+             storage_upload, storage_upload_many, storage_signed_url,
+             storage_signed_urls
+
+Each half is picked independently by settings:
+  TABLE_BACKEND=supabase | memory   — PostgREST, or an in-process table store
+  OBJECT_BACKEND=supabase | local   — Supabase Storage, or files under LOCAL_OBJECT_DIR
+
+With both set to `supabase` get_supabase() returns the plain SupabaseClient.
+Otherwise it returns a BackendClient that routes each call to its half, so
+`run_pipeline` can run end-to-end on a laptop at disk speed (seed the
+memory tables from MEMORY_TABLES_SEED, a JSON file of {table: [rows]}).
+
+The memory and local stores are process-wide, so the sync client and every
+per-loop async client see the same rows and objects.
+"""
+import asyncio
+import fnmatch
+import heapq
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+import httpx
+
+from app.config import (
+    AsyncSupabaseClient, SupabaseClient, _SupabaseBase, _filter_params, get_settings,
+)
+
+logger = logging.getLogger("apelier.backends")
+
+TABLE_METHODS = (
+    "select", "select_single", "select_pages", "count",
+    "insert", "update", "update_many", "update_rows", "rpc",
+)
+OBJECT_METHODS = (
+    "storage_download", "storage_download_to_file", "storage_read_head", "storage_upload",
+    "storage_upload_many", "storage_signed_url", "storage_signed_urls",
+)
+
+
+# ── In-memory tables ──
+
+def _to_json(obj):
+    """Round-trip through JSON like a real request would (numpy → native, dates → str)."""
+    return json.loads(json.dumps(_SupabaseBase._sanitize(obj), default=str))
+
+
+def _compare_key(value):
+    # Mixed types sort consistently; None handled by the caller
+    return (0, value) if isinstance(value, (int, float)) else (1, str(value))
+
+
+def _matches(row: dict, column: str, expr: str) -> bool:
+    """Evaluate one PostgREST filter expression (as built by _filter_params) against a row."""
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, arg = expr.partition(".")
+    value = row.get(column)
+    if op == "is":
+        result = value is None if arg == "null" else str(value).lower() == arg
+    elif op == "in":
+        options = [o.strip().strip('"') for o in arg.strip("()").split(",") if o.strip()]
+        result = value is not None and _as_text(value) in options
+    elif value is None:
+        result = False
+    elif op in ("eq", "neq"):
+        result = (_as_text(value) == arg) == (op == "eq")
+    elif op in ("like", "ilike"):
+        pattern = arg.replace("%", "*")
+        if op == "ilike":
+            result = fnmatch.fnmatchcase(_as_text(value).lower(), pattern.lower())
+        else:
+            result = fnmatch.fnmatchcase(_as_text(value), pattern)
+    elif op in ("gt", "gte", "lt", "lte"):
+        try:
+            left, right = (float(value), float(arg)) if isinstance(value, (int, float)) else (str(value), arg)
+        except ValueError:
+            left, right = str(value), arg
+        result = {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+    else:
+        raise ValueError(f"Unsupported filter operator: {op}")
+    return result != negate
+
+
+def _as_text(value) -> str:
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _project(row: dict, columns: str) -> dict:
+    if columns.strip() == "*":
+        return dict(row)
+    return {c: row.get(c) for c in (c.strip() for c in columns.split(",")) if c}
+
+
+def _sort(rows: list[dict], order: str) -> list[dict]:
+    """Apply a PostgREST `order` clause, e.g. "created_at.desc,filename"."""
+    for clause in reversed([c for c in order.split(",") if c]):
+        column, *mods = clause.strip().split(".")
+        desc = "desc" in mods
+        nulls_first = "nullsfirst" in mods or ("nullslast" not in mods and desc)
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: _compare_key(r[column]), reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def _response(status: int, body=None) -> httpx.Response:
+    return httpx.Response(status, json=body) if body is not None else httpx.Response(status)
+
+
+class MemoryTableStore:
+    """Thread-safe in-process stand-in for the PostgREST table API."""
+
+    def __init__(self, seed: Optional[dict[str, list[dict]]] = None):
+        self._lock = threading.Lock()
+        self._tables: dict[str, list[dict]] = {}
+        self._rpcs: dict[str, Callable[["MemoryTableStore", dict], object]] = {
+            "increment_images_edited": _increment_images_edited,
+        }
+        for table, rows in (seed or {}).items():
+            for row in rows:
+                self.insert(table, row)
+
+    @classmethod
+    def from_file(cls, path: str) -> "MemoryTableStore":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def register_rpc(self, function: str, handler: Callable[["MemoryTableStore", dict], object]):
+        """Provide an in-memory implementation of a Postgres function."""
+        self._rpcs[function] = handler
+
+    def dump(self) -> dict[str, list[dict]]:
+        """Snapshot of every table (same shape as the seed file)."""
+        with self._lock:
+            return {table: [dict(r) for r in rows] for table, rows in self._tables.items()}
+
+    def _where(self, table: str, filters: dict) -> list[dict]:
+        """Rows matching PostgREST-style params. Caller holds the lock."""
+        return [
+            row for row in self._tables.get(table, [])
+            if all(_matches(row, col, expr) for col, expr in filters.items())
+        ]
+
+    def select(self, table: str, columns: str = "*", filters: dict | None = None, order: str | None = None) -> list[dict]:
+        with self._lock:
+            rows = self._where(table, _filter_params(filters))
+            if order:
+                rows = _sort(rows, order)
+            return [_project(r, columns) for r in rows]
+
+    def select_single(self, table: str, columns: str = "*", filters: dict | None = None) -> Optional[dict]:
+        rows = self.select(table, columns, filters)
+        return rows[0] if len(rows) == 1 else None
+
+    def select_pages(self, table: str, columns: str = "*", filters: dict | None = None,
+                     page_size: Optional[int] = None, key: str = "id") -> Iterator[list[dict]]:
+        size = max(1, page_size or get_settings().select_page_size)
+        after = None
+        while True:
+            with self._lock:
+                rows = self._where(table, _filter_params(filters))
+                if after is not None:
+                    rows = [r for r in rows if r.get(key) is not None and _compare_key(r[key]) > after]
+                page = heapq.nsmallest(size, (r for r in rows if r.get(key) is not None), key=lambda r: _compare_key(r[key]))
+                page = [{**_project(r, columns), key: r[key]} for r in page]
+            if not page:
+                return
+            yield page
+            if len(page) < size:
+                return
+            after = _compare_key(page[-1][key])
+
+    def count(self, table: str, filters: dict | None = None) -> int:
+        with self._lock:
+            return len(self._where(table, _filter_params(filters)))
+
+    def insert(self, table: str, data: dict) -> Optional[dict]:
+        row = _to_json(data)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        with self._lock:
+            self._tables.setdefault(table, []).append(row)
+            return dict(row)
+
+    def update(self, table: str, data_or_id, data_or_filters: dict = None) -> Optional[dict]:
+        data, params = _SupabaseBase._update_args(data_or_id, data_or_filters)
+        changes = _to_json(data)
+        with self._lock:
+            rows = self._where(table, _filter_params(params))
+            for row in rows:
+                row.update(changes)
+            return dict(rows[0]) if rows else None
+
+    def update_many(self, table: str, data: dict, in_filter: tuple[str, list[str]]) -> bool:
+        col, ids = in_filter
+        changes = _to_json(data)
+        with self._lock:
+            for row in self._where(table, {col: f"in.({','.join(ids)})"}):
+                row.update(changes)
+        return True
+
+    def update_rows(self, table: str, rows: list[dict]) -> int:
+        updated = 0
+        with self._lock:
+            for item in _to_json(rows):
+                for row in self._where(table, _filter_params({"id": item["id"]})):
+                    row.update(item["fields"])
+                    updated += 1
+        return updated
+
+    def rpc(self, function: str, params: dict | None = None) -> httpx.Response:
+        handler = self._rpcs.get(function)
+        if handler is None:
+            return _response(404, {"message": f"Unknown function: {function}"})
+        result = handler(self, _to_json(params or {}))
+        return _response(200, result) if result is not None else _response(204)
+
+
+def _increment_images_edited(store: MemoryTableStore, params: dict):
+    photographer = store.select_single("photographers", filters={"id": params["photographer_uuid"]})
+    if photographer is not None:
+        count = (photographer.get("images_edited_count") or 0) + params.get("count", 1)
+        store.update("photographers", photographer["id"], {"images_edited_count": count})
+
+
+# ── Local filesystem objects ──
+
+class LocalObjectStore:
+    """Object storage as plain files under `root/<bucket>/<path>`."""
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _path(self, bucket: str, path: str) -> Path:
+        target = (self.root / bucket / path).resolve()
+        if self.root not in target.parents:
+            raise ValueError(f"Object key escapes the store: {bucket}/{path}")
+        return target
+
+    def storage_download(self, bucket: str, path: str) -> Optional[bytes]:
+        try:
+            return self._path(bucket, path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def storage_download_to_file(self, bucket: str, path: str, dest: str) -> bool:
+        try:
+            shutil.copyfile(self._path(bucket, path), dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def storage_read_head(self, bucket: str, path: str, length: int) -> Optional[tuple[bytes, Optional[int]]]:
+        target = self._path(bucket, path)
+        try:
+            with open(target, "rb") as f:
+                return f.read(length), os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+
+    def storage_upload(self, bucket: str, path: str, data: bytes, content_type: str = "image/jpeg") -> bool:
+        target = self._path(bucket, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so readers never see a partial object
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+        return True
+
+    def storage_upload_many(self, bucket: str, items: list[tuple[str, bytes, str]],
+                            concurrency: Optional[int] = None, semaphore=None) -> dict[str, bool]:
+        """Write (key, data, content_type) items in order. Returns {key: ok}.
+
+        `concurrency` and `semaphore` are accepted for parity with the
+        Supabase clients; local writes aren't worth parallelising.
+        """
+        results = {}
+        for key, data, content_type in items:
+            try:
+                results[key] = self.storage_upload(bucket, key, data, content_type)
+            except OSError as e:
+                logger.warning(f"Upload failed for {key}: {e}")
+                results[key] = False
+        return results
+
+    def storage_signed_url(self, bucket: str, path: str, expires_in: int = 3600) -> Optional[str]:
+        target = self._path(bucket, path)
+        return target.as_uri() if target.exists() else None
+
+    def storage_signed_urls(self, bucket: str, paths: list[str], expires_in: int = 3600) -> dict[str, Optional[str]]:
+        return {path: self.storage_signed_url(bucket, path, expires_in) for path in paths}
+
+
+# ── Composite clients ──
+
+class BackendClient:
+    """Sync client routing table calls to `tables` and storage calls to `objects`."""
+
+    def __init__(self, tables, objects):
+        self.tables = tables
+        self.objects = objects
+
+    def __getattr__(self, name: str):
+        if name in TABLE_METHODS:
+            return getattr(self.tables, name)
+        if name in OBJECT_METHODS:
+            return getattr(self.objects, name)
+        raise AttributeError(name)
+
+    def close(self):
+        for backend in (self.tables, self.objects):
+            if isinstance(backend, SupabaseClient):
+                backend.close()
+
+
+def _awaitable(method: Callable, offload: bool) -> Callable:
+    """Async wrapper for a local backend method; `offload` runs it in a thread (disk I/O)."""
+    async def call(*args, **kwargs):
+        if offload:
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return method(*args, **kwargs)
+    return call
+
+
+class AsyncBackendClient:
+    """Async twin of BackendClient — Supabase halves use AsyncSupabaseClient."""
+
+    def __init__(self):
+        s = _checked_settings()
+        self._remote: Optional[AsyncSupabaseClient] = None
+        if s.table_backend == "supabase" or s.object_backend == "supabase":
+            self._remote = AsyncSupabaseClient()
+        self.tables = self._remote if s.table_backend == "supabase" else get_table_store()
+        self.objects = self._remote if s.object_backend == "supabase" else get_object_store()
+
+    def __getattr__(self, name: str):
+        if name in TABLE_METHODS:
+            backend = self.tables
+        elif name in OBJECT_METHODS:
+            backend = self.objects
+        else:
+            raise AttributeError(name)
+        method = getattr(backend, name)
+        if backend is self._remote:
+            return method
+        return _awaitable(method, offload=backend is not self.tables)
+
+    async def select_pages(self, *args, **kwargs) -> AsyncIterator[list[dict]]:
+        if self.tables is self._remote:
+            async for page in self._remote.select_pages(*args, **kwargs):
+                yield page
+        else:
+            for page in self.tables.select_pages(*args, **kwargs):
+                yield page
+
+    async def aclose(self):
+        if self._remote is not None:
+            await self._remote.aclose()
+
+
+# ── Process-wide local stores ──
+
+def _checked_settings():
+    s = get_settings()
+    if s.table_backend not in ("supabase", "memory"):
+        raise ValueError(f"Unknown TABLE_BACKEND '{s.table_backend}' (expected supabase or memory)")
+    if s.object_backend not in ("supabase", "local"):
+        raise ValueError(f"Unknown OBJECT_BACKEND '{s.object_backend}' (expected supabase or local)")
+    return s
+
+
+_tables: Optional[MemoryTableStore] = None
+_objects: Optional[LocalObjectStore] = None
+_stores_lock = threading.Lock()
+
+
+def get_table_store() -> MemoryTableStore:
+    global _tables
+    with _stores_lock:
+        if _tables is None:
+            seed = get_settings().memory_tables_seed
+            _tables = MemoryTableStore.from_file(seed) if seed else MemoryTableStore()
+            if seed:
+                logger.info(f"Memory tables seeded from {seed}")
+        return _tables
+
+
+def get_object_store() -> LocalObjectStore:
+    global _objects
+    with _stores_lock:
+        if _objects is None:
+            _objects = LocalObjectStore(get_settings().local_object_dir)
+        return _objects
+
+
+def create_client() -> BackendClient:
+    """Sync client for the configured TABLE_BACKEND / OBJECT_BACKEND."""
+    s = _checked_settings()
+    remote = SupabaseClient() if "supabase" in (s.table_backend, s.object_backend) else None
+    tables = remote if s.table_backend == "supabase" else get_table_store()
+    objects = remote if s.object_backend == "supabase" else get_object_store()
+    logger.info(f"Using table backend '{s.table_backend}', object backend '{s.object_backend}'")
+    return BackendClient(tables, objects)
@@ -1,10 +1,18 @@
 """
 Database helpers — update processing_jobs, photos, galleries via Supabase REST API.
+
+Helpers used from async route handlers and workers have an `*_async` twin
+on the per-loop AsyncSupabaseClient, so they don't block the loop.
+
+Large galleries should be read with `iter_gallery_photos_async` (keyset
+pages of only the columns asked for) or counted with
+`count_gallery_photos_async`, rather than fetched whole with
+`get_gallery_photos`.
 """
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 from datetime import datetime, timezone
-from app.config import get_supabase
+from app.config import get_async_supabase, get_supabase
 
 log = logging.getLogger(__name__)
 
@@ -146,3 +154,54 @@ def update_style_profile(profile_id: str, **fields):
         sb.update("style_profiles", profile_id, fields)
     except Exception as e:
         log.error(f"Failed to update style profile {profile_id}: {e}")
+
+
+# ── Async variants ───────────────────────────────────────────
+
+async def iter_gallery_photos_async(gallery_id: str, columns: str = "*", filters: Optional[dict] = None,
+                                    page_size: Optional[int] = None) -> AsyncIterator[list[dict]]:
+    """Yield a gallery's photos a page at a time, in id order (next page prefetched).
+
+    A page that fails to load raises — callers never see a silently
+    truncated listing.
+    """
+    try:
+        pages = get_async_supabase().select_pages("photos", columns, {"gallery_id": gallery_id, **(filters or {})}, page_size)
+        async for page in pages:
+            yield page
+    except Exception as e:
+        log.error(f"Failed to fetch photos for gallery {gallery_id}: {e}")
+        raise
+
+
+async def count_gallery_photos_async(gallery_id: str, filters: Optional[dict] = None) -> int:
+    try:
+        return await get_async_supabase().count("photos", {"gallery_id": gallery_id, **(filters or {})})
+    except Exception as e:
+        log.error(f"Failed to count photos for gallery {gallery_id}: {e}")
+        return 0
+
+
+async def get_gallery_async(gallery_id: str) -> Optional[dict]:
+    try:
+        return await get_async_supabase().select_single(
+            "galleries", columns="*, job:jobs(id, status)", filters={"id": gallery_id},
+        )
+    except Exception as e:
+        log.error(f"Failed to fetch gallery {gallery_id}: {e}")
+        return None
+
+
+async def get_style_profile_async(profile_id: str) -> Optional[dict]:
+    try:
+        return await get_async_supabase().select_single("style_profiles", filters={"id": profile_id})
+    except Exception as e:
+        log.error(f"Failed to fetch style profile {profile_id}: {e}")
+        return None
+
+
+async def update_style_profile_async(profile_id: str, **fields):
+    try:
+        await get_async_supabase().update("style_profiles", profile_id, fields)
+    except Exception as e:
+        log.error(f"Failed to update style profile {profile_id}: {e}")
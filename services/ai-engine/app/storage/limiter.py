@@ -0,0 +1,221 @@
+"""
+Adaptive concurrency limiter for Supabase traffic (AIMD).
+
+Every REST and Storage request goes through one process-wide limiter:
+  - while requests succeed at normal latency the limit grows additively
+    (about +1 per limit's worth of successes)
+  - on 429 / 5xx / transport errors, or when a request kind's recent latency
+    rises well above its baseline, the limit is cut multiplicatively
+    (at most once per cooldown, so one burst of failures is one decrease)
+  - idempotent requests that hit 429 / 5xx / transport errors are retried
+    with jittered exponential backoff, honouring Retry-After; non-idempotent
+    ones (inserts, RPCs) are only retried on 429
+
+The limiter is thread-safe and shared by the sync client (worker threads)
+and every async client (one per event loop); async waiters poll rather than
+block so they never stall their loop.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger("apelier.limiter")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class _Latency:
+    """Fast and slow EWMAs of one request kind's latency."""
+    __slots__ = ("fast", "slow")
+
+    def __init__(self, latency: float):
+        self.fast = latency
+        self.slow = latency
+
+    def observe(self, latency: float):
+        self.fast += 0.3 * (latency - self.fast)
+        self.slow += 0.02 * (latency - self.slow)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with retries for idempotent requests."""
+
+    def __init__(self, initial: int = 8, min_limit: int = 2, max_limit: int = 32,
+                 latency_tolerance: float = 2.0, backoff_ratio: float = 0.7,
+                 cooldown_s: float = 1.0, max_attempts: int = 4, retry_base_s: float = 0.25):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.cooldown_s = cooldown_s
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_s = retry_base_s
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._latency: dict[str, _Latency] = {}
+        self._last_decrease = 0.0
+        self._retries = 0
+        self._overloads = 0
+
+    # ── Slots ──
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._in_flight < int(self.limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    async def acquire_async(self):
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    # ── Feedback ──
+
+    def on_success(self, kind: str, latency: float):
+        with self._cond:
+            stats = self._latency.get(kind)
+            if stats is None:
+                self._latency[kind] = _Latency(latency)
+                spike = False
+            else:
+                stats.observe(latency)
+                spike = stats.fast > stats.slow * self.latency_tolerance
+            if spike:
+                self._decrease(f"{kind} latency {stats.fast:.2f}s vs {stats.slow:.2f}s baseline")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._cond.notify_all()
+
+    def on_overload(self, reason: str):
+        with self._cond:
+            self._overloads += 1
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        """Multiplicative decrease, once per cooldown. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_s:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+        if int(old) != int(self.limit):
+            logger.info(f"Supabase concurrency {int(old)} → {int(self.limit)} ({reason})")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self._in_flight,
+                "retries": self._retries,
+                "overloads": self._overloads,
+            }
+
+    # ── Requests ──
+
+    def request(self, kind: str, send: Callable[[], httpx.Response], idempotent: bool = True,
+                kind_of: Optional[Callable[[httpx.Response], str]] = None) -> httpx.Response:
+        """Run `send()` under a slot, feeding back the outcome; retry idempotent failures.
+
+        `kind_of` names the kind from the response (e.g. bucketed by body size)
+        when it isn't known up front; `kind` still labels transport errors.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire()
+            start = time.monotonic()
+            try:
+                r = send()
+            except httpx.TransportError as e:
+                self.on_overload(f"{kind}: {type(e).__name__}")
+                if not idempotent or attempt == self.max_attempts:
+                    raise
+                r = None
+            finally:
+                self.release()
+            if r is not None and not self._record(kind_of(r) if kind_of else kind, r, time.monotonic() - start):
+                return r
+            # A 429 was rejected before processing, so it's safe to retry anything
+            retryable = idempotent or (r is not None and r.status_code == 429)
+            if not retryable or attempt == self.max_attempts:
+                return r
+            time.sleep(self._retry_delay(attempt, r))
+        return r
+
+    async def request_async(self, kind: str, send: Callable[[], Awaitable[httpx.Response]],
+                            idempotent: bool = True,
+                            kind_of: Optional[Callable[[httpx.Response], str]] = None) -> httpx.Response:
+        """Async twin of request()."""
+        for attempt in range(1, self.max_attempts + 1):
+            await self.acquire_async()
+            start = time.monotonic()
+            try:
+                r = await send()
+            except httpx.TransportError as e:
+                self.on_overload(f"{kind}: {type(e).__name__}")
+                if not idempotent or attempt == self.max_attempts:
+                    raise
+                r = None
+            finally:
+                self.release()
+            if r is not None and not self._record(kind_of(r) if kind_of else kind, r, time.monotonic() - start):
+                return r
+            # A 429 was rejected before processing, so it's safe to retry anything
+            retryable = idempotent or (r is not None and r.status_code == 429)
+            if not retryable or attempt == self.max_attempts:
+                return r
+            await asyncio.sleep(self._retry_delay(attempt, r))
+        return r
+
+    def _record(self, kind: str, r: httpx.Response, latency: float) -> bool:
+        """Feed a response back into the limit. Returns True if it's worth retrying."""
+        if r.status_code in RETRY_STATUSES:
+            self.on_overload(f"{kind}: HTTP {r.status_code}")
+            return True
+        self.on_success(kind, latency)
+        return False
+
+    def _retry_delay(self, attempt: int, r: Optional[httpx.Response]) -> float:
+        with self._cond:
+            self._retries += 1
+        retry_after = _retry_after(r)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter on an exponential base
+        return random.uniform(0, self.retry_base_s * (2 ** (attempt - 1)))
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed request may succeed later — overload, outage or network trouble."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUSES
+    return isinstance(exc, (httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def _retry_after(r: Optional[httpx.Response]) -> Optional[float]:
+    if r is None:
+        return None
+    try:
+        return min(30.0, max(0.0, float(r.headers["retry-after"])))
+    except (KeyError, ValueError):
+        return None
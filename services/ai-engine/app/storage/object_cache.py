@@ -0,0 +1,266 @@
+"""
+Object cache — read-through, content-addressed local disk cache for Storage downloads.
+
+Originals are fetched many times over (Phase 0, the Phase 5 fallback, every
+restyle, style training), so `storage_download` / `storage_download_to_file`
+keep a copy on local disk:
+  - each bucket/path has a small index record with the object's ETag and
+    Last-Modified; the bytes live in a blob named by their SHA-256, so
+    identical objects are stored once
+  - every hit is revalidated with If-None-Match / If-Modified-Since (a 304
+    costs no body) — the frontend may have replaced the object at any time
+  - only downloads are cached; uploads just drop any stale entry for the key
+  - blobs are evicted least-recently-used (by mtime, refreshed on every hit)
+    once the cache exceeds STORAGE_CACHE_MAX_BYTES
+
+Every file is written to a temp name and renamed into place, so several
+threads or processes can share one cache directory; a reader sees a whole
+file or none at all.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+class CacheEntry:
+    """Index record for one cached bucket/path."""
+    __slots__ = ("bucket", "path", "etag", "last_modified", "blob", "size", "validated_at")
+
+    def __init__(self, bucket: str, path: str, etag: Optional[str], last_modified: Optional[str],
+                 blob: str, size: int, validated_at: float):
+        self.bucket = bucket
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.blob = blob
+        self.size = size
+        self.validated_at = validated_at
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def matches(self, headers) -> bool:
+        """Whether response headers (e.g. from a HEAD) describe the cached version."""
+        if self.etag:
+            return headers.get("etag") == self.etag
+        return bool(self.last_modified) and headers.get("last-modified") == self.last_modified
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ObjectCache:
+    """Size-capped LRU disk cache of Storage objects, shared across threads and processes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index_dir = os.path.join(directory, "index")
+        self._blob_dir = os.path.join(directory, "blobs")
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(os.path.getsize(p) for p in self._blobs())
+        self.hits = 0
+        self.misses = 0
+
+    # ── Lookup ──
+
+    def lookup(self, bucket: str, path: str) -> Optional[CacheEntry]:
+        """The entry for bucket/path if its blob is still on disk."""
+        index_path = self._index_path(bucket, path)
+        try:
+            with open(index_path) as f:
+                entry = CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if not os.path.exists(self._blob_path(entry.blob)):
+            # Blob was evicted — the record is useless now
+            _unlink(index_path)
+            return None
+        return entry
+
+    def read(self, entry: CacheEntry) -> Optional[bytes]:
+        try:
+            with open(self._blob_path(entry.blob), "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self._touch(entry.blob)
+        self.hits += 1
+        return data
+
+    def copy_to(self, entry: CacheEntry, dest: str) -> bool:
+        try:
+            shutil.copyfile(self._blob_path(entry.blob), dest)
+        except OSError:
+            self.misses += 1
+            return False
+        self._touch(entry.blob)
+        self.hits += 1
+        return True
+
+    def revalidated(self, entry: CacheEntry):
+        """The server confirmed the entry is current (304 / matching HEAD)."""
+        entry.validated_at = time.time()
+        self._write_index(entry)
+
+    # ── Updates ──
+
+    def store(self, bucket: str, path: str, data: bytes, headers) -> None:
+        """Cache a freshly downloaded object (`headers` from its 200 response)."""
+        if not self._cacheable(len(data)):
+            return
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            self._atomic_write(blob_path, lambda f: f.write(data))
+            self._added(len(data))
+        self._put(bucket, path, headers, digest, len(data))
+
+    def store_file(self, bucket: str, path: str, src: str, headers) -> None:
+        """Cache an object that was streamed to the local file `src`."""
+        size = os.path.getsize(src)
+        if not self._cacheable(size):
+            return
+        h = hashlib.sha256()
+        with open(src, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            with open(src, "rb") as source:
+                self._atomic_write(blob_path, lambda f: shutil.copyfileobj(source, f, 1024 * 1024))
+            self._added(size)
+        self._put(bucket, path, headers, digest, size)
+
+    def invalidate(self, bucket: str, path: str):
+        """Forget bucket/path (its blob stays until evicted — other keys may share it)."""
+        _unlink(self._index_path(bucket, path))
+
+    def stats(self) -> dict:
+        return {"bytes": self._size, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    # ── Internals ──
+
+    def _cacheable(self, size: int) -> bool:
+        # One object may not take more than half the cache
+        return 0 < size <= self.max_bytes // 2
+
+    def _put(self, bucket: str, path: str, headers, digest: str, size: int):
+        self._write_index(CacheEntry(
+            bucket, path, headers.get("etag"), headers.get("last-modified"), digest, size, time.time(),
+        ))
+
+    def _write_index(self, entry: CacheEntry):
+        payload = json.dumps(entry.to_dict()).encode()
+        self._atomic_write(self._index_path(entry.bucket, entry.path), lambda f: f.write(payload))
+
+    def _index_path(self, bucket: str, path: str) -> str:
+        key = hashlib.sha256(f"{bucket}/{path}".encode()).hexdigest()
+        return os.path.join(self._index_dir, key[:2], f"{key}.json")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    def _blobs(self) -> list[str]:
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self._blob_dir)
+            for name in names if not name.startswith(".")
+        ]
+
+    def _touch(self, digest: str):
+        try:
+            os.utime(self._blob_path(digest))
+        except OSError:
+            pass
+
+    def _added(self, size: int):
+        with self._lock:
+            self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Delete least-recently-used blobs until the cache is back under 90% of its cap."""
+        with self._lock:
+            # Rescan — other processes may have added or evicted blobs
+            blobs = []
+            for path in self._blobs():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+            size = sum(b[1] for b in blobs)
+            target = int(self.max_bytes * 0.9)
+            evicted = 0
+            for _, blob_size, path in sorted(blobs):
+                if size <= target:
+                    break
+                _unlink(path)
+                size -= blob_size
+                evicted += 1
+            self._size = size
+        if evicted:
+            log.info(f"Object cache evicted {evicted} blob(s), now {size / 1024 / 1024:.0f} MB")
+
+    @staticmethod
+    def _atomic_write(dest: str, write):
+        directory = os.path.dirname(dest)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, dest)
+        except BaseException:
+            _unlink(tmp)
+            raise
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+_cache: Optional[ObjectCache] = None
+_cache_unavailable = False
+_cache_lock = threading.Lock()
+
+
+def get_object_cache() -> Optional[ObjectCache]:
+    """The shared cache, or None if STORAGE_CACHE_MAX_BYTES is 0 / the directory is unusable."""
+    global _cache, _cache_unavailable
+    s = get_settings()
+    if not s.storage_cache_dir or s.storage_cache_max_bytes <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_unavailable:
+            try:
+                _cache = ObjectCache(s.storage_cache_dir, s.storage_cache_max_bytes)
+            except OSError as e:
+                log.warning(f"Object cache disabled — cannot use {s.storage_cache_dir}: {e}")
+                _cache_unavailable = True
+        return _cache
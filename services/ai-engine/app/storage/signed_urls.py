@@ -0,0 +1,74 @@
+"""
+Signed URL cache — reuse still-valid Storage signed URLs instead of re-signing.
+
+Signing is one round trip per batch (`storage_signed_urls`), and every URL
+handed out is remembered with its expiry. A cached URL is reused while it
+has at least max(SIGNED_URL_MARGIN_S, expires_in / 2) seconds left, so a
+caller never gets a URL that dies moments after it's used, or one far
+shorter-lived than it asked for.
+
+Uploading to a key drops its cached URL — the next URL for an overwritten
+object (e.g. a restyle) is freshly signed, so browsers don't serve the old
+image from their cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.config import get_settings
+
+
+class SignedUrlCache:
+    """Thread-safe, size-bounded LRU of (bucket, path) → (signed URL, expiry)."""
+
+    def __init__(self, max_entries: int = 10000, margin_s: float = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.margin_s = margin_s
+        self._entries: "OrderedDict[tuple[str, str], tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, bucket: str, paths: Iterable[str], expires_in: int) -> dict[str, str]:
+        """Cached URLs for `paths` that are still good for a request of `expires_in` seconds."""
+        need = max(self.margin_s, expires_in / 2)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for path in paths:
+                entry = self._entries.get((bucket, path))
+                if entry is None:
+                    continue
+                url, expires_at = entry
+                if expires_at - now >= need:
+                    found[path] = url
+                    self._entries.move_to_end((bucket, path))
+                else:
+                    del self._entries[(bucket, path)]
+        return found
+
+    def put_many(self, bucket: str, urls: dict[str, Optional[str]], expires_in: int, signed_at: float):
+        expires_at = signed_at + expires_in
+        with self._lock:
+            for path, url in urls.items():
+                if url:
+                    self._entries[(bucket, path)] = (url, expires_at)
+                    self._entries.move_to_end((bucket, path))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, bucket: str, path: str):
+        with self._lock:
+            self._entries.pop((bucket, path), None)
+
+
+_cache: Optional[SignedUrlCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_signed_url_cache() -> SignedUrlCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            s = get_settings()
+            _cache = SignedUrlCache(s.signed_url_cache_size, s.signed_url_margin_s)
+        return _cache
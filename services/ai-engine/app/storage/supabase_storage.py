@@ -1,9 +1,15 @@
 """
 Supabase Storage helpers — download originals, upload processed images.
+
+`*_async` twins use the per-loop AsyncSupabaseClient.
+`download_photo_to_file` streams large originals (RAWs) to a temp file so
+decoders can read them from disk without an in-memory copy.
 """
 import logging
+import os
+import tempfile
 from typing import Optional
-from app.config import get_supabase, get_settings
+from app.config import get_async_supabase, get_supabase, get_settings
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +25,33 @@ def download_photo(storage_key: str) -> Optional[bytes]:
         return None
 
 
+def _temp_path(storage_key: str, directory: Optional[str] = None) -> str:
+    suffix = os.path.splitext(storage_key)[1]
+    fd, path = tempfile.mkstemp(prefix="apelier-dl-", suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def _discard(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def download_photo_to_file(storage_key: str, directory: Optional[str] = None) -> Optional[str]:
+    """Stream a photo to a temp file (keeps the key's extension). Caller deletes it."""
+    path = _temp_path(storage_key, directory)
+    try:
+        sb = get_supabase()
+        if sb.storage_download_to_file(get_settings().storage_bucket, storage_key, path):
+            return path
+    except Exception as e:
+        log.error(f"Failed to download {storage_key}: {e}")
+    _discard(path)
+    return None
+
+
 def upload_photo(storage_key: str, data: bytes, content_type: str = "image/jpeg") -> Optional[str]:
     """Upload a processed photo to Supabase Storage. Returns the key on success."""
     try:
@@ -40,3 +73,33 @@ def get_signed_url(storage_key: str, expires_in: int = 3600) -> Optional[str]:
     except Exception as e:
         log.error(f"Failed to get signed URL for {storage_key}: {e}")
         return None
+
+
+# ── Async variants ──
+
+async def download_photo_async(storage_key: str) -> Optional[bytes]:
+    try:
+        return await get_async_supabase().storage_download(get_settings().storage_bucket, storage_key)
+    except Exception as e:
+        log.error(f"Failed to download {storage_key}: {e}")
+        return None
+
+
+async def download_photo_to_file_async(storage_key: str, directory: Optional[str] = None) -> Optional[str]:
+    path = _temp_path(storage_key, directory)
+    try:
+        if await get_async_supabase().storage_download_to_file(get_settings().storage_bucket, storage_key, path):
+            return path
+    except Exception as e:
+        log.error(f"Failed to download {storage_key}: {e}")
+    _discard(path)
+    return None
+
+
+async def get_signed_urls_async(storage_keys: list[str], expires_in: int = 3600) -> dict[str, Optional[str]]:
+    """Signed URLs for many files in one round trip (cached URLs are reused)."""
+    try:
+        return await get_async_supabase().storage_signed_urls(get_settings().storage_bucket, storage_keys, expires_in)
+    except Exception as e:
+        log.error(f"Failed to get signed URLs for {len(storage_keys)} files: {e}")
+        return dict.fromkeys(storage_keys)
@@ -0,0 +1,72 @@
+"""
+Write-behind buffer — merges per-row field updates and sends them as batched UPDATEs.
+
+The pipeline calls `update(row_id, fields)` as often as it likes; fields for
+the same row are merged in memory. `flush()` sends everything pending through
+the `update_rows` Postgres function: each request carries up to
+DB_WRITE_BATCH_SIZE rows, each with its own values (checkpoint, quality and
+output keys differ per photo), and the requests go out DB_WRITE_CONCURRENCY
+at a time.
+
+Only the changed fields are sent, and they are UPDATEs, never upserts — a
+photo deleted mid-run stays deleted, and a photo renamed or replaced
+mid-run keeps its new gallery / key / filename.
+
+Callers flush at phase boundaries — once `flush()` returns, every update
+made before it is in the database (or has been retried row by row).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.config import get_settings, get_supabase
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Coalesces row updates for one table into batched per-row UPDATEs."""
+
+    def __init__(self, table: str, batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        s = get_settings()
+        self.table = table
+        self.batch_size = max(1, batch_size or s.db_write_batch_size)
+        self.concurrency = max(1, concurrency or s.db_write_concurrency)
+        self._pending: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def update(self, row_id: str, fields: dict):
+        """Queue fields for a row, merging with anything already pending."""
+        with self._lock:
+            self._pending.setdefault(row_id, {}).update(fields)
+
+    def flush(self) -> int:
+        """Send all pending updates. Returns the number of rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = [{"id": row_id, "fields": fields} for row_id, fields in pending.items()]
+        batches = [rows[start:start + self.batch_size] for start in range(0, len(rows), self.batch_size)]
+
+        sb = get_supabase()
+        with ThreadPoolExecutor(max_workers=min(len(batches), self.concurrency)) as ex:
+            list(ex.map(lambda batch: self._send(sb, batch), batches))
+        return len(pending)
+
+    def _send(self, sb, rows: list[dict]):
+        try:
+            sb.update_rows(self.table, rows)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                log.error(f"Failed to update {self.table} {rows[0]['id']}: {e}")
+                return
+            log.warning(f"Bulk update of {len(rows)} {self.table} rows failed ({e}) — retrying row by row")
+        for row in rows:
+            try:
+                sb.update(self.table, row["id"], row["fields"])
+            except Exception as e:
+                log.error(f"Failed to update {self.table} {row['id']}: {e}")
@@ -0,0 +1,339 @@
+"""
+Durable job queue — SQLite-backed, fixed worker pool.
+
+Replaces thread-per-request background work (gallery pipelines, style
+training) so load spikes queue up instead of thrashing RAM and CPU:
+  - jobs survive restarts (anything 'running' at startup is re-queued)
+  - a fixed number of worker threads (JOB_WORKERS) run jobs
+  - repeat submissions with the same dedupe key collapse into one job
+  - failed jobs are retried with exponential backoff + jitter
+  - queue depth and per-job position are queryable
+  - queued or running jobs can be cancelled; a job is not claimed while a
+    cancelled run with the same dedupe key is still stopping
+
+Handlers are plain sync callables `handler(job_id, payload)` registered per
+job kind with `register_handler` (at import time — it doesn't touch the
+database); they signal failure by raising. Any exception is retried,
+except PermanentJobError, which fails the job at once. Cancelling a
+running job only marks it 'canceling' (with the reason) — the handler is
+expected to notice via app.pipeline.cancellation, and the job becomes
+'canceled' when the handler returns.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELING = "canceling"
+CANCELED = "canceled"
+
+_handlers: dict[str, Callable[[str, dict], None]] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a failure no retry can fix — the job fails at once."""
+
+
+def register_handler(kind: str, handler: Callable[[str, dict], None]):
+    """Register the function that runs jobs of `kind`."""
+    _handlers[kind] = handler
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    cancel_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, run_after, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key, status);
+"""
+
+
+class JobQueue:
+    """Persistent FIFO job queue with a fixed pool of worker threads."""
+
+    def __init__(self, path: str, workers: int = 2, max_attempts: int = 3, backoff_s: float = 30.0):
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_s = backoff_s
+        self._lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "cancel_reason" not in columns:
+            # Databases created before cancel reasons were recorded
+            self._db.execute("ALTER TABLE jobs ADD COLUMN cancel_reason TEXT")
+
+    # ── Lifecycle ──
+
+    def start(self):
+        """Re-queue jobs interrupted by a restart and start the workers."""
+        if self._threads:
+            return
+        with self._lock:
+            now = time.time()
+            cur = self._db.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (QUEUED, now, RUNNING),
+            )
+            # A job that was being cancelled when the process died is done
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (CANCELED, now, CANCELING),
+            )
+        if cur.rowcount:
+            log.info(f"Re-queued {cur.rowcount} job(s) interrupted by restart")
+        self._stopping = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        log.info(f"Job queue started: {self.workers} workers, db={self.path}")
+
+    def stop(self):
+        """Stop taking new jobs. Running jobs are re-queued on next start."""
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        self._threads = []
+
+    # ── Submission / inspection ──
+
+    def submit(self, kind: str, payload: dict, dedupe_key: Optional[str] = None) -> dict:
+        """Enqueue a job. If an active job has the same dedupe key, reuse it.
+
+        A still-queued duplicate takes the newer payload; a running one is
+        left alone. Returns {"id", "status", "position", "deduplicated"}.
+        """
+        now = time.time()
+        with self._lock:
+            existing = self._active(dedupe_key) if dedupe_key else None
+            if existing:
+                if existing["status"] == QUEUED:
+                    self._db.execute(
+                        "UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(payload), now, existing["id"]),
+                    )
+                job_id, status, deduplicated = existing["id"], existing["status"], True
+            else:
+                job_id, status, deduplicated = str(uuid.uuid4()), QUEUED, False
+                self._db.execute(
+                    "INSERT INTO jobs (id, kind, dedupe_key, payload, status, run_after, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, dedupe_key, json.dumps(payload), QUEUED, now, now, now),
+                )
+        with self._wake:
+            self._wake.notify()
+        return {"id": job_id, "status": status, "position": self.position(job_id), "deduplicated": deduplicated}
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_dict(row)
+
+    def find_active(self, dedupe_key: str) -> Optional[dict]:
+        """The queued or running job for a dedupe key, if any."""
+        with self._lock:
+            return self._active(dedupe_key)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position among queued jobs; 0 if running; None if finished/unknown."""
+        with self._lock:
+            row = self._db.execute("SELECT status, created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                return None
+            if row["status"] == RUNNING:
+                return 0
+            if row["status"] != QUEUED:
+                return None
+            ahead = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                (QUEUED, row["created_at"]),
+            ).fetchone()[0]
+        return ahead + 1
+
+    def cancel(self, job_id: str, reason: str = CANCELED) -> Optional[str]:
+        """Cancel a queued or running job. Returns its previous status.
+
+        A queued job becomes 'canceled' and is never claimed. A running job
+        becomes 'canceling' and keeps running until its handler notices
+        (see `cancel_reason`); it is no longer an active duplicate, so a
+        fresh submission with the same dedupe key gets a new job.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row or row["status"] not in (QUEUED, RUNNING):
+                return row["status"] if row else None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, cancel_reason = ?, updated_at = ? WHERE id = ?",
+                (CANCELED if row["status"] == QUEUED else CANCELING, reason, time.time(), job_id),
+            )
+        return row["status"]
+
+    def cancel_reason(self, job_id: str) -> Optional[str]:
+        """Why a job was cancelled, if it has been — handlers check this when they start."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cancel_reason FROM jobs WHERE id = ? AND status IN (?, ?)",
+                (job_id, CANCELING, CANCELED),
+            ).fetchone()
+        return row["cancel_reason"] if row else None
+
+    def retries_left(self, job_id: str) -> int:
+        """How many more attempts a job gets if its current one fails."""
+        job = self.get(job_id)
+        return max(0, self.max_attempts - job["attempts"]) if job else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status",
+                (QUEUED, RUNNING),
+            ).fetchall())
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "workers": self.workers,
+        }
+
+    # ── Internals ──
+
+    def _active(self, dedupe_key: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+            (dedupe_key, QUEUED, RUNNING),
+        ).fetchone()
+        return _row_to_dict(row)
+
+    def _claim(self) -> tuple[Optional[dict], Optional[float]]:
+        """Atomically take the next runnable job. Also returns seconds until the next one is due."""
+        now = time.time()
+        with self._lock:
+            # Never alongside a cancelled run of the same key that is still stopping
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE status = ? AND (dedupe_key IS NULL OR dedupe_key NOT IN "
+                "(SELECT dedupe_key FROM jobs WHERE status = ? AND dedupe_key IS NOT NULL)) "
+                "ORDER BY run_after <= ? DESC, created_at LIMIT 1",
+                (QUEUED, CANCELING, now),
+            ).fetchone()
+            if row is None:
+                return None, None
+            if row["run_after"] > now:
+                return None, row["run_after"] - now
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, now, row["id"]),
+            )
+        job = _row_to_dict(row)
+        job["attempts"] += 1
+        return job, None
+
+    def _finish(self, job: dict, error: Optional[str] = None, retry: bool = True):
+        now = time.time()
+        if error is None:
+            status, run_after = DONE, now
+        elif retry and job["attempts"] < self.max_attempts:
+            delay = self.backoff_s * (2 ** (job["attempts"] - 1))
+            status, run_after = QUEUED, now + delay * random.uniform(1.0, 1.25)
+            log.warning(f"Job {job['id']} ({job['kind']}) failed, retry {job['attempts']}/{self.max_attempts - 1} in {run_after - now:.0f}s: {error}")
+        elif not retry:
+            status, run_after = FAILED, now
+            log.error(f"Job {job['id']} ({job['kind']}) failed permanently: {error}")
+        else:
+            status, run_after = FAILED, now
+            log.error(f"Job {job['id']} ({job['kind']}) failed permanently after {job['attempts']} attempts: {error}")
+        with self._lock:
+            # A job cancelled while it ran ends canceled — never retried
+            was_canceling = self._db.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job["id"],),
+            ).fetchone()["status"] == CANCELING
+            self._db.execute(
+                "UPDATE jobs SET status = CASE status WHEN ? THEN ? ELSE ? END, "
+                "run_after = ?, updated_at = ?, last_error = ? WHERE id = ?",
+                (CANCELING, CANCELED, status, run_after, now, error, job["id"]),
+            )
+        if was_canceling:
+            # A job held back behind this run may be claimable now
+            with self._wake:
+                self._wake.notify_all()
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                job, wait = self._claim()
+            except Exception as e:
+                log.error(f"Job queue claim failed: {e}")
+                job, wait = None, 5.0
+            if job is None:
+                with self._wake:
+                    if not self._stopping:
+                        self._wake.wait(timeout=min(wait, 60.0) if wait else 60.0)
+                continue
+
+            handler = _handlers.get(job["kind"])
+            if handler is None:
+                self._finish(job, error=f"No handler for job kind '{job['kind']}'")
+                continue
+            try:
+                handler(job["id"], job["payload"])
+                self._finish(job)
+            except PermanentJobError as e:
+                self._finish(job, error=str(e) or type(e).__name__, retry=False)
+            except Exception as e:
+                self._finish(job, error=str(e) or type(e).__name__)
+
+
+def _row_to_dict(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        s = get_settings()
+        _queue = JobQueue(
+            s.job_queue_path,
+            workers=s.job_workers,
+            max_attempts=s.job_max_attempts,
+            backoff_s=s.job_retry_backoff_s,
+        )
+    return _queue
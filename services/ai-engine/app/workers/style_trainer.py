@@ -3,29 +3,37 @@ Style Training Worker (v2.0)
 
 Handles async training of style profiles:
 1. Validates photographer_id ownership
-2. Downloads reference images from Supabase Storage
+2. Downloads reference images from Supabase Storage (several at once, on
+   the async client — decoding runs in threads so downloads keep flowing)
 3. Optionally parses uploaded Lightroom preset (.xmp / .lrtemplate)
 4. Trains combined profile (preset baseline + reference learning)
 5. Saves profile to DB scoped to photographer_id
 """
+import asyncio
 import logging
 import traceback
 import numpy as np
 import cv2
 from datetime import datetime, timezone
+from typing import Optional
 
+from app.config import get_settings
 from app.pipeline.phase1_style import compute_channel_stats, load_image_from_bytes
 from app.pipeline.preset_parser import parse_preset_file
-from app.storage.supabase_storage import download_photo
-from app.storage.db import get_style_profile, update_style_profile
+from app.storage.supabase_storage import download_photo_async
+from app.storage.db import get_style_profile_async, update_style_profile_async
 
 log = logging.getLogger(__name__)
 
+TRAIN_MAX_DIM = 800  # Resize for stats computation — saves memory
 
-def train_profile(profile_id: str):
+
+async def train_profile(profile_id: str, reference_keys: Optional[list[str]] = None):
     """
     Train a style profile from its reference images + optional preset.
 
+    `reference_keys` overrides the profile's stored reference_image_keys.
+
     Updates the style_profiles record with:
     - status: training → ready (or error)
     - settings: the computed style profile (JSON)
@@ -35,27 +43,27 @@ def train_profile(profile_id: str):
 
     try:
         # Mark as training
-        update_style_profile(
+        await update_style_profile_async(
             profile_id,
             status="training",
             training_started_at=datetime.now(timezone.utc).isoformat(),
         )
 
         # Fetch profile
-        profile = get_style_profile(profile_id)
+        profile = await get_style_profile_async(profile_id)
         if not profile:
             log.error(f"Style profile {profile_id} not found")
             return
 
         photographer_id = profile.get("photographer_id")
         if not photographer_id:
-            update_style_profile(profile_id, status="error")
+            await update_style_profile_async(profile_id, status="error")
             log.error("Style profile has no photographer_id — cannot train")
             return
 
-        ref_keys = profile.get("reference_image_keys", [])
+        ref_keys = reference_keys or profile.get("reference_image_keys", [])
         if not ref_keys:
-            update_style_profile(profile_id, status="error")
+            await update_style_profile_async(profile_id, status="error")
             log.error("No reference images in profile")
             return
 
@@ -75,33 +83,28 @@ def train_profile(profile_id: str):
             log.warning("No keys matched photographer prefix — using all keys (legacy mode)")
             valid_keys = ref_keys
 
-        # Download, decode, and compute stats one image at a time (memory safe)
-        # Don't hold all images in memory — compute stats per image and accumulate
-        all_stats = []
-        valid_count = 0
-        TRAIN_MAX_DIM = 800  # Resize for stats computation — saves memory
+        # Download, decode, and compute stats per image (memory safe) —
+        # only max_concurrent_images originals are in flight at once, and
+        # each is dropped as soon as its stats are computed
+        slots = asyncio.Semaphore(max(1, get_settings().max_concurrent_images))
 
-        for key in valid_keys:
+        async def reference_stats(key: str) -> Optional[dict]:
             try:
-                data = download_photo(key)
-                if data:
-                    img = load_image_from_bytes(data)
-                    del data  # Free raw bytes
-                    if img is not None:
-                        # Resize for stats computation
-                        h, w = img.shape[:2]
-                        if max(h, w) > TRAIN_MAX_DIM:
-                            scale = TRAIN_MAX_DIM / max(h, w)
-                            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-                        stats = compute_channel_stats(img)
-                        all_stats.append(stats)
-                        del img  # Free image immediately
-                        valid_count += 1
+                async with slots:
+                    data = await download_photo_async(key)
+                    if not data:
+                        return None
+                    return await asyncio.to_thread(_image_stats, data)
             except Exception as e:
                 log.warning(f"Failed to load reference image {key}: {e}")
+                return None
+
+        results = await asyncio.gather(*(reference_stats(key) for key in valid_keys))
+        all_stats = [stats for stats in results if stats is not None]
+        valid_count = len(all_stats)
 
         if valid_count < 10:
-            update_style_profile(profile_id, status="error")
+            await update_style_profile_async(profile_id, status="error")
             log.error(f"Only {valid_count} valid reference images — need at least 10")
             return
 
@@ -111,7 +114,7 @@ def train_profile(profile_id: str):
         if preset_key:
             log.info(f"Loading preset file: {preset_key}")
             try:
-                preset_data = download_photo(preset_key)
+                preset_data = await download_photo_async(preset_key)
                 if preset_data:
                     preset_content = preset_data.decode("utf-8", errors="replace")
                     preset_params = parse_preset_file(preset_content, preset_key)
@@ -145,11 +148,11 @@ def train_profile(profile_id: str):
         style_data = profile_data
 
         if "error" in style_data:
-            update_style_profile(profile_id, status="error")
+            await update_style_profile_async(profile_id, status="error")
             return
 
         # Save the trained profile
-        update_style_profile(
+        await update_style_profile_async(
             profile_id,
             status="ready",
             settings=style_data,
@@ -160,4 +163,17 @@ def train_profile(profile_id: str):
 
     except Exception as e:
         log.error(f"Style training failed: {e}\n{traceback.format_exc()}")
-        update_style_profile(profile_id, status="error")
+        await update_style_profile_async(profile_id, status="error")
+
+
+def _image_stats(data: bytes) -> Optional[dict]:
+    """Decode one reference image at training size and compute its channel stats."""
+    img = load_image_from_bytes(data, min_dimension=TRAIN_MAX_DIM)
+    if img is None:
+        return None
+    # Resize for stats computation
+    h, w = img.shape[:2]
+    if max(h, w) > TRAIN_MAX_DIM:
+        scale = TRAIN_MAX_DIM / max(h, w)
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return compute_channel_stats(img)
@@ -0,0 +1,68 @@
+"""Cancel tokens — only registered jobs can be flagged, and nothing leaks."""
+import pytest
+
+from app.pipeline import cancellation
+from app.pipeline.cancellation import CANCELED, PREEMPTED, PipelineCancelled
+
+
+@pytest.fixture(autouse=True)
+def no_tokens(monkeypatch):
+    monkeypatch.setattr(cancellation, "_tokens", {})
+
+
+def test_cancel_flags_a_registered_token():
+    token = cancellation.register("job-1")
+    assert cancellation.cancel("job-1", PREEMPTED) is True
+
+    assert token.is_cancelled and token.preempted
+    with pytest.raises(PipelineCancelled) as exc:
+        token.raise_if_cancelled()
+    assert exc.value.reason == PREEMPTED
+
+
+def test_first_reason_wins():
+    token = cancellation.register("job-1")
+    cancellation.cancel("job-1")
+    cancellation.cancel("job-1", PREEMPTED)
+    assert token.reason == CANCELED
+
+
+def test_cancelling_an_unregistered_job_creates_no_token():
+    assert cancellation.cancel("never-started") is False
+    assert cancellation._tokens == {}
+
+
+def test_unregister_drops_the_token():
+    cancellation.register("job-1")
+    cancellation.unregister("job-1")
+    assert cancellation._tokens == {}
+    assert cancellation.cancel("job-1") is False
+
+
+def test_gallery_job_cancelled_before_registering_stops_at_once(monkeypatch, tmp_path):
+    from app.routers import process
+    from app.workers.job_queue import JobQueue
+
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit(process.GALLERY_JOB, {"processing_job_id": "pj-1", "gallery_id": "g1"})["id"]
+    queue._claim()
+    # Preempted after the worker claimed the job, before its token existed
+    queue.cancel(job_id, PREEMPTED)
+    assert cancellation.cancel(job_id, PREEMPTED) is False
+
+    seen = []
+
+    async def fake_pipeline(cancel_token, **kwargs):
+        seen.append(cancel_token.reason)
+        return "canceled" if cancel_token.is_cancelled else "completed"
+
+    async def no_client():
+        pass
+
+    monkeypatch.setattr(process, "get_job_queue", lambda: queue)
+    monkeypatch.setattr(process, "run_pipeline", fake_pipeline)
+    monkeypatch.setattr(process, "close_async_supabase", no_client)
+    process.run_gallery_job(job_id, queue.get(job_id)["payload"])
+
+    assert seen == [PREEMPTED]
+    assert cancellation._tokens == {}
@@ -0,0 +1,134 @@
+"""Checkpoints — phase bitmap, input fingerprint, style invalidation and resume."""
+import asyncio
+
+from app.pipeline.checkpoints import PHASES, Checkpoint, input_fingerprint
+from app.pipeline.orchestrator import _ai_edits_with_checkpoint, _pending_windows
+
+
+def _photo(photo_id: str, done: list[str], style: str | None = "style-1", **overrides) -> dict:
+    """A photo row whose stored checkpoint has `done` phases complete."""
+    photo = {"id": photo_id, "original_key": f"p/g/{photo_id}.jpg", "file_size": 1000, **overrides}
+    checkpoint = Checkpoint(input_fingerprint(photo), style)
+    for phase in done:
+        checkpoint.mark(phase)
+    photo["ai_edits"] = {"checkpoint": checkpoint.to_dict()}
+    return photo
+
+
+def _done(checkpoint: Checkpoint) -> list[str]:
+    return [phase for phase in PHASES if checkpoint.is_done(phase)]
+
+
+def _windows(pages: list[list[dict]], style: str | None = "style-1", window_size: int = 8):
+    """Run _pending_windows over `pages`; returns ([(skipped, [ids])], photo_state)."""
+    photo_state: dict = {}
+
+    async def stream():
+        for page in pages:
+            yield page
+
+    async def collect():
+        return [
+            (skipped, [p["id"] for p in window])
+            async for skipped, window in _pending_windows(stream(), photo_state, style, window_size, {})
+        ]
+
+    return asyncio.run(collect()), photo_state
+
+
+# ── Checkpoint ──
+
+def test_round_trip_through_ai_edits():
+    photo = _photo("a", ["analysis", "style"])
+    checkpoint = Checkpoint.from_photo(photo, "style-1")
+    assert _done(checkpoint) == ["analysis", "style"]
+    assert checkpoint.first_incomplete == "retouch"
+
+
+def test_new_original_clears_everything():
+    photo = _photo("a", PHASES)
+    photo["original_key"] = "p/g/a-replaced.jpg"
+    checkpoint = Checkpoint.from_photo(photo, "style-1")
+    assert checkpoint.phases == 0
+    assert checkpoint.fingerprint == input_fingerprint(photo)
+
+
+def test_different_file_size_clears_everything():
+    photo = _photo("a", PHASES)
+    photo["file_size"] = 2000
+    assert Checkpoint.from_photo(photo, "style-1").phases == 0
+
+
+def test_style_change_clears_only_style_dependent_phases():
+    photo = _photo("a", PHASES, style="style-1")
+    checkpoint = Checkpoint.from_photo(photo, "style-2")
+    assert _done(checkpoint) == ["analysis"]
+    assert checkpoint.style_profile_id == "style-2"
+    # Dropping the style altogether counts as a change too
+    assert _done(Checkpoint.from_photo(photo, None)) == ["analysis"]
+
+
+def test_resume_from_clears_that_phase_and_everything_after():
+    checkpoint = Checkpoint("f")
+    for phase in ("analysis", "style", "retouch", "output"):
+        checkpoint.mark(phase)
+    checkpoint.resume_from("retouch")
+    assert _done(checkpoint) == ["analysis", "style"]
+
+
+def test_missing_or_malformed_checkpoint_starts_from_scratch():
+    assert Checkpoint.from_photo({"id": "a", "original_key": "k"}).phases == 0
+    assert Checkpoint.from_photo({"id": "a", "original_key": "k", "ai_edits": {"checkpoint": None}}).phases == 0
+
+
+def test_checkpoint_is_embedded_in_ai_edits():
+    checkpoint = Checkpoint("f", "style-1")
+    checkpoint.mark("analysis")
+    ps = {"ai_edits": {"style_applied": True}, "checkpoint": checkpoint}
+    assert _ai_edits_with_checkpoint(ps) == {
+        "style_applied": True,
+        "checkpoint": {"phases": 1, "fingerprint": "f", "style_profile_id": "style-1"},
+    }
+
+
+# ── Resume ──
+
+def test_finished_photos_are_skipped_and_the_rest_resume():
+    pages = [[
+        _photo("done", PHASES),
+        _photo("half", ["analysis", "style"]),
+        _photo("new", []),
+    ]]
+    windows, state = _windows(pages)
+
+    assert windows == [(1, ["half", "new"])]
+    assert _done(state["half"]["checkpoint"]) == ["analysis", "style"]
+    assert _done(state["new"]["checkpoint"]) == []
+
+
+def test_a_gap_resumes_from_the_first_incomplete_phase():
+    # Analysis failed but later phases ran — everything is redone
+    windows, state = _windows([[_photo("gap", PHASES[1:])]])
+    assert windows == [(0, ["gap"])]
+    assert _done(state["gap"]["checkpoint"]) == []
+
+
+def test_second_run_after_a_complete_run_skips_everything():
+    pages = [[_photo(f"p{i}", PHASES) for i in range(5)], [_photo(f"q{i}", PHASES) for i in range(5)]]
+    windows, state = _windows(pages, window_size=4)
+    assert windows == [(10, [])]
+    assert state == {}
+
+
+def test_style_change_reopens_finished_photos_after_analysis():
+    windows, state = _windows([[_photo("a", PHASES, style="style-1")]], style="style-2")
+    assert windows == [(0, ["a"])]
+    assert _done(state["a"]["checkpoint"]) == ["analysis"]
+
+
+def test_skipped_counts_are_reported_per_window():
+    page = [_photo("d1", PHASES), _photo("a", []), _photo("b", []), _photo("d2", PHASES), _photo("c", [])]
+    windows, _ = _windows([page], window_size=2)
+    assert sum(skipped for skipped, _ in windows) == 2
+    assert sorted(pid for _, window in windows for pid in window) == ["a", "b", "c"]
+    assert all(len(window) <= 2 for _, window in windows)
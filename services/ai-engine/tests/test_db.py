@@ -0,0 +1,38 @@
+"""Database helpers — paginated gallery reads fail loudly, never truncated."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.storage import db
+
+
+class FakePages:
+    """select_pages that yields `pages` one-row pages, then optionally fails."""
+
+    def __init__(self, pages: int, fail: bool = False):
+        self.pages = pages
+        self.fail = fail
+
+    async def select_pages(self, table, columns="*", filters=None, page_size=None):
+        for i in range(self.pages):
+            yield [{"id": f"p{i}"}]
+        if self.fail:
+            raise httpx.ReadTimeout("page timed out")
+
+
+def _collect(pages) -> list[list[dict]]:
+    async def run():
+        return [page async for page in pages]
+    return asyncio.run(run())
+
+
+def test_iter_gallery_photos_yields_every_page(monkeypatch):
+    monkeypatch.setattr(db, "get_async_supabase", lambda: FakePages(3))
+    assert _collect(db.iter_gallery_photos_async("g1")) == [[{"id": "p0"}], [{"id": "p1"}], [{"id": "p2"}]]
+
+
+def test_iter_gallery_photos_raises_mid_pagination(monkeypatch):
+    monkeypatch.setattr(db, "get_async_supabase", lambda: FakePages(2, fail=True))
+    with pytest.raises(httpx.ReadTimeout):
+        _collect(db.iter_gallery_photos_async("g1"))
@@ -0,0 +1,247 @@
+"""Image decoder — format detection, the decode-once ImageHandle and reduced decodes."""
+import io
+import struct
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.pipeline.decoder import (
+    ImageHandle, decode_raw_preview, decode_reduced, detect_format, jpeg_dimensions,
+)
+
+
+def _scene(width: int, height: int) -> np.ndarray:
+    """A smooth BGR gradient — downscales of it are easy to compare."""
+    yy, xx = np.mgrid[0:height, 0:width]
+    return np.stack([xx * 255 // width, yy * 255 // height, np.full_like(xx, 128)], -1).astype(np.uint8)
+
+
+def _jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    img = Image.fromarray(_scene(width, height)[:, :, ::-1])
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def _dng(width: int = 640, height: int = 480, preview: tuple[int, int] | None = (640, 480)) -> bytes:
+    """A minimal Bayer DNG with an optional embedded JPEG preview of the given size."""
+    SHORT, LONG, RATIONAL, SRATIONAL, BYTE, ASCII = 3, 4, 5, 10, 1, 2
+    scene = _scene(width, height)[:, :, ::-1].astype(np.float64) / 255
+    raw = np.zeros((height, width), np.uint16)
+    raw[0::2, 0::2] = scene[0::2, 0::2, 0] * 3000 + 200
+    raw[0::2, 1::2] = scene[0::2, 1::2, 1] * 3000 + 200
+    raw[1::2, 0::2] = scene[1::2, 0::2, 1] * 3000 + 200
+    raw[1::2, 1::2] = scene[1::2, 1::2, 2] * 3000 + 200
+    data = bytearray(b"II*\x00\x00\x00\x00\x00")
+
+    def blob(payload: bytes) -> int:
+        offset = len(data)
+        data.extend(payload)
+        if len(data) % 2:
+            data.append(0)
+        return offset
+
+    def ifd(entries) -> int:
+        fmt = {SHORT: "<H", LONG: "<I", BYTE: "<B"}
+        packed = []
+        for tag, typ, values in sorted(entries):
+            if typ == ASCII:
+                payload = values.encode() + b"\0"
+            elif typ in (RATIONAL, SRATIONAL):
+                payload = b"".join(struct.pack("<ii" if typ == SRATIONAL else "<II", *v) for v in values)
+            else:
+                payload = b"".join(struct.pack(fmt[typ], v) for v in values)
+            count = len(payload) if typ == ASCII else len(values)
+            value = payload.ljust(4, b"\0") if len(payload) <= 4 else struct.pack("<I", blob(payload))
+            packed.append(struct.pack("<HHI", tag, typ, count) + value)
+        offset = len(data)
+        data.extend(struct.pack("<H", len(packed)) + b"".join(packed) + b"\0\0\0\0")
+        return offset
+
+    raw_bytes = raw.tobytes()
+    raw_off = blob(raw_bytes)
+    sub_ifds = [ifd([
+        (254, LONG, [0]), (256, LONG, [width]), (257, LONG, [height]), (258, SHORT, [16]), (259, SHORT, [1]),
+        (262, SHORT, [32803]), (273, LONG, [raw_off]), (277, SHORT, [1]), (278, LONG, [height]),
+        (279, LONG, [len(raw_bytes)]), (284, SHORT, [1]), (33421, SHORT, [2, 2]), (33422, BYTE, [0, 1, 1, 2]),
+        (50717, LONG, [4095]),
+    ])]
+    if preview is not None:
+        pw, ph = preview
+        jpeg = cv2.imencode(".jpg", _scene(pw, ph))[1].tobytes()
+        sub_ifds.append(ifd([
+            (254, LONG, [1]), (256, LONG, [pw]), (257, LONG, [ph]), (258, SHORT, [8, 8, 8]), (259, SHORT, [7]),
+            (262, SHORT, [6]), (273, LONG, [blob(jpeg)]), (277, SHORT, [3]), (278, LONG, [ph]),
+            (279, LONG, [len(jpeg)]),
+        ]))
+    thumb = cv2.resize(_scene(width, height), (64, 48))[:, :, ::-1].tobytes()
+    ifd0 = ifd([
+        (254, LONG, [1]), (256, LONG, [64]), (257, LONG, [48]), (258, SHORT, [8, 8, 8]), (259, SHORT, [1]),
+        (262, SHORT, [2]), (271, ASCII, "Canon"), (272, ASCII, "EOS Test"), (273, LONG, [blob(thumb)]),
+        (274, SHORT, [1]), (277, SHORT, [3]), (278, LONG, [48]), (279, LONG, [len(thumb)]),
+        (330, LONG, sub_ifds), (50706, BYTE, [1, 4, 0, 0]), (50708, ASCII, "Canon EOS Test"),
+        (50721, SRATIONAL, [(10000, 10000), (0, 1), (0, 1), (0, 1), (10000, 10000), (0, 1), (0, 1), (0, 1), (10000, 10000)]),
+        (50728, RATIONAL, [(1, 1), (1, 1), (1, 1)]),
+    ])
+    struct.pack_into("<I", data, 4, ifd0)
+    return bytes(data)
+
+
+# ── Format detection ──
+
+@pytest.mark.parametrize("head, filename, expected", [
+    (b"\xff\xd8\xff\xe1" + b"\0" * 12, "a.jpg", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n" + b"\0" * 8, "a.png", "png"),
+    (b"RIFF\0\0\0\0WEBPVP8 ", "a.webp", "webp"),
+    (b"GIF89a" + b"\0" * 10, "a.gif", "gif"),
+    (b"BM" + b"\0" * 14, "a.bmp", "bmp"),
+    (b"\0\0\0\x18ftypheic\0\0\0\0", "a.heic", "heif"),
+    (b"\0\0\0\x18ftypcrx \0\0\0\0", "a.cr3", "raw"),
+    (b"II*\0\x10\0\0\0CR\x02\0\0\0\0\0", "a.bin", "raw"),
+    (b"FUJIFILMCCD-RAW ", "a.bin", "raw"),
+    (b"IIRO\x08\0\0\0" + b"\0" * 8, "a.orf", "raw"),
+    (b"II*\0\x08\0\0\0" + b"\0" * 8, "a.nef", "raw"),
+    (b"II*\0\x08\0\0\0" + b"\0" * 8, "a.tif", "tiff"),
+    (b"MM\0*\0\0\0\x08" + b"\0" * 8, "scan.tiff", "tiff"),
+    (b"\0" * 16, "a.dng", "raw"),
+    (b"\0" * 16, "notes.txt", "unknown"),
+])
+def test_detect_format(head, filename, expected):
+    assert detect_format(head, filename) == expected
+
+
+def test_jpeg_dimensions_apply_exif_orientation():
+    assert jpeg_dimensions(_jpeg(320, 200)) == (320, 200)
+    assert jpeg_dimensions(_jpeg(320, 200, orientation=6)) == (200, 320)
+    assert jpeg_dimensions(cv2.imencode(".png", _scene(32, 32))[1].tobytes()) is None
+
+
+# ── Reduced JPEG decode ──
+
+@pytest.mark.parametrize("min_dimension, long_side", [
+    (2000, 1600),   # nothing smaller covers it — full size
+    (800, 800),     # 1/2
+    (400, 400),     # 1/4
+    (100, 200),     # 1/8 is the smallest scale libjpeg offers
+])
+def test_reduced_decode_picks_the_smallest_scale_that_covers_the_target(min_dimension, long_side):
+    img, w, h = decode_reduced(_jpeg(1600, 1200), min_dimension)
+    assert max(img.shape[:2]) == long_side
+    assert (w, h) == (1600, 1200)
+
+
+def test_reduced_decode_is_none_for_non_jpegs():
+    assert decode_reduced(cv2.imencode(".png", _scene(64, 64))[1].tobytes(), 16) is None
+
+
+# ── ImageHandle ──
+
+def test_handle_serves_small_sizes_without_a_full_decode():
+    handle = ImageHandle(_jpeg(1600, 1200), "a.jpg")
+    img = handle.at_least(400)
+    assert img.shape[:2] == (300, 400)
+    assert handle._full is None
+    assert handle.size == (1600, 1200)
+
+
+def test_handle_reuses_cached_decodes():
+    handle = ImageHandle(_jpeg(1600, 1200), "a.jpg")
+    half = handle.at_least(800)
+    # A smaller target is served from what's already decoded
+    assert handle.at_least(500) is half
+    full = handle.full()
+    assert full.shape[:2] == (1200, 1600)
+    assert handle.full() is full
+    # Once the full image exists nothing is decoded again
+    assert handle.at_least(1000) is full
+
+
+def test_fit_scales_from_the_full_dimensions():
+    handle = ImageHandle(_jpeg(1600, 1200), "a.jpg")
+    small = handle.fit(500)
+    assert small.shape[:2] == (375, 500)
+    # The same target from a fully decoded handle gives the same size
+    other = ImageHandle(_jpeg(1600, 1200), "a.jpg")
+    other.full()
+    assert other.fit(500).shape == small.shape
+    assert handle.fit(4000).shape[:2] == (1200, 1600)
+
+
+def test_fit_matches_a_plain_downscale():
+    data = _jpeg(1600, 1200)
+    expected = cv2.resize(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), (400, 300),
+                          interpolation=cv2.INTER_AREA)
+    got = ImageHandle(data, "a.jpg").fit(400)
+    assert np.abs(got.astype(int) - expected.astype(int)).mean() < 3
+
+
+def test_release_drops_cached_arrays():
+    handle = ImageHandle(_jpeg(800, 600), "a.jpg")
+    handle.full()
+    handle.fit(200)
+    handle.release()
+    assert handle._full is None and handle._scaled == []
+    # Still usable — it just decodes again
+    assert handle.full().shape[:2] == (600, 800)
+
+
+def test_handle_reads_local_paths(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(_jpeg(800, 600))
+    handle = ImageHandle(str(path))
+    assert handle.format == "jpeg"
+    assert handle.at_least(200).shape[:2] == (150, 200)
+
+
+def test_undecodable_source_is_none():
+    handle = ImageHandle(b"not an image at all", "a.jpg")
+    assert handle.full() is None
+    assert handle.fit(100) is None
+
+
+# ── RAW previews ──
+
+def _is_preview(img: np.ndarray) -> bool:
+    """The embedded preview has the scene's flat red channel; a demosaic doesn't."""
+    return img[:, :, 2].std() < 5
+
+def test_raw_uses_a_full_size_embedded_preview():
+    img, w, h = decode_raw_preview(_dng(preview=(640, 480)), 320)
+    assert (w, h) == (640, 480)
+    # The 640px preview, reduced at the DCT stage to the smallest scale ≥ 320
+    assert img.shape[:2] == (240, 320)
+    assert _is_preview(img)
+
+
+def test_raw_preview_with_a_different_aspect_is_ignored():
+    # A 16:9 crop of a 4:3 sensor — falls back to the half-size demosaic
+    img, w, h = decode_raw_preview(_dng(preview=(640, 360)), 320)
+    assert (w, h) == (640, 480)
+    assert img.shape[:2] == (240, 320)
+    assert not _is_preview(img)
+
+
+@pytest.mark.parametrize("preview", [None, (160, 120)])
+def test_raw_without_a_big_enough_preview_falls_back_to_half_size(preview):
+    img, w, h = decode_raw_preview(_dng(preview=preview), 320)
+    assert (w, h) == (640, 480)
+    assert img.shape[:2] == (240, 320)
+    assert not _is_preview(img)
+
+
+def test_handle_decodes_raws_from_the_preview_first():
+    handle = ImageHandle(_dng(preview=(640, 480)), "a.dng")
+    assert handle.is_raw
+    assert _is_preview(handle.at_least(320))
+    assert handle._full is None
+    assert handle.size == (640, 480)
+    # A half-size fallback that falls short still serves its target
+    fallback = ImageHandle(_dng(preview=None), "a.dng")
+    assert fallback.at_least(400).shape[:2] == (240, 320)
+    assert fallback._full is None
+    # Full resolution is the full demosaic
+    assert fallback.full().shape[:2] == (480, 640)
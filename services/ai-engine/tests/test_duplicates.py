@@ -0,0 +1,52 @@
+"""Perceptual-hash duplicate grouping — packed uint64 hashes, vectorised distances."""
+import random
+
+import numpy as np
+
+from app.pipeline.phase0_analysis import _GROUPING_BLOCK, group_duplicates, hamming_distance, hamming_distances
+
+
+def _flip(h: int, bits: list[int]) -> int:
+    for bit in bits:
+        h ^= 1 << bit
+    return h
+
+
+def test_hamming_distances_match_the_scalar_version():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(50)]
+    packed = np.array(hashes, dtype=np.uint64)
+
+    row = hamming_distances(hashes[0], packed)
+    assert row.tolist() == [hamming_distance(hashes[0], h) for h in hashes]
+    assert hamming_distances(format(hashes[0], "064b"), packed).tolist() == row.tolist()
+
+    matrix = hamming_distances(packed[:5], packed)
+    assert matrix.shape == (5, 50)
+    assert matrix[3].tolist() == [hamming_distance(hashes[3], h) for h in hashes]
+
+
+def test_near_hashes_join_the_earliest_leader():
+    base = random.Random(1).getrandbits(64)
+    other = base ^ ((1 << 64) - 1)
+    photos = [
+        {"id": "a", "_phash": base},
+        {"id": "b", "_phash": _flip(base, [1, 2, 3])},
+        {"id": "c", "_phash": other},
+        {"id": "d", "_phash": format(_flip(other, [5]), "064b")},
+        {"id": "e", "_phash": None},
+    ]
+    assert group_duplicates(photos) == {"a": ["a", "b"], "c": ["c", "d"], "e": ["e"]}
+
+
+def test_leaders_from_earlier_blocks_and_the_current_block_are_both_found():
+    rng = random.Random(2)
+    bases = [rng.getrandbits(64) for _ in range(3)]
+    photos = [{"id": f"p{i}", "_phash": bases[i % 3] if i < _GROUPING_BLOCK else _flip(bases[i % 3], [7])}
+              for i in range(_GROUPING_BLOCK + 10)]
+    photos.append({"id": "late", "_phash": rng.getrandbits(64)})
+    photos.append({"id": "late-dup", "_phash": _flip(photos[-1]["_phash"], [0, 9])})
+
+    groups = group_duplicates(photos)
+    assert sorted(len(members) for members in groups.values()) == [2, 174, 174, 174]
+    assert groups["late"] == ["late", "late-dup"]
@@ -0,0 +1,297 @@
+"""JobQueue — dedupe, retries, cancellation and crash recovery."""
+import threading
+import time
+import uuid
+
+import pytest
+
+from app.workers.job_queue import (
+    CANCELED, CANCELING, DONE, FAILED, QUEUED, RUNNING, JobQueue, PermanentJobError, register_handler,
+)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues: list[JobQueue] = []
+
+    def make(**kwargs) -> JobQueue:
+        kwargs.setdefault("backoff_s", 0.0)
+        q = JobQueue(str(tmp_path / "jobs.db"), **kwargs)
+        queues.append(q)
+        return q
+
+    yield make
+    for q in queues:
+        q.stop()
+
+
+def _kind(handler) -> str:
+    """Register `handler` under a fresh job kind (handlers are process-wide)."""
+    kind = f"test-{uuid.uuid4().hex[:8]}"
+    register_handler(kind, handler)
+    return kind
+
+
+def _wait_for(q: JobQueue, job_id: str, *statuses: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = q.get(job_id)
+        if job["status"] in statuses:
+            return job
+        assert time.monotonic() < deadline, f"job stuck in {job['status']}"
+        time.sleep(0.01)
+
+
+# ── Dedupe ──
+
+def test_duplicate_submission_reuses_the_queued_job_with_the_newer_payload(make_queue):
+    q = make_queue()
+    kind = _kind(lambda job_id, payload: None)
+    first = q.submit(kind, {"v": 1}, dedupe_key="gallery:1")
+    second = q.submit(kind, {"v": 2}, dedupe_key="gallery:1")
+
+    assert second["id"] == first["id"]
+    assert second["deduplicated"] is True
+    assert q.get(first["id"])["payload"] == {"v": 2}
+    assert q.stats()["queued"] == 1
+
+
+def test_duplicate_of_a_running_job_leaves_it_alone(make_queue):
+    q = make_queue()
+    kind = _kind(lambda job_id, payload: None)
+    job_id = q.submit(kind, {"v": 1}, dedupe_key="gallery:1")["id"]
+    q._claim()
+
+    again = q.submit(kind, {"v": 2}, dedupe_key="gallery:1")
+    assert again == {"id": job_id, "status": RUNNING, "position": 0, "deduplicated": True}
+    assert q.get(job_id)["payload"] == {"v": 1}
+
+
+def test_different_keys_are_separate_jobs(make_queue):
+    q = make_queue()
+    kind = _kind(lambda job_id, payload: None)
+    a = q.submit(kind, {}, dedupe_key="gallery:1")
+    b = q.submit(kind, {}, dedupe_key="gallery:2")
+    assert a["id"] != b["id"]
+    assert (a["position"], b["position"]) == (1, 2)
+
+
+# ── Running and retries ──
+
+def test_job_runs_to_done(make_queue):
+    q = make_queue(workers=1)
+    seen = []
+    kind = _kind(lambda job_id, payload: seen.append(payload))
+    job_id = q.submit(kind, {"gallery_id": "g1"})["id"]
+    q.start()
+
+    job = _wait_for(q, job_id, DONE)
+    assert seen == [{"gallery_id": "g1"}]
+    assert job["attempts"] == 1
+    assert q.position(job_id) is None
+
+
+def test_failed_job_is_retried_until_it_succeeds(make_queue):
+    q = make_queue(workers=1, max_attempts=3)
+    attempts = []
+
+    def flaky(job_id, payload):
+        attempts.append(q.retries_left(job_id))
+        if len(attempts) < 3:
+            raise RuntimeError("Supabase unavailable")
+
+    job_id = q.submit(_kind(flaky), {})["id"]
+    q.start()
+
+    job = _wait_for(q, job_id, DONE)
+    assert job["attempts"] == 3
+    # Each attempt sees how many more it would get
+    assert attempts == [2, 1, 0]
+
+
+def test_job_fails_after_max_attempts(make_queue):
+    q = make_queue(workers=1, max_attempts=2)
+
+    def broken(job_id, payload):
+        raise RuntimeError("still down")
+
+    job_id = q.submit(_kind(broken), {})["id"]
+    q.start()
+
+    job = _wait_for(q, job_id, FAILED)
+    assert job["attempts"] == 2
+    assert job["last_error"] == "still down"
+
+
+def test_permanent_error_fails_at_once(make_queue):
+    q = make_queue(workers=1, max_attempts=3)
+
+    def bad_input(job_id, payload):
+        raise PermanentJobError("gallery not found")
+
+    job_id = q.submit(_kind(bad_input), {})["id"]
+    q.start()
+
+    job = _wait_for(q, job_id, FAILED)
+    assert job["attempts"] == 1
+    assert job["last_error"] == "gallery not found"
+
+
+def test_retry_waits_for_the_backoff(make_queue):
+    q = make_queue(max_attempts=3, backoff_s=60.0)
+    job_id = q.submit(_kind(lambda job_id, payload: None), {})["id"]
+    job, _ = q._claim()
+    q._finish(job, error="boom")
+
+    assert q.get(job_id)["status"] == QUEUED
+    job, wait = q._claim()
+    assert job is None
+    assert 60.0 <= wait <= 75.0
+
+
+def test_unknown_kind_fails(make_queue):
+    q = make_queue(workers=1, max_attempts=1)
+    job_id = q.submit("no-such-kind", {})["id"]
+    q.start()
+
+    job = _wait_for(q, job_id, FAILED)
+    assert "No handler" in job["last_error"]
+
+
+# ── Cancellation ──
+
+def test_cancelled_queued_job_never_runs(make_queue):
+    q = make_queue(workers=1)
+    ran = []
+    kind = _kind(lambda job_id, payload: ran.append(job_id))
+    job_id = q.submit(kind, {})["id"]
+
+    assert q.cancel(job_id) == QUEUED
+    q.start()
+    done_id = q.submit(kind, {})["id"]
+    _wait_for(q, done_id, DONE)
+
+    assert ran == [done_id]
+    assert q.get(job_id)["status"] == CANCELED
+
+
+def test_cancelled_running_job_is_not_retried(make_queue):
+    q = make_queue(workers=1, max_attempts=3)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job_id, payload):
+        started.set()
+        release.wait(5)
+        raise RuntimeError("interrupted")
+
+    kind = _kind(slow)
+    job_id = q.submit(kind, {}, dedupe_key="gallery:1")["id"]
+    q.start()
+    assert started.wait(5)
+
+    assert q.cancel(job_id) == RUNNING
+    assert q.get(job_id)["status"] == CANCELING
+    # No longer an active duplicate — a fresh submission gets a new job
+    fresh_id = q.submit(kind, {}, dedupe_key="gallery:1")["id"]
+    assert fresh_id != job_id
+    release.set()
+    # One worker — once the fresh job has run out of attempts, the first is finished
+    _wait_for(q, fresh_id, FAILED)
+
+    job = q.get(job_id)
+    assert job["status"] == CANCELED
+    assert job["attempts"] == 1
+
+
+def test_fresh_job_waits_for_the_cancelled_run_to_stop(make_queue):
+    q = make_queue(workers=2)
+    started, release = threading.Event(), threading.Event()
+    events = []
+
+    def run(job_id, payload):
+        events.append(("start", payload["n"]))
+        if payload["n"] == 1:
+            started.set()
+            release.wait(5)
+        events.append(("end", payload["n"]))
+
+    kind = _kind(run)
+    old_id = q.submit(kind, {"n": 1}, dedupe_key="gallery:1")["id"]
+    q.start()
+    assert started.wait(5)
+
+    q.cancel(old_id, "preempted")
+    fresh_id = q.submit(kind, {"n": 2}, dedupe_key="gallery:1")["id"]
+    other_id = q.submit(kind, {"n": 3}, dedupe_key="gallery:2")["id"]
+    # The second worker is free, but only the other gallery's job may start
+    _wait_for(q, other_id, DONE)
+    assert q.get(fresh_id)["status"] == QUEUED
+
+    release.set()
+    _wait_for(q, fresh_id, DONE)
+    assert q.get(old_id)["status"] == CANCELED
+    assert events.index(("end", 1)) < events.index(("start", 2))
+
+
+def test_cancel_reason_is_recorded_for_the_handler(make_queue):
+    q = make_queue()
+    kind = _kind(lambda job_id, payload: None)
+    running_id = q.submit(kind, {})["id"]
+    q._claim()
+    queued_id = q.submit(kind, {})["id"]
+
+    assert q.cancel_reason(running_id) is None
+    q.cancel(running_id, "preempted")
+    q.cancel(queued_id)
+    assert q.cancel_reason(running_id) == "preempted"
+    assert q.cancel_reason(queued_id) == CANCELED
+
+
+def test_cancel_of_a_finished_job_changes_nothing(make_queue):
+    q = make_queue(workers=1)
+    job_id = q.submit(_kind(lambda job_id, payload: None), {})["id"]
+    q.start()
+    _wait_for(q, job_id, DONE)
+
+    assert q.cancel(job_id) == DONE
+    assert q.get(job_id)["status"] == DONE
+    assert q.cancel("missing") is None
+
+
+# ── Crash recovery ──
+
+def test_running_job_is_requeued_after_a_crash(make_queue):
+    crashed = make_queue()
+    ran = []
+    kind = _kind(lambda job_id, payload: ran.append(payload))
+    job_id = crashed.submit(kind, {"gallery_id": "g1"})["id"]
+    crashed._claim()
+    assert crashed.get(job_id)["status"] == RUNNING
+
+    # A new process opens the same database
+    restarted = make_queue(workers=1)
+    restarted.start()
+
+    job = _wait_for(restarted, job_id, DONE)
+    assert ran == [{"gallery_id": "g1"}]
+    assert job["attempts"] == 2
+
+
+def test_job_being_cancelled_during_a_crash_ends_canceled(make_queue):
+    crashed = make_queue()
+    job_id = crashed.submit(_kind(lambda job_id, payload: None), {})["id"]
+    crashed._claim()
+    crashed.cancel(job_id)
+
+    restarted = make_queue()
+    restarted.start()
+    assert restarted.get(job_id)["status"] == CANCELED
+
+
+def test_queued_jobs_survive_a_restart(make_queue):
+    first = make_queue()
+    kind = _kind(lambda job_id, payload: None)
+    ids = [first.submit(kind, {"n": n})["id"] for n in range(3)]
+
+    restarted = make_queue()
+    assert [restarted.position(job_id) for job_id in ids] == [1, 2, 3]
@@ -0,0 +1,222 @@
+"""AdaptiveLimiter — AIMD feedback, retries and Retry-After."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import _response_size_kind, _size_kind
+from app.storage import limiter as limiter_module
+from app.storage.limiter import AdaptiveLimiter, is_transient
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry delays instead of sleeping."""
+    delays: list[float] = []
+    monkeypatch.setattr(limiter_module.time, "sleep", delays.append)
+    return delays
+
+
+def _responses(*statuses, headers=None):
+    """A send() returning the given statuses in turn, and the list of calls made."""
+    calls = []
+
+    def send():
+        calls.append(len(calls))
+        return httpx.Response(statuses[len(calls) - 1], headers=headers)
+    return send, calls
+
+
+# ── Feedback ──
+
+def test_steady_successes_grow_the_limit_additively():
+    limiter = AdaptiveLimiter(initial=4, max_limit=32)
+    for _ in range(4):
+        limiter.on_success("rest", 0.1)
+    # About +1 per limit's worth of successes
+    assert 4.9 < limiter.limit < 5.0
+    for _ in range(200):
+        limiter.on_success("rest", 0.1)
+    assert limiter.limit == pytest.approx(21.0, abs=1.0)
+
+
+def test_limit_never_exceeds_max():
+    limiter = AdaptiveLimiter(initial=30, max_limit=32)
+    for _ in range(1000):
+        limiter.on_success("rest", 0.1)
+    assert limiter.limit == 32
+
+
+def test_latency_spike_cuts_the_limit():
+    limiter = AdaptiveLimiter(initial=10, latency_tolerance=2.0, backoff_ratio=0.5, cooldown_s=0)
+    for _ in range(50):
+        limiter.on_success("rest", 0.1)
+    before = limiter.limit
+    for _ in range(5):
+        limiter.on_success("rest", 1.0)
+    assert limiter.limit < before / 2
+
+
+def test_latency_is_compared_per_kind():
+    limiter = AdaptiveLimiter(initial=10, cooldown_s=0)
+    for _ in range(50):
+        limiter.on_success("rest", 0.05)
+    before = limiter.limit
+    # A slow kind with its own (slow) baseline isn't a spike
+    for _ in range(5):
+        limiter.on_success("download<=65536KB", 5.0)
+    assert limiter.limit > before
+
+
+def test_overloads_within_the_cooldown_are_one_decrease():
+    limiter = AdaptiveLimiter(initial=20, backoff_ratio=0.5, cooldown_s=60)
+    limiter.on_overload("HTTP 503")
+    limiter.on_overload("HTTP 503")
+    limiter.on_overload("HTTP 503")
+    assert limiter.limit == 10
+    assert limiter.stats()["overloads"] == 3
+
+
+def test_limit_never_drops_below_min():
+    limiter = AdaptiveLimiter(initial=4, min_limit=2, backoff_ratio=0.1, cooldown_s=0)
+    for _ in range(10):
+        limiter.on_overload("HTTP 429")
+    assert limiter.limit == 2
+
+
+# ── Retries ──
+
+def test_idempotent_request_is_retried_on_5xx(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=4)
+    send, calls = _responses(503, 502, 200)
+    assert limiter.request("rest", send).status_code == 200
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_non_idempotent_request_is_not_retried_on_5xx(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=4)
+    send, calls = _responses(503, 200)
+    assert limiter.request("rest", send, idempotent=False).status_code == 503
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_non_idempotent_request_is_retried_on_429(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=4)
+    send, calls = _responses(429, 201)
+    assert limiter.request("rest", send, idempotent=False).status_code == 201
+    assert len(calls) == 2
+
+
+def test_gives_up_after_max_attempts(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=3)
+    send, calls = _responses(500, 500, 500, 200)
+    assert limiter.request("rest", send).status_code == 500
+    assert len(calls) == 3
+
+
+def test_client_errors_are_returned_without_retry(sleeps):
+    limiter = AdaptiveLimiter()
+    send, calls = _responses(404, 200)
+    assert limiter.request("rest", send).status_code == 404
+    assert len(calls) == 1
+
+
+def test_retry_after_is_honoured(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=3)
+    send, _ = _responses(429, 429, 200, headers={"retry-after": "2"})
+    limiter.request("rest", send)
+    assert sleeps == [2.0, 2.0]
+
+
+def test_retry_after_is_capped(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=2)
+    send, _ = _responses(503, 200, headers={"retry-after": "3600"})
+    limiter.request("rest", send)
+    assert sleeps == [30.0]
+
+
+def test_backoff_without_retry_after_is_jittered_exponential(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=4, retry_base_s=0.25)
+    send, _ = _responses(503, 503, 503, 200)
+    limiter.request("rest", send)
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps, start=1):
+        assert 0 <= delay <= 0.25 * 2 ** (attempt - 1)
+
+
+def test_transport_errors_are_retried_then_raised(sleeps):
+    limiter = AdaptiveLimiter(max_attempts=3)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        limiter.request("rest", send)
+    assert len(calls) == 3
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_kind_of_names_the_kind_from_the_response():
+    limiter = AdaptiveLimiter()
+    r = httpx.Response(200, content=b"x" * 300_000)
+    limiter.request("download", lambda: r, kind_of=_response_size_kind("download"))
+    assert list(limiter._latency) == ["download<=1024KB"]
+
+
+def test_request_async_retries_like_request(monkeypatch):
+    delays: list[float] = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(limiter_module.asyncio, "sleep", fake_sleep)
+    limiter = AdaptiveLimiter(max_attempts=4)
+    statuses = iter([429, 200])
+
+    async def send():
+        return httpx.Response(next(statuses), headers={"retry-after": "1"})
+
+    r = asyncio.run(limiter.request_async("rest", send, idempotent=False))
+    assert r.status_code == 200
+    assert delays == [1.0]
+
+
+# ── Helpers ──
+
+@pytest.mark.parametrize("size, kind", [
+    (0, "download<=64KB"),
+    (64 * 1024, "download<=64KB"),
+    (64 * 1024 + 1, "download<=256KB"),
+    (30 * 1024 * 1024, "download<=65536KB"),
+    (10 * 1024 ** 3, "download<=262144KB"),
+])
+def test_size_kind_buckets(size, kind):
+    assert _size_kind("download", size) == kind
+
+
+def test_response_size_kind_prefers_content_length():
+    kind_of = _response_size_kind("download")
+    assert kind_of(httpx.Response(200, headers={"content-length": str(40 * 1024 * 1024)})) == "download<=65536KB"
+    assert kind_of(httpx.Response(304)) == "download<=64KB"
+
+
+@pytest.mark.parametrize("exc, transient", [
+    (httpx.ConnectError("refused"), True),
+    (httpx.ReadTimeout("slow"), True),
+    (TimeoutError(), True),
+    (ValueError("bad"), False),
+])
+def test_is_transient(exc, transient):
+    assert is_transient(exc) is transient
+
+
+@pytest.mark.parametrize("status, transient", [(503, True), (429, True), (404, False), (400, False)])
+def test_is_transient_http_status(status, transient):
+    request = httpx.Request("GET", "http://example.test")
+    exc = httpx.HTTPStatusError("err", request=request, response=httpx.Response(status, request=request))
+    assert is_transient(exc) is transient
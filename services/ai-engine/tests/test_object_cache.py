@@ -0,0 +1,91 @@
+"""Object cache — downloads are cached and revalidated; uploads only invalidate."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import AsyncSupabaseClient, SupabaseClient, get_settings
+from app.storage import object_cache
+
+
+class FakeStorage:
+    """One mutable object with an ETag; answers conditional GETs with 304."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.version = 1
+        self.requests: list[tuple[str, str | None]] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        validator = request.headers.get("if-none-match")
+        self.requests.append((request.method, validator))
+        etag = f'"v{self.version}"'
+        if request.method == "PUT":
+            self.data = request.content
+            self.version += 1
+            return httpx.Response(200, json={"Key": request.url.path})
+        if validator == etag:
+            return httpx.Response(304, headers={"etag": etag})
+        return httpx.Response(200, content=self.data, headers={"etag": etag})
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(monkeypatch, tmp_path):
+    s = get_settings()
+    monkeypatch.setattr(s, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(s, "storage_cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(s, "storage_cache_max_bytes", 64 * 1024 * 1024)
+    monkeypatch.setattr(object_cache, "_cache", None)
+
+
+def _client(storage: FakeStorage) -> SupabaseClient:
+    sb = SupabaseClient()
+    sb._http_client = httpx.Client(transport=httpx.MockTransport(storage))
+    return sb
+
+
+def test_download_is_cached_and_revalidated():
+    storage = FakeStorage(b"original")
+    sb = _client(storage)
+
+    assert sb.storage_download("photos", "a.jpg") == b"original"
+    assert sb.storage_download("photos", "a.jpg") == b"original"
+    assert storage.requests == [("GET", None), ("GET", '"v1"')]
+    assert object_cache.get_object_cache().hits == 1
+
+
+def test_upload_is_not_cached():
+    storage = FakeStorage(b"")
+    sb = _client(storage)
+
+    assert sb.storage_upload("photos", "out.jpg", b"edited")
+    assert object_cache.get_object_cache().lookup("photos", "out.jpg") is None
+    assert sb.storage_download("photos", "out.jpg") == b"edited"
+    assert storage.requests[-1] == ("GET", None)
+
+
+def test_upload_invalidates_a_cached_download():
+    storage = FakeStorage(b"original")
+    sb = _client(storage)
+    sb.storage_download("photos", "a.jpg")
+
+    assert sb.storage_upload("photos", "a.jpg", b"replaced")
+    assert object_cache.get_object_cache().lookup("photos", "a.jpg") is None
+    assert sb.storage_download("photos", "a.jpg") == b"replaced"
+
+
+def test_async_upload_is_not_cached():
+    storage = FakeStorage(b"")
+
+    async def run():
+        sb = AsyncSupabaseClient()
+        sb._http = httpx.AsyncClient(transport=httpx.MockTransport(storage))
+        try:
+            assert await sb.storage_upload("photos", "out.jpg", b"edited")
+            assert object_cache.get_object_cache().lookup("photos", "out.jpg") is None
+            assert await sb.storage_download("photos", "out.jpg") == b"edited"
+        finally:
+            await sb.aclose()
+
+    asyncio.run(run())
+    assert storage.requests[-1] == ("GET", None)
@@ -0,0 +1,140 @@
+"""Pre-flight scan — header parsing, the cost model and processing order."""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.pipeline.preflight import (
+    PREFLIGHT_VERSION, PhotoMeta, estimate_cost, order_for_processing, parse_header, photo_cost,
+)
+
+
+def _jpeg(width: int, height: int, taken: str = "2026:06:01 14:30:00", size: int = 4096) -> bytes:
+    """A JPEG with camera EXIF, padded past `size` so a header read is a real prefix."""
+    exif = Image.Exif()
+    exif[0x010F] = "Canon"
+    exif[0x0110] = "EOS R5"
+    exif.get_ifd(0x8769)[0x9003] = taken
+    buf = io.BytesIO()
+    noise = np.random.RandomState(0).randint(0, 255, (height, width, 3), np.uint8)
+    Image.fromarray(noise).save(buf, "JPEG", quality=95, exif=exif)
+    data = buf.getvalue()
+    assert len(data) > size
+    return data
+
+
+# ── Cost model ──
+
+def test_reference_jpeg_costs_one():
+    assert estimate_cost(False, 6000, 4000, None) == 1.0
+
+
+def test_raw_costs_more_than_the_same_size_jpeg():
+    assert estimate_cost(True, 6000, 4000, None) == 3.0
+
+
+def test_cost_scales_with_megapixels():
+    assert estimate_cost(False, 12000, 8000, None) == 4.0
+    # Tiny images still cost a minimum of 1 MP
+    assert estimate_cost(False, 100, 100, None) == estimate_cost(False, 500, 500, None)
+
+
+def test_cost_falls_back_to_file_size_then_to_the_reference():
+    # 24 MP worth of RAW bytes
+    assert estimate_cost(True, None, None, int(24 * 1.25e6)) == 3.0
+    assert estimate_cost(False, None, None, int(48 * 0.4e6)) == 2.0
+    assert estimate_cost(False, None, None, None) == 1.0
+
+
+# ── Header parsing ──
+
+def test_parse_header_reads_dimensions_and_exif_from_a_prefix():
+    data = _jpeg(1200, 800)
+    meta, exif = parse_header("p1", data[:4096], "IMG_0001.JPG", len(data))
+
+    assert not meta.is_raw
+    assert (meta.width, meta.height) == (1200, 800)
+    assert meta.file_size == len(data)
+    assert meta.camera == "Canon EOS R5"
+    assert meta.captured_at == "2026:06:01 14:30:00"
+    assert exif["Make"] == "Canon"
+    assert meta.cost == estimate_cost(False, 1200, 800, len(data))
+
+
+def test_parse_header_survives_garbage():
+    meta, exif = parse_header("p1", b"\0" * 4096, "IMG_0001.CR3", 30_000_000)
+    assert meta.is_raw
+    assert meta.width is None and meta.height is None
+    assert exif == {}
+    # Unknown dimensions → estimated from the file size
+    assert meta.cost == estimate_cost(True, None, None, 30_000_000)
+
+
+def test_small_raw_header_dimensions_are_treated_as_a_thumbnail():
+    # TIFF-based RAW whose IFD0 is a 160x120 thumbnail
+    buf = io.BytesIO()
+    Image.new("RGB", (160, 120)).save(buf, "TIFF")
+    meta, _ = parse_header("p1", buf.getvalue(), "IMG_0001.NEF", 25_000_000)
+    assert meta.is_raw
+    assert meta.width is None and meta.height is None
+
+
+def test_record_round_trips():
+    meta = PhotoMeta("p1", True, 25_000_000, 6000, 4000, "2026:06:01 14:30:00", "Canon EOS R5")
+    record = meta.record
+    assert record["version"] == PREFLIGHT_VERSION
+    assert record["kind"] == "raw"
+    again = PhotoMeta.from_record("p1", record)
+    assert again.record == record
+
+
+# ── Processing order ──
+
+def _meta(photo_id: str, megapixels: float, taken: str | None = None, camera: str = "Canon EOS R5",
+          is_raw: bool = False) -> PhotoMeta:
+    width = int(megapixels * 1e6 / 4000)
+    return PhotoMeta(photo_id, is_raw, None, width, 4000, taken, camera)
+
+
+def _ids(photos: list[dict]) -> list[str]:
+    return [p["id"] for p in photos]
+
+
+def test_largest_work_goes_first():
+    metas = {
+        "small": _meta("small", 12),
+        "raw": _meta("raw", 24, is_raw=True),
+        "big": _meta("big", 48),
+    }
+    photos = [{"id": "small"}, {"id": "raw"}, {"id": "big"}]
+    assert _ids(order_for_processing(photos, metas)) == ["raw", "big", "small"]
+
+
+def test_bursts_stay_together_in_capture_order():
+    metas = {
+        "b1": _meta("b1", 12, "2026:06:01 14:30:00"),
+        "b2": _meta("b2", 48, "2026:06:01 14:30:01"),
+        "b3": _meta("b3", 12, "2026:06:01 14:30:02"),
+        "solo": _meta("solo", 24, "2026:06:01 15:00:00"),
+        # Same second, different camera — not part of the burst
+        "other": _meta("other", 24, "2026:06:01 14:30:01", camera="Sony A7"),
+    }
+    photos = [{"id": i} for i in ("solo", "b3", "other", "b1", "b2")]
+    # The burst ranks by its most expensive frame (48 MP)
+    assert _ids(order_for_processing(photos, metas)) == ["b1", "b2", "b3", "solo", "other"]
+
+
+def test_a_gap_longer_than_the_burst_window_splits_bursts():
+    metas = {
+        "a": _meta("a", 12, "2026:06:01 14:30:00"),
+        "b": _meta("b", 48, "2026:06:01 14:30:10"),
+    }
+    assert _ids(order_for_processing([{"id": "a"}, {"id": "b"}], metas)) == ["b", "a"]
+
+
+def test_photos_without_metadata_keep_their_order():
+    metas = {"known": _meta("known", 48)}
+    photos = [{"id": "x"}, {"id": "known"}, {"id": "y"}]
+    assert _ids(order_for_processing(photos, metas)) == ["known", "x", "y"]
+    assert photo_cost(metas, {"id": "x"}) == 1.0
@@ -0,0 +1,164 @@
+"""Streamed downloads — parallel range requests reassembled into one file."""
+import asyncio
+import os
+import re
+
+import httpx
+import pytest
+
+from app.config import AsyncSupabaseClient, SupabaseClient, _byte_ranges, get_settings
+
+OBJECT = os.urandom(1_000_003)
+
+
+@pytest.fixture(autouse=True)
+def storage_settings(monkeypatch):
+    s = get_settings()
+    monkeypatch.setattr(s, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(s, "storage_cache_max_bytes", 0)
+    monkeypatch.setattr(s, "storage_range_threshold_bytes", 64 * 1024)
+    monkeypatch.setattr(s, "storage_range_parts", 4)
+    monkeypatch.setattr(s, "storage_stream_chunk_bytes", 4096)
+
+
+class FakeStorage:
+    """Serves OBJECT with HEAD and Range support; records the requests it saw."""
+
+    def __init__(self, honour_ranges: bool = True, truncate: bool = False):
+        self.honour_ranges = honour_ranges
+        self.truncate = truncate
+        self.requests: list[tuple[str, str | None]] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        rng = request.headers.get("range")
+        self.requests.append((request.method, rng))
+        headers = {"accept-ranges": "bytes", "etag": '"v1"'}
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={**headers, "content-length": str(len(OBJECT))})
+        if rng and self.honour_ranges:
+            start, end = map(int, re.fullmatch(r"bytes=(\d+)-(\d+)", rng).groups())
+            end = min(end, len(OBJECT) - 1)
+            body = OBJECT[start:end + 1]
+            if self.truncate:
+                body = body[:-1]
+            headers["content-range"] = f"bytes {start}-{end}/{len(OBJECT)}"
+            return httpx.Response(206, headers=headers, content=body)
+        return httpx.Response(200, headers=headers, content=OBJECT)
+
+    @property
+    def ranges(self) -> list[str]:
+        return sorted(rng for method, rng in self.requests if method == "GET" and rng)
+
+
+def _sync_client(storage: FakeStorage) -> SupabaseClient:
+    client = SupabaseClient()
+    client._http_client = httpx.Client(transport=httpx.MockTransport(storage))
+    return client
+
+
+def _async_client(storage: FakeStorage) -> AsyncSupabaseClient:
+    client = AsyncSupabaseClient()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(storage))
+    return client
+
+
+def _read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ── Range planning ──
+
+@pytest.mark.parametrize("size, parts", [(1, 4), (10, 3), (1_000_003, 4), (1024, 4), (7, 8)])
+def test_byte_ranges_cover_the_object_exactly_once(size, parts):
+    ranges = _byte_ranges(size, parts)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == size - 1
+    assert len(ranges) <= parts
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+
+
+# ── Sync client ──
+
+def test_large_object_is_fetched_as_parallel_ranges(tmp_path):
+    storage = FakeStorage()
+    dest = tmp_path / "raw.dng"
+
+    assert _sync_client(storage).storage_download_to_file("photos", "a/raw.dng", str(dest))
+    assert _read(dest) == OBJECT
+    assert storage.ranges == sorted(f"bytes={s}-{e}" for s, e in _byte_ranges(len(OBJECT), 4))
+
+
+def test_small_object_is_one_stream(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "storage_range_threshold_bytes", 2 * len(OBJECT))
+    storage = FakeStorage()
+    dest = tmp_path / "raw.dng"
+
+    assert _sync_client(storage).storage_download_to_file("photos", "a/raw.dng", str(dest))
+    assert _read(dest) == OBJECT
+    assert storage.requests == [("HEAD", None), ("GET", None)]
+
+
+def test_ignored_ranges_fall_back_to_a_single_stream(tmp_path):
+    storage = FakeStorage(honour_ranges=False)
+    dest = tmp_path / "raw.dng"
+
+    assert _sync_client(storage).storage_download_to_file("photos", "a/raw.dng", str(dest))
+    assert _read(dest) == OBJECT
+    assert storage.requests[-1] == ("GET", None)
+
+
+def test_short_range_reads_are_retried_then_fall_back(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.storage.limiter.time.sleep", lambda delay: None)
+    storage = FakeStorage(truncate=True)
+    dest = tmp_path / "raw.dng"
+
+    assert _sync_client(storage).storage_download_to_file("photos", "a/raw.dng", str(dest))
+    assert _read(dest) == OBJECT
+    assert storage.requests[-1] == ("GET", None)
+
+
+def test_read_head_returns_the_prefix_and_total_size():
+    head, size = _sync_client(FakeStorage()).storage_read_head("photos", "a/raw.dng", 4096)
+    assert head == OBJECT[:4096]
+    assert size == len(OBJECT)
+
+
+def test_read_head_cuts_off_an_unranged_body():
+    head, size = _sync_client(FakeStorage(honour_ranges=False)).storage_read_head("photos", "a/raw.dng", 4096)
+    assert head == OBJECT[:4096]
+    assert size == len(OBJECT)
+
+
+# ── Async client ──
+
+def test_async_large_object_is_fetched_as_parallel_ranges(tmp_path):
+    storage = FakeStorage()
+    dest = tmp_path / "raw.dng"
+
+    async def download():
+        client = _async_client(storage)
+        try:
+            return await client.storage_download_to_file("photos", "a/raw.dng", str(dest))
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(download())
+    assert _read(dest) == OBJECT
+    assert len(storage.ranges) == 4
+
+
+def test_async_ignored_ranges_fall_back_to_a_single_stream(tmp_path):
+    storage = FakeStorage(honour_ranges=False)
+    dest = tmp_path / "raw.dng"
+
+    async def download():
+        client = _async_client(storage)
+        try:
+            return await client.storage_download_to_file("photos", "a/raw.dng", str(dest))
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(download())
+    assert _read(dest) == OBJECT
@@ -0,0 +1,222 @@
+"""FairScheduler — finish-tag ordering, per-photographer caps and cancellation."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.pipeline.cancellation import CancelToken, PipelineCancelled
+from app.pipeline.scheduler import FairScheduler, _Handoff
+
+
+def _wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _queue(scheduler: FairScheduler, tenant: str, name: str, order: list, weight: float = 1.0) -> threading.Thread:
+    """Start a thread that takes a slot, records `name` and hands the slot back."""
+    waiting = scheduler.stats()["waiting"]
+
+    def run():
+        scheduler.acquire(tenant, weight=weight)
+        order.append(name)
+        scheduler.release(tenant)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    # Queue requests one at a time so their tags are assigned in a known order
+    _wait_until(lambda: scheduler.stats()["waiting"] == waiting + 1)
+    return t
+
+
+def test_newcomer_is_served_before_a_busy_photographers_backlog():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1)
+    scheduler.acquire("big")
+    order: list[str] = []
+    threads = [
+        _queue(scheduler, "big", "big-2", order),
+        _queue(scheduler, "big", "big-3", order),
+        _queue(scheduler, "small", "small-1", order),
+    ]
+
+    scheduler.release("big")
+    for t in threads:
+        t.join(timeout=5)
+
+    assert order == ["small-1", "big-2", "big-3"]
+
+
+def test_heavier_weight_gets_a_larger_share():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1)
+    scheduler.acquire("holder")
+    order: list[str] = []
+    threads = []
+    for i in range(4):
+        threads.append(_queue(scheduler, "free", f"free-{i}", order))
+        threads.append(_queue(scheduler, "studio", f"studio-{i}", order, weight=2.0))
+
+    scheduler.release("holder")
+    for t in threads:
+        t.join(timeout=5)
+
+    # Twice the weight → twice the windows in the first half
+    first_half = order[:6]
+    assert sum(name.startswith("studio") for name in first_half) == 4
+    assert sum(name.startswith("free") for name in first_half) == 2
+
+
+def test_per_photographer_cap_leaves_slots_for_others():
+    scheduler = FairScheduler(slots=2, max_per_tenant=1)
+    scheduler.acquire("a")
+    order: list[str] = []
+    blocked = _queue(scheduler, "a", "a-2", order)
+
+    # A slot is free, but "a" is at its cap — another photographer gets it
+    scheduler.acquire("b")
+    assert scheduler.stats()["running_by_photographer"] == {"a": 1, "b": 1}
+    assert order == []
+
+    scheduler.release("a")
+    blocked.join(timeout=5)
+    assert order == ["a-2"]
+    scheduler.release("b")
+    assert scheduler.stats()["in_use"] == 0
+
+
+def test_cancelled_waiter_gives_up_without_a_slot():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1)
+    scheduler.acquire("a")
+    token = CancelToken()
+    errors: list[BaseException] = []
+
+    def wait():
+        try:
+            scheduler.acquire("b", cancel=token)
+        except PipelineCancelled as e:
+            errors.append(e)
+
+    t = threading.Thread(target=wait, daemon=True)
+    t.start()
+    _wait_until(lambda: scheduler.stats()["waiting"] == 1)
+    token.cancel()
+    t.join(timeout=5)
+
+    assert len(errors) == 1
+    stats = scheduler.stats()
+    assert stats["waiting"] == 0
+    assert stats["running_by_photographer"] == {"a": 1}
+
+
+def test_cancelled_slot_task_does_not_leak_the_slot():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1)
+    scheduler.acquire("a")
+
+    async def run():
+        entered = []
+
+        async def window():
+            async with scheduler.slot("b"):
+                entered.append("b")
+
+        task = asyncio.create_task(window())
+        await asyncio.to_thread(_wait_until, lambda: scheduler.stats()["waiting"] == 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert entered == []
+
+    asyncio.run(run())
+    assert scheduler.stats()["waiting"] == 0
+    scheduler.release("a")
+    assert scheduler.stats()["in_use"] == 0
+
+
+def test_slot_granted_after_the_caller_gave_up_is_given_back():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1)
+    handoff = _Handoff()
+    handoff.abandoned = True
+
+    # The slot is free, so the thread is granted it — after the caller left
+    scheduler._acquire("b", 1.0, 1.0, None, handoff)
+    assert not handoff.granted
+    assert scheduler.stats()["in_use"] == 0
+
+
+def test_cancelled_interactive_wait_frees_its_place():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1, interactive_slots=1)
+    scheduler.acquire_interactive()
+
+    async def run():
+        async def click():
+            async with scheduler.interactive():
+                pass
+
+        task = asyncio.create_task(click())
+        await asyncio.to_thread(_wait_until, lambda: scheduler.stats()["interactive_waiting"] == 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert scheduler.stats()["interactive_waiting"] == 0
+    scheduler.release_interactive()
+    assert scheduler.stats()["interactive_active"] == 0
+    assert not scheduler.interactive_busy
+
+
+def test_interactive_work_holds_back_new_batch_windows():
+    scheduler = FairScheduler(slots=2, max_per_tenant=1, interactive_yield_max_s=5.0)
+    scheduler.acquire_interactive()
+    order: list[str] = []
+    batch = _queue(scheduler, "a", "a-1", order)
+
+    time.sleep(0.05)
+    assert order == []
+
+    scheduler.release_interactive()
+    batch.join(timeout=5)
+    assert order == ["a-1"]
+
+
+def test_interactive_hold_expires():
+    scheduler = FairScheduler(slots=1, max_per_tenant=1, interactive_yield_max_s=0.05)
+    scheduler.acquire_interactive()
+    order: list[str] = []
+    batch = _queue(scheduler, "a", "a-1", order)
+
+    # The re-check every 0.5s grants the window once the hold has run out
+    batch.join(timeout=5)
+    assert order == ["a-1"]
+    scheduler.release_interactive()
+
+
+@pytest.mark.parametrize("slots", [1, 3])
+def test_never_grants_more_than_the_slot_count(slots):
+    scheduler = FairScheduler(slots=slots, max_per_tenant=slots)
+    peak = 0
+    running = 0
+    lock = threading.Lock()
+
+    def work(tenant: str):
+        nonlocal peak, running
+        for _ in range(5):
+            scheduler.acquire(tenant)
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.001)
+            with lock:
+                running -= 1
+            scheduler.release(tenant)
+
+    threads = [threading.Thread(target=work, args=(f"t{i % 3}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+
+    assert peak <= slots
+    assert scheduler.stats()["in_use"] == 0
@@ -0,0 +1,118 @@
+"""Write-behind buffer — per-row values, one update_rows call per batch."""
+import json
+
+import httpx
+import pytest
+
+from app.config import SupabaseClient, get_settings
+from app.storage import write_buffer
+from app.storage.backends import MemoryTableStore
+from app.storage.write_buffer import WriteBehindBuffer
+
+
+class RecordingStore(MemoryTableStore):
+    """Memory table store that counts calls and can fail bulk updates."""
+
+    def __init__(self, seed=None, fail_bulk: bool = False):
+        super().__init__(seed)
+        self.fail_bulk = fail_bulk
+        self.calls: list[tuple[str, int]] = []
+
+    def update_rows(self, table, rows):
+        self.calls.append(("update_rows", len(rows)))
+        if self.fail_bulk:
+            raise httpx.HTTPError("update_rows failed")
+        return super().update_rows(table, rows)
+
+    def update(self, table, data_or_id, data_or_filters=None):
+        self.calls.append(("update", 1))
+        return super().update(table, data_or_id, data_or_filters)
+
+
+def _photos(n: int) -> list[dict]:
+    return [{"id": f"p{i:02d}", "gallery_id": "g1", "filename": f"IMG_{i:02d}.jpg", "status": "uploaded"} for i in range(n)]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = RecordingStore({"photos": _photos(20)})
+    monkeypatch.setattr(write_buffer, "get_supabase", lambda: store)
+    return store
+
+
+def _row(store: MemoryTableStore, photo_id: str) -> dict | None:
+    return store.select_single("photos", filters={"id": photo_id})
+
+
+def test_unique_per_photo_fields_go_out_in_one_request(store):
+    buf = WriteBehindBuffer("photos", batch_size=200, concurrency=4)
+    for i in range(20):
+        buf.update(f"p{i:02d}", {"checkpoint": {"done": i}, "quality_score": i / 20, "web_key": f"web/{i}.jpg"})
+
+    assert buf.flush() == 20
+    assert store.calls == [("update_rows", 20)]
+    assert _row(store, "p07")["web_key"] == "web/7.jpg"
+    assert _row(store, "p07")["checkpoint"] == {"done": 7}
+
+
+def test_batches_are_capped_at_batch_size(store):
+    buf = WriteBehindBuffer("photos", batch_size=8, concurrency=2)
+    for i in range(20):
+        buf.update(f"p{i:02d}", {"quality_score": i})
+
+    buf.flush()
+    assert sorted(n for _, n in store.calls) == [4, 8, 8]
+
+
+def test_updates_merge_and_leave_other_columns_alone(store):
+    buf = WriteBehindBuffer("photos")
+    buf.update("p01", {"status": "processing"})
+    buf.update("p01", {"status": "edited", "web_key": "web/1.jpg"})
+
+    assert buf.flush() == 1
+    row = _row(store, "p01")
+    assert row["status"] == "edited"
+    assert row["web_key"] == "web/1.jpg"
+    assert row["filename"] == "IMG_01.jpg"
+    assert buf.flush() == 0
+
+
+def test_deleted_rows_are_not_reinserted(store):
+    buf = WriteBehindBuffer("photos")
+    buf.update("gone", {"status": "edited"})
+    buf.update("p02", {"status": "edited"})
+
+    buf.flush()
+    assert _row(store, "gone") is None
+    assert _row(store, "p02")["status"] == "edited"
+
+
+def test_failed_batch_is_retried_row_by_row(monkeypatch):
+    store = RecordingStore({"photos": _photos(3)}, fail_bulk=True)
+    monkeypatch.setattr(write_buffer, "get_supabase", lambda: store)
+    buf = WriteBehindBuffer("photos")
+    for i in range(3):
+        buf.update(f"p{i:02d}", {"quality_score": i})
+
+    assert buf.flush() == 3
+    assert store.calls == [("update_rows", 3)] + [("update", 1)] * 3
+    assert _row(store, "p02")["quality_score"] == 2
+
+
+def test_client_calls_the_update_rows_function(monkeypatch):
+    monkeypatch.setattr(get_settings(), "supabase_url", "http://supabase.test")
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json=len(json.loads(request.content)["rows"]))
+
+    sb = SupabaseClient()
+    sb._http_client = httpx.Client(transport=httpx.MockTransport(handler))
+    rows = [{"id": "p1", "fields": {"quality_score": 0.5}}, {"id": "p2", "fields": {"web_key": "web/2.jpg"}}]
+
+    assert sb.update_rows("photos", rows) == 2
+    assert len(seen) == 1
+    assert seen[0].method == "POST"
+    assert seen[0].url.path == "/rest/v1/rpc/update_rows"
+    assert json.loads(seen[0].content) == {"target_table": "photos", "rows": rows}
@@ -0,0 +1,36 @@
+-- Per-row bulk UPDATE for the AI engine's write-behind buffer.
+-- `rows` is a JSON array of {"id": <uuid>, "fields": {<column>: <value>, ...}}.
+-- Each row gets its own values in a single statement; columns absent from a
+-- row's "fields" keep their current value. Never inserts — ids that no longer
+-- exist are skipped. Runs as the caller, so RLS still applies.
+CREATE OR REPLACE FUNCTION update_rows(target_table TEXT, rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  cols TEXT;
+  new_cols TEXT;
+  updated INTEGER;
+BEGIN
+  SELECT
+    string_agg(format('%I', attname), ', ' ORDER BY attnum),
+    string_agg(format('n.%I', attname), ', ' ORDER BY attnum)
+  INTO cols, new_cols
+  FROM pg_attribute
+  WHERE attrelid = format('public.%I', target_table)::regclass
+    AND attnum > 0
+    AND NOT attisdropped
+    AND attname <> 'id'
+    AND attgenerated = ''
+    AND attidentity <> 'a';
+
+  EXECUTE format(
+    'UPDATE public.%I AS t
+        SET (%s) = (SELECT %s FROM jsonb_populate_record(t, r.fields) AS n)
+       FROM jsonb_to_recordset($1) AS r(id UUID, fields JSONB)
+      WHERE t.id = r.id',
+    target_table, cols, new_cols
+  ) USING rows;
+
+  GET DIAGNOSTICS updated = ROW_COUNT;
+  RETURN updated;
+END;
+$$ LANGUAGE plpgsql;